@@ -1,21 +1,17 @@
 from __future__ import annotations
 
-import sys
-import subprocess
-import time
-import os
-import tempfile
 import numpy as np
 from pathlib import Path
 
 import PySignalFlow as psf
 
-from Utils.sharedmem_handler import SharedMemSender
-from BasebandPlotter.BasebandPlotter_plotter import BasebandDataFrame
+from Utils.plot_node_base import PlotNodeBase
+from Utils.iq_kernels import iq_magnitude
+from BasebandPlotter.baseband_types import BasebandDataFrame
 
 from Utils.semantics import *
 
-class BasebandPlotter:
+class BasebandPlotter(PlotNodeBase):
     def __init__(self, *_):
         self.initialized = False
 
@@ -35,6 +31,7 @@ class BasebandPlotter:
             if section not in params:
                 continue
             curr_sec = params[section]
+            self.set_transport_parameters(curr_sec)
 
             if "FPS" in curr_sec:
                 self.fps = float(np.array(curr_sec["FPS"])[0])
@@ -71,29 +68,13 @@ class BasebandPlotter:
                 
     def buildup(self):
 
-        self.shm_blocksize = 1_000_000 # change later to a more dynamic size
         self.shm_numblocks = 20 # to be able to keep up with high fps
 
-        self.sharedmem_sender = SharedMemSender(self.shm_blocksize, self.shm_numblocks, verbose=True)
-
-        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
-        self.close_path = closesig_file.name
-        closesig_file.close()
-
-        # start plotting process
-        worker_script = str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py")
-        self.plotting_process = subprocess.Popen([
-            sys.executable,  # Use the same Python executable
-            worker_script,
-            self.sharedmem_sender.sharedmem.name,
-            f"{self.shm_blocksize}",
-            f"{self.shm_numblocks}",
-            self.close_path
-        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
-
-        for line in self.plotting_process.stdout:
-            if line.strip() == "PLOTTING_PROCESS_READY":
-                break
+        # the transport is sized from the first frame
+        self.prepare_plotting_process(str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py"),
+                                      "BasebandPlotter.BasebandPlotter_plotter:BasebandPlotter")
+
+    def make_setup(self):
             
         param_dict = {
             "fps" : self.fps,
@@ -114,83 +95,72 @@ class BasebandPlotter:
             if self.y_lim_vec.size == 2:
                 param_dict["y_lim_vec"] = self.y_lim_vec
 
-        self.send_data(param_dict)
-
-    def send_data(self, data):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.send_data(data): # busy wait for max speed for huge playback files
-            if time.time() - now > max_wait:
-                print("Shared memory sender timed out, exiting process")
-                self.teardown()
-                return
-
-    def teardown(self):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.are_all_read():
-            time.sleep(0.1)
-            if time.time() - now > max_wait:
-                break
-
-        if os.path.exists(self.close_path):
-            os.remove(self.close_path)
-        self.sharedmem_sender.cleanup()
+        return param_dict
 
-    def process(self, sf):
+    @staticmethod
+    def frame_tx(frame):
+        return int(np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RADAR_TRXMASK])[0][1])
 
-        # Exit if plotting subprocess has closed
-        if self.plotting_process.poll() is not None:
-            return None, psf.ProcessResult.EndOfData
+    def extract_baseband_data(self, frame, slot=0):
         
-        if not self.sharedmem_sender.check_buff_exists():
-            return None, psf.ProcessResult.EndOfData
-
-        for i in range(len(sf)):
-            frame = sf[i]
-            
-            trx_mask = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RADAR_TRXMASK])[0]
-
-            chipnum, txactive, rxmask = trx_mask
-
-            # determine type
-            data = None
-            iscomplex = False
-            if ARRAY_SEMANTIC_BBIQ_FLOAT32 in frame[SIGNAL_SEMANTIC_RADAR_X7]:
-                data = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_BBIQ_FLOAT32])
-                iscomplex = True
-            elif ARRAY_SEMANTIC_RF_FLOAT32 in frame[SIGNAL_SEMANTIC_RADAR_X7]:
-                data = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RF_FLOAT32])
+        trx_mask = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RADAR_TRXMASK])[0]
+
+        chipnum, txactive, rxmask = trx_mask
+
+        # determine type
+        data = None
+        iscomplex = False
+        if ARRAY_SEMANTIC_BBIQ_FLOAT32 in frame[SIGNAL_SEMANTIC_RADAR_X7]:
+            data = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_BBIQ_FLOAT32])
+            iscomplex = True
+        elif ARRAY_SEMANTIC_RF_FLOAT32 in frame[SIGNAL_SEMANTIC_RADAR_X7]:
+            data = np.asarray(frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RF_FLOAT32])
+        else:
+            raise RuntimeError("There is no data in the radar frame.")
+
+        magnitude = None
+        if iscomplex:
+            # all RX at once, [rx, I/Q, bin] -> [rx, bin]
+            magnitude = iq_magnitude(data[:, 0, :], data[:, 1, :],
+                                     out=self.frame_buffer(slot, "magnitude", (data.shape[0], data.shape[2])))
+
+        # construct output dict
+        # (chipnum, txactive, rxactive) -> data
+        out_dict = {}
+        for rx in [1, 2]:
+
+            rx_active = None
+
+            if rxmask & rx:
+                rx_active = rx-1
             else:
-                raise RuntimeError("There is no data in the radar frame.")
+                continue
 
-            # construct output dict
-            # (chipnum, txactive, rxactive) -> data
-            out_dict = {}
-            for rx in [1, 2]:
+            if iscomplex:
+                out_dict[(chipnum, txactive, rx_active)] = magnitude[rx_active]
+            else:
+                print("IF data plotting not supported")
+        
+        bbframe = BasebandDataFrame(
+            power_data_dict=out_dict,
+            db_data_dict={},
+            trx_vec=trx_mask,
+            timestamp=frame.timestamp,
+            seq_num=frame.sequence_number
+        )
 
-                rx_active = None
+        return bbframe
 
-                if rxmask & rx:
-                    rx_active = rx-1
-                else:
-                    continue
+    def process(self, sf):
 
-                if iscomplex:
-                    out_dict[(chipnum, txactive, rx_active)] = \
-                        np.abs(data[rx_active, 0, :] + 1j * data[rx_active, 1, :])
-                else:
-                    print("IF data plotting not supported")
-            
-            bbframe = BasebandDataFrame(
-                power_data_dict=out_dict,
-                db_data_dict={},
-                trx_vec=trx_mask,
-                timestamp=frame.timestamp,
-                seq_num=frame.sequence_number
-            )
+        # Exit if plotting subprocess has closed
+        if self.plotting_closed():
+            return None, psf.ProcessResult.EndOfData
 
-            self.send_data(bbframe)
+        # one frame per display interval and TX, the plot shows every TX
+        frames = self.limit_plot_rate([sf[i] for i in range(len(sf))], key=self.frame_tx)
 
+        batch = self.map_frames(self.extract_baseband_data, frames)
+        self.send_batch(batch)
 
         return None, psf.ProcessResult.Continue
\ No newline at end of file
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import time
 import numpy as np
-from dataclasses import dataclass
 from pathlib import Path
 
 import os
@@ -15,22 +14,14 @@ from pyqtgraph.Qt.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QApplication, QCheckBox
     )
-from pyqtgraph.Qt.QtGui import QDoubleValidator, QIntValidator, QIcon, QImage, QPalette, QColor
+from pyqtgraph.Qt.QtGui import QDoubleValidator, QRegularExpressionValidator, QIcon, QImage, QPalette, QColor
 import pyqtgraph.Qt.QtCore as QtCore
 
 from BasebandPlotter.xy_plot_widget import XY2DPlotWidget
 
 from BasebandPlotter.generatedBasebandUI import Ui_BasebandUIwin
-
-ALL_TX_OFF = 2**16-1
-
-@dataclass
-class BasebandDataFrame:
-    power_data_dict: dict[(int, int, int), np.ndarray]
-    db_data_dict: dict[(int, int, int), np.ndarray]
-    trx_vec: np.ndarray
-    timestamp: int
-    seq_num: int
+from BasebandPlotter.baseband_types import ALL_TX_OFF, BasebandDataFrame
+from Utils.frame_history import FrameHistory, DEFAULT_HISTORY_BYTES, SEEK_PATTERN, SEEK_HELP, seek_frame
 
 class KeyPressFilter(QtCore.QObject):
     def __init__(self, callback):
@@ -61,10 +52,11 @@ class PlotMainWin(QMainWindow, Ui_BasebandUIwin):
 
 class BasebandPlotter:
 
-    def __init__(self, shm_on_exit=None):
+    def __init__(self, shm_on_exit=None, hosted=False):
         self.plot = None
         self.plot_linear_scale: bool = False
         self.shm_on_exit = shm_on_exit
+        self.hosted = hosted # other plotters share the process, closing must not end it
         
         self.app = None
         self.initialized = False
@@ -75,6 +67,8 @@ class BasebandPlotter:
         self.num_saved_frames = -1
 
         self.paused = False
+        self.info_text = "" # set_label_info() text, render stats go below it
+        self.render_stats = ""
 
         self.curr_data_frame_inx = 0
         self.curr_label_frame_max = 0
@@ -96,11 +90,6 @@ class BasebandPlotter:
         self.yaxis_name_unit: str = "dB"
         self.yaxis_name_lin_unit: str = "lin"
 
-        self.skip_n_frames = 0
-        self.skip_n_counter = 0
-        self.skip_all_to_draw = []
-        self.skip_curr_drawn = []
-
         self.rx_plot_colors = [ "#C94848", "#43A343" ]
 
         self.frame_received_counter = 0
@@ -108,9 +97,14 @@ class BasebandPlotter:
 
         self.curr_bbif_data: BasebandDataFrame = None
 
-        # timestamp received : RDRawPlotData
-        self.bbif_plot_data_buffer: list[BasebandDataFrame] = []
-        self.per_plot_data_reg: dict[(int, int), BasebandDataFrame] = {}
+        # received BasebandDataFrame frames, oldest first
+        self.history = FrameHistory(DEFAULT_HISTORY_BYTES, self.num_saved_frames)
+        self.drawn_frame_id = None
+        self.evicted_seen = 0
+        # (chipnum, txactive) -> frame_id of the frame last drawn in that plot
+        self.per_plot_data_reg: dict[(int, int), int] = {}
+        # (chipnum, txactive) -> frame_id of the newest frame for that plot not drawn yet
+        self.pending_plot_frames: dict[(int, int), int] = {}
 
         # (chipnum, txactive) -> plot widget
         self.plot_dict: dict[(int, int), XY2DPlotWidget] = {}
@@ -125,7 +119,7 @@ class BasebandPlotter:
 
     def init_window(self):
         if self.app is None:
-            self.app = QApplication([])
+            self.app = QApplication.instance() or QApplication([])
         if self.mainwin is not None:
             return
         
@@ -187,7 +181,8 @@ class BasebandPlotter:
         self.mainwin.powerMinLEdit.setValidator(doubleValid)
         self.mainwin.powerMaxLEdit.setValidator(doubleValid)
 
-        self.mainwin.currFrameLEdit.setValidator(QIntValidator(1, 1_000_000_000))
+        self.mainwin.currFrameLEdit.setValidator(QRegularExpressionValidator(QtCore.QRegularExpression(SEEK_PATTERN)))
+        self.mainwin.currFrameLEdit.setToolTip(SEEK_HELP)
 
         screen_size = self.app.primaryScreen().size()
         best_ar = 20/10
@@ -205,10 +200,12 @@ class BasebandPlotter:
         self.plot_linear_scale = self.mainwin.linearScaleCheckbox.isChecked()
 
         # might seem like spaghetti, but it actually works,
-        # in draw_data_frame it will set self.per_plot_data_reg[txrx] = frame,
-        # txrx is this txrx and frame is this frame, so no change
-        for chiptx, data in self.per_plot_data_reg.items():
-            self.draw_data_frame(data)
+        # in draw_data_frame it will set self.per_plot_data_reg[txrx] = frame_id,
+        # txrx is this txrx and frame_id is this frame_id, so no change
+        for chiptx, frame_id in list(self.per_plot_data_reg.items()):
+            index = self.history.index_of(frame_id)
+            if index is not None: # not overwritten by newer frames yet
+                self.draw_buffered_frame(index)
 
         if self.plot_linear_scale:
             for plot in self.plot_dict.values():
@@ -224,11 +221,11 @@ class BasebandPlotter:
         
         self.mainwin.currFrameLEdit
         
-        curr_frame = int(self.mainwin.currFrameLEdit.text()) - 1
-        if 0 <= curr_frame < len(self.bbif_plot_data_buffer):
+        curr_frame = seek_frame(self.mainwin.currFrameLEdit.text(), self.history.seek, self.first_timestamp)
+        if curr_frame is not None and 0 <= curr_frame < len(self.history):
             self.paused = True
             self.curr_data_frame_inx = curr_frame
-            self.draw_data_frame(self.bbif_plot_data_buffer[self.curr_data_frame_inx])
+            self.draw_buffered_frame(self.curr_data_frame_inx)
         else:
             self.mainwin.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
@@ -236,8 +233,8 @@ class BasebandPlotter:
         if self.first_timestamp is None or not self.initialized:
             return
 
-        curr_frame_ts = self.bbif_plot_data_buffer[self.curr_data_frame_inx].timestamp
-        curr_frame_seq = self.bbif_plot_data_buffer[self.curr_data_frame_inx].seq_num
+        curr_frame_ts = self.history.timestamp(self.curr_data_frame_inx)
+        curr_frame_seq = self.history.seq_num(self.curr_data_frame_inx)
         timetxt = time.strftime('%Y.%m.%d %H:%M:%S', time.localtime(curr_frame_ts/1000))
         rel_time_txt = (curr_frame_ts - self.first_timestamp)/1000
         self.mainwin.seqNumTimeLabel.setText(
@@ -262,10 +259,9 @@ class BasebandPlotter:
         fps = self.first_setup_dict["fps"]
         is_dcremoval = self.first_setup_dict.get("enable_dc_removal", False)
 
-        self.mainwin.infoParamLabel.setText(
-            f"FPS: {fps}"
-            f"\nDC Removal: {'Enabled' if is_dcremoval else 'Disabled'}"
-            )
+        self.info_text = (f"FPS: {fps}"
+            f"\nDC Removal: {'Enabled' if is_dcremoval else 'Disabled'}")
+        self.mainwin.infoParamLabel.setText(self.info_text + self.render_stats)
 
         is_live = self.first_setup_dict["is_live"]
 
@@ -280,6 +276,12 @@ class BasebandPlotter:
         """)
         self.mainwin.liveOrPlaybackLabel.setText(liveplay_text)
             
+    def show_render_stats(self, text: str):
+        """Redraw pacing stats from ShmPlotPump, shown under the info text"""
+        self.render_stats = f"\n{text}"
+        if self.info_text:
+            self.mainwin.infoParamLabel.setText(self.info_text + self.render_stats)
+
     def set_label_curr_frame(self):
         self.mainwin.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
         self.mainwin.totalNumFramesBuffLabel.setText(f"/ {self.curr_label_frame_max}")
@@ -327,17 +329,17 @@ class BasebandPlotter:
         return False
 
     def move_frame(self, direction: int):
-        if not self.initialized or len(self.bbif_plot_data_buffer) <= 1:
+        if not self.initialized or len(self.history) <= 1:
             return
         self.paused = True
 
         self.curr_data_frame_inx += direction
         if self.curr_data_frame_inx < 0:
             self.curr_data_frame_inx = 0
-        elif self.curr_data_frame_inx >= len(self.bbif_plot_data_buffer):
-            self.curr_data_frame_inx = len(self.bbif_plot_data_buffer) - 1
+        elif self.curr_data_frame_inx >= len(self.history):
+            self.curr_data_frame_inx = len(self.history) - 1
 
-        self.draw_data_frame(self.bbif_plot_data_buffer[self.curr_data_frame_inx])
+        self.draw_buffered_frame(self.curr_data_frame_inx)
         self.mainwin.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
     def toggle_pause(self):
@@ -354,7 +356,9 @@ class BasebandPlotter:
     def exit(self):
         if self.shm_on_exit is not None:
             self.shm_on_exit()
-        pg.exit()
+        self.history.close() # the spill file, the host process may live on
+        if not self.hosted:
+            pg.exit()
     
     def plot_or_make_new(self, txrx_key: tuple[int, int, int]):
         # txrx: (chipnum, txactive, rxactive)
@@ -387,7 +391,19 @@ class BasebandPlotter:
 
         return new_plot
 
-    def receive_data(self, data: dict | BasebandDataFrame):
+    @staticmethod
+    def collapse_key(frame: BasebandDataFrame) -> tuple:
+        """Plots a frame goes to, ShmPlotPump keeps the newest live frame of each"""
+        return tuple(sorted({txrx[:2] for txrx in frame.power_data_dict}))
+
+    def receive_data(self, data: dict | BasebandDataFrame | list):
+
+        # batch of frames from send_batch()
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
+
         # (chipnum, txactive, rxactive) -> data
 
         # setup
@@ -397,75 +413,61 @@ class BasebandPlotter:
                 self.first_setup_dict = data
                 self.set_label_info()
                 if "num_saved_frames" in data:
+                    # < 0 leaves only the MaxBufferedBytes cap
                     self.num_saved_frames = data["num_saved_frames"]
-                    if self.num_saved_frames < 0:
-                        self.num_saved_frames = 100_000
-                    elif self.num_saved_frames < 1:
+                    if self.num_saved_frames == 0:
                         self.num_saved_frames = 1
-                
-                if "fps" in data:
-                    self.skip_n_counter = int(data["fps"] / 50)
+                self.history.configure(data, self.num_saved_frames)
+
 
                 return
         
         if self.first_timestamp is None:
             self.first_timestamp = data.timestamp
 
-        self.bbif_plot_data_buffer.append(data)
+        self.history.append(data)
         self.frame_received_counter += 1
 
-        # logic for skipping frames to draw, to keep up with live data
-        # make sure to draw all TX and then skip some frames
-
-        lasttx = data.trx_vec[1] # if this is a new tx, add it to the list of all to draw
-        if lasttx not in self.skip_all_to_draw:
-            self.skip_all_to_draw.append(lasttx)
-        
-        if len(self.skip_all_to_draw) == len(self.skip_curr_drawn) and self.skip_n_frames > 0:
-            if self.skip_n_counter >= self.skip_n_frames:
-                self.skip_n_counter = 0
-                self.skip_curr_drawn.clear()
-            else:
-                self.skip_n_counter += 1
-                return
-
-        if lasttx not in self.skip_curr_drawn:
-            self.skip_curr_drawn.append(lasttx)
+        # live frames are already thinned out per TX by the node, see PlotMaxRate,
+        # each TX plot draws its newest one on the next update()
+        frame_id = self.history.frame_id(-1)
+        for txrx in data.power_data_dict:
+            self.pending_plot_frames[txrx[:2]] = frame_id
 
-        if not self.paused:
-            self.curr_data_frame_inx = len(self.bbif_plot_data_buffer) - 1
-            if self.curr_bbif_data is self.bbif_plot_data_buffer[self.curr_data_frame_inx]:
-                return
-            self.draw_data_frame(self.bbif_plot_data_buffer[self.curr_data_frame_inx])
+    def update(self):
+        if not len(self.history):
+            return
 
         if not self.initialized:
             self.initialize_axes()
 
-    def update(self):
-        if not len(self.bbif_plot_data_buffer):
-            return
-        
-        fps = self.first_setup_dict.get("fps", 20)
-
-        # Limit the buffer size to avoid memory issues
-        if len(self.bbif_plot_data_buffer) > self.num_saved_frames + fps*5:
-            oldlen = len(self.bbif_plot_data_buffer)
-            self.bbif_plot_data_buffer = self.bbif_plot_data_buffer[-self.num_saved_frames:]
-            num_removed = oldlen - len(self.bbif_plot_data_buffer)
+        # frames the history overwrote since the last update
+        num_removed = self.history.evicted - self.evicted_seen
+        if num_removed:
+            self.evicted_seen = self.history.evicted
             self.frame_dropped_counter += num_removed
-            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.bbif_plot_data_buffer)-1)
+            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.history)-1)
             self.set_label_curr_frame()
+
+        if not self.paused and self.pending_plot_frames:
+            self.curr_data_frame_inx = len(self.history) - 1
+            # oldest first, so the newest frame is the one drawn last
+            for frame_id in sorted(set(self.pending_plot_frames.values())):
+                index = self.history.index_of(frame_id)
+                if index is not None and self.drawn_frame_id != frame_id:
+                    self.draw_buffered_frame(index)
+            self.pending_plot_frames.clear()
         
-        if self.curr_label_frame_max != len(self.bbif_plot_data_buffer):
-            self.curr_label_frame_max = len(self.bbif_plot_data_buffer)
+        if self.curr_label_frame_max != len(self.history):
+            self.curr_label_frame_max = len(self.history)
             self.set_label_curr_frame()
 
     def initialize_axes(self):
 
-        if not len(self.bbif_plot_data_buffer) or self.first_setup_dict is None:
+        if not len(self.history) or self.first_setup_dict is None:
             return
         
-        first_data = self.bbif_plot_data_buffer[0].power_data_dict
+        first_data = self.history[0].power_data_dict
 
         first_rx_data = first_data.values().__iter__().__next__()
 
@@ -503,6 +505,10 @@ class BasebandPlotter:
 
         self.init_lims_lineedit()
 
+    def draw_buffered_frame(self, index: int):
+        self.drawn_frame_id = self.history.frame_id(index)
+        self.draw_data_frame(self.history[index])
+
     def draw_data_frame(self, frame: BasebandDataFrame):
         if not self.initialized:
             self.initialize_axes()
@@ -521,7 +527,7 @@ class BasebandPlotter:
 
             plot = self.plot_or_make_new(txrx)
             # rx is the key, in this class we handle the tx
-            self.per_plot_data_reg[txrx[:2]] = frame
+            self.per_plot_data_reg[txrx[:2]] = self.drawn_frame_id
             plot.plot_or_update_data(
                 identifier=txrx[2],
                 x_data=self.x_axis_vals,
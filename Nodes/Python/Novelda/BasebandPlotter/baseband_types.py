@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+
+# Frame types shared by the node and the plotter, kept free of Qt so the
+# SignalFlow process does not load it
+
+ALL_TX_OFF = 2**16-1
+
+@dataclass
+class BasebandDataFrame:
+    power_data_dict: dict[(int, int, int), np.ndarray]
+    db_data_dict: dict[(int, int, int), np.ndarray]
+    trx_vec: np.ndarray
+    timestamp: int
+    seq_num: int
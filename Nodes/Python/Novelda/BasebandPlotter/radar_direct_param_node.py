@@ -1,15 +1,39 @@
 from __future__ import annotations
 
 import numpy as np
+from collections import deque
 
 import PySignalFlow as psf
 
 from Utils.semantics import *
 
+MAX_PENDING_FRAMES = 8 # frames of earlier batches still to forward, the oldest are dropped past this
+
 class RadarDirectParamNode:
+    """
+    Forwards the radar frames with the RadarDirectParameters signal attached
+    to every one. The signal is only rebuilt when the parameters change.
+
+    process() returns one frame dict per call. That is the only output the
+    flow is known to take. The other frames of a batch are queued and
+    forwarded oldest first on the next calls, at most MAX_PENDING_FRAMES of
+    them, the rest are dropped and counted.
+
+    The frame returned for the current batch holds views on the incoming
+    radar arrays, no copy. They are only valid until the next process() call,
+    consumers that keep a frame must copy its arrays. Queued frames outlive
+    their batch and are copied.
+    """
     def __init__(self, *_):
 
         self.sent_parameters = False
+        self.pending = deque()
+        self.frames_dropped = 0
+
+        self.range_offset = 0.0
+        self.bin_length = 0.0
+        self.range_decimation = 1
+        self.param_signal = None
 
     def set_parameters(self, context, params, sections):
         for section in sections:
@@ -23,42 +47,69 @@ class RadarDirectParamNode:
                 self.bin_length = float(np.array(curr_sec["BinLength"])[0])
             if "RangeDecimation" in curr_sec:
                 self.range_decimation = int(np.array(curr_sec["RangeDecimation"])[0])
-                
+
+        self.update_param_signal()
+
+    def update_param_signal(self):
+        param_signal = {
+            ARRSEM_BIN_LENGTH: np.array([self.bin_length], dtype=np.float32),
+            ARRSEM_RANGE_OFFSET: np.array([self.range_offset], dtype=np.float32),
+            ARRSEM_RANGE_DECIMATION: np.array([self.range_decimation], dtype=np.int32),
+        }
+        if self.param_signal is None or any(
+                not np.array_equal(param_signal[key], self.param_signal[key]) for key in param_signal):
+            self.param_signal = param_signal
+
     def buildup(self):
-        pass
+        self.update_param_signal()
 
     def teardown(self):
         pass
 
-    def process(self, sf):
+    def forward_frame(self, frame, copy=False):
 
-        timestamp = sf[0].timestamp
-        sequence_number = sf[0].sequence_number
+        radar_signal = frame[SIGNAL_SEMANTIC_RADAR_X7]
 
         data_arrsem = None
 
-        if ARRAY_SEMANTIC_BBIQ_FLOAT32 in sf[0][SIGNAL_SEMANTIC_RADAR_X7]:
+        if ARRAY_SEMANTIC_BBIQ_FLOAT32 in radar_signal:
             data_arrsem = ARRAY_SEMANTIC_BBIQ_FLOAT32
-        elif ARRAY_SEMANTIC_RF_FLOAT32 in sf[0][SIGNAL_SEMANTIC_RADAR_X7]:
+        elif ARRAY_SEMANTIC_RF_FLOAT32 in radar_signal:
             data_arrsem = ARRAY_SEMANTIC_RF_FLOAT32
 
+        # views on the incoming arrays unless the frame is kept past this call
+        as_array = np.array if copy else np.asarray
+
         out = {
-            "timestamp": timestamp,
-            "sequence_number": sequence_number,
+            "timestamp": frame.timestamp,
+            "sequence_number": frame.sequence_number,
             "state_changes": [],
             "signals": {
-                SIGSEM_RADAR_PARAMETERS: {
-                    ARRSEM_BIN_LENGTH: np.array([self.bin_length], dtype=np.float32),
-                    ARRSEM_RANGE_OFFSET: np.array([self.range_offset], dtype=np.float32),
-                    ARRSEM_RANGE_DECIMATION: np.array([self.range_decimation], dtype=np.int32),
-                },
+                SIGSEM_RADAR_PARAMETERS: self.param_signal,
                 SIGNAL_SEMANTIC_RADAR_X7: {
-                    data_arrsem: np.array(sf[0][SIGNAL_SEMANTIC_RADAR_X7][data_arrsem]),
-                    ARRAY_SEMANTIC_RADAR_TRXMASK: np.array(sf[0][SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_RADAR_TRXMASK]),
+                    data_arrsem: as_array(radar_signal[data_arrsem]),
+                    ARRAY_SEMANTIC_RADAR_TRXMASK: as_array(radar_signal[ARRAY_SEMANTIC_RADAR_TRXMASK]),
                 }
             }
         }
 
-        self.sent_parameters = True
+        return out
+
+    def process(self, sf):
+
+        # frames go out in order: with a queue the whole batch joins it,
+        # otherwise the first frame goes out now and can stay a view
+        first_pending = 0 if len(self.pending) else 1
+        for i in range(first_pending, len(sf)):
+            self.pending.append(self.forward_frame(sf[i], copy=True))
 
-        return out, psf.ProcessResult.Continue
\ No newline at end of file
+        while len(self.pending) > MAX_PENDING_FRAMES:
+            self.pending.popleft()
+            self.frames_dropped += 1
+            if self.frames_dropped == 1 or self.frames_dropped % 100 == 0:
+                print(f"RadarDirectParamNode: batches bigger than one frame pile up, dropped {self.frames_dropped} frames")
+
+        self.sent_parameters = True
+        if first_pending:
+            return self.forward_frame(sf[0]), psf.ProcessResult.Continue
+        return self.pending.popleft(), psf.ProcessResult.Continue
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import time
 import numpy as np
-from dataclasses import dataclass
 from pathlib import Path
 from enum import IntEnum
 import json
@@ -13,27 +12,17 @@ from pyqtgraph.Qt.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QLineEdit,
     QPushButton, QApplication, QCheckBox, QDialog, QFileDialog
     )
-from pyqtgraph.Qt.QtGui import QDoubleValidator, QIcon, QImage, QPalette, QColor
+from pyqtgraph.Qt.QtGui import QDoubleValidator, QRegularExpressionValidator, QIcon, QImage, QPalette, QColor
 import pyqtgraph.Qt.QtCore as QtCore
 
 from RangeDopplerPlotter.surface_plot_widget import Matrix3DPlot, AxisConfig, CameraState
+from Utils.db_payload import as_db
+from Utils.view_channel import ViewPublisher
 
 from MultiRangeDopplerPlotter.BeamedRDui import Ui_multiRangeDoppWin
 from MultiRangeDopplerPlotter.add_plot_dialog import AddPlotDialog
-
-@dataclass
-class MultiRDSetup:
-    fps             : int
-    fft_size        : int
-    range_offset    : float
-    bin_length      : float
-
-@dataclass
-class MultiRDPlotData:
-    multi_rd_setup: MultiRDSetup
-    rd_data : np.ndarray
-    timestamp : float
-    seq_num   : int
+from MultiRangeDopplerPlotter.multi_rd_types import MultiRDSetup, MultiRDPlotData
+from Utils.frame_history import FrameHistory, DEFAULT_HISTORY_BYTES, SEEK_PATTERN, SEEK_HELP, seek_frame
 
 class KeyPressFilter(QtCore.QObject):
     def __init__(self, callback):
@@ -116,10 +105,11 @@ class SpecificSurfacePlot(Matrix3DPlot):
 
 class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
 
-    def __init__(self, shm_on_exit=None):
+    def __init__(self, shm_on_exit=None, hosted=False):
         self.plot = None
         self.plot_linear_scale: bool       = False
         self.shm_on_exit = shm_on_exit
+        self.hosted = hosted # other plotters share the process, closing must not end it
 
         self.range_axis_values: np.ndarray = None
         self.doppler_axis_values: np.ndarray = None
@@ -127,6 +117,7 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         
         self.rd_setup: MultiRDSetup = None
         self.rd_plot_data: MultiRDPlotData = None
+        self.view_publisher: ViewPublisher = None # tells the node which slices to send
 
         self.app = None
         self.initialized = False
@@ -139,6 +130,8 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         self.cols_per_row = 2
 
         self.paused = False
+        self.info_text = "" # set_label_info() text, render stats go below it
+        self.render_stats = ""
         self.curr_data_frame_inx = 0
         self.curr_label_frame_max = 0
 
@@ -148,8 +141,10 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
 
         self.did_first_lims_change = False
 
-        # timestamp received : RDRawPlotData
-        self.rd_plot_data_buffer: list[MultiRDPlotData] = []
+        # received MultiRDPlotData frames, oldest first
+        self.history = FrameHistory(DEFAULT_HISTORY_BYTES, self.num_saved_frames)
+        self.drawn_frame_id = None
+        self.evicted_seen = 0
 
         self.range_axis = AxisConfig("Range", "m", 0, 100, 100)
         self.doppler_axis = AxisConfig("Doppler", "Hz", -50, 50, 100)
@@ -205,7 +200,7 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
 
     def init_window(self):
         if self.app is None:
-            self.app = QApplication([])
+            self.app = QApplication.instance() or QApplication([])
         if self.mwin is not None:
             return
         
@@ -267,6 +262,8 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         self.angleMinLEdit.returnPressed.connect(self.angle_limits_edited)
         self.angleMaxLEdit.returnPressed.connect(self.angle_limits_edited)
         self.currFrameLEdit.returnPressed.connect(self.frame_edited)
+        self.currFrameLEdit.setValidator(QRegularExpressionValidator(QtCore.QRegularExpression(SEEK_PATTERN)))
+        self.currFrameLEdit.setToolTip(SEEK_HELP)
 
         self.rangeMinLEdit.setValidator(QDoubleValidator())
         self.rangeMaxLEdit.setValidator(QDoubleValidator())
@@ -351,6 +348,7 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
                 max_buf = int(params["MaxBufferedFrames"])
                 if max_buf != self.num_saved_frames and max_buf >= 1:
                     self.num_saved_frames = max_buf
+                    self.history.set_limits(max_frames=self.num_saved_frames)
             except:
                 pass
         
@@ -496,7 +494,7 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
                 self.unpicked_range_indices = np.array(chosen_dim_indices, dtype=int)
                 self.remove_plots(self.unpicked_range_index_to_plot)
 
-        self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+        self.draw_buffered_frame(self.curr_data_frame_inx)
 
     def change_axis_combo(self, new_combo: AxisCombos):
         if new_combo != self.curr_axis_combo and not self.is_single_angle:
@@ -522,7 +520,7 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
                 plot.local_view.show()
 
             self.curr_axis_combo = new_combo
-            self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+            self.draw_buffered_frame(self.curr_data_frame_inx)
 
     def axis_combo_changed(self, new_text: str):
         if new_text in self.name_to_combo_dict.keys():
@@ -537,11 +535,11 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         if not self.initialized:
             return
         
-        curr_frame = int(self.currFrameLEdit.text()) - 1
-        if 0 <= curr_frame < len(self.rd_plot_data_buffer):
+        curr_frame = seek_frame(self.currFrameLEdit.text(), self.history.seek, self.first_timestamp)
+        if curr_frame is not None and 0 <= curr_frame < len(self.history):
             self.paused = True
             self.curr_data_frame_inx = curr_frame
-            self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+            self.draw_buffered_frame(self.curr_data_frame_inx)
         else:
             self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
@@ -549,8 +547,8 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         if self.first_timestamp is None or not self.initialized:
             return
 
-        curr_frame_ts = self.rd_plot_data_buffer[self.curr_data_frame_inx].timestamp
-        curr_frame_seq = self.rd_plot_data_buffer[self.curr_data_frame_inx].seq_num
+        curr_frame_ts = self.history.timestamp(self.curr_data_frame_inx)
+        curr_frame_seq = self.history.seq_num(self.curr_data_frame_inx)
         timetxt = time.strftime('%Y.%m.%d %H:%M:%S', time.localtime(curr_frame_ts/1000))
         rel_time_txt = (curr_frame_ts - self.first_timestamp)/1000
         self.seqNumTimeLabel.setText(
@@ -578,12 +576,11 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         fps = self.first_setup_dict["fps"]
         enable_dc_removal = self.first_setup_dict["enable_dc_removal"]
         is_live = self.first_setup_dict.get("is_live", True)
-        self.infoParamLabel.setText(
-            (f"FPS: {fps}"
+        self.info_text = (f"FPS: {fps}"
             f"\nRangeDoppler integration time: {num_frames_in_pd/fps:.1f} s"
             f"\nRangeDoppler update rate: {frames_btw_pd/fps:.1f} s"
             f"\nEnable DC Removal: {enable_dc_removal}")
-        )
+        self.infoParamLabel.setText(self.info_text + self.render_stats)
 
         liveplay_color = "#82f17e" if is_live else "#369ee4"
         liveplay_text = "Live" if is_live else "Playback"
@@ -596,6 +593,12 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         """)
         self.liveOrPlaybackLabel.setText(liveplay_text)
             
+    def show_render_stats(self, text: str):
+        """Redraw pacing stats from ShmPlotPump, shown under the info text"""
+        self.render_stats = f"\n{text}"
+        if self.info_text:
+            self.infoParamLabel.setText(self.info_text + self.render_stats)
+
     def set_label_curr_frame(self):
         self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
         self.totalNumFramesBuffLabel.setText(f"/ {self.curr_label_frame_max}")
@@ -763,16 +766,16 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
             plot.switch_cam_state(state)
 
     def move_frame(self, direction: int):
-        if not self.initialized or len(self.rd_plot_data_buffer) <= 1:
+        if not self.initialized or len(self.history) <= 1:
             return
         self.paused = True
         self.curr_data_frame_inx += direction
         if self.curr_data_frame_inx < 0:
             self.curr_data_frame_inx = 0
-        elif self.curr_data_frame_inx >= len(self.rd_plot_data_buffer):
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
+        elif self.curr_data_frame_inx >= len(self.history):
+            self.curr_data_frame_inx = len(self.history) - 1
 
-        self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+        self.draw_buffered_frame(self.curr_data_frame_inx)
         self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
     def toggle_pause(self):
@@ -787,9 +790,13 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
         self.app.exec_()
 
     def exit(self):
+        if self.view_publisher is not None:
+            self.view_publisher.cleanup()
         if self.shm_on_exit is not None:
             self.shm_on_exit()
-        pg.exit()
+        self.history.close() # the spill file, the host process may live on
+        if not self.hosted:
+            pg.exit()
 
     def plot_or_make_new(self, axis_combo: AxisCombos, index: int) -> SpecificSurfacePlot:
         new_plot = None
@@ -844,22 +851,32 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
 
         return new_plot
 
-    def receive_data(self, data: MultiRDPlotData | dict):
+    def receive_data(self, data: MultiRDPlotData | dict | list):
+
+        # batch of frames from send_batch()
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
 
         # setup
         if isinstance(data, dict):
             self.first_setup_dict = data
+            if data.get("multi_rd_setup") is not None:
+                self.rd_setup = data["multi_rd_setup"]
+            if "view_channel" in data and self.view_publisher is None:
+                self.view_publisher = ViewPublisher(data["view_channel"])
             self.set_label_info()
             if "fps" in data and "num_frames_in_pd" in data:
                 fps = data["fps"]
                 framespd = data["num_frames_in_pd"]
                 self.waiting_label.setText(f"Waiting for data... expected {int(framespd/fps)} seconds after start")
             if "num_saved_frames" in data:
+                # < 0 leaves only the MaxBufferedBytes cap
                 self.num_saved_frames = data["num_saved_frames"]
-                if self.num_saved_frames < 0:
-                    self.num_saved_frames = 100_000
-                elif self.num_saved_frames < 1:
+                if self.num_saved_frames == 0:
                     self.num_saved_frames = 1
+            self.history.configure(data, self.num_saved_frames)
             if "az_beam_angles" in data:
                 self.angle_axis_values = data["az_beam_angles"]
             if "grid_cols_per_row" in data:
@@ -871,37 +888,40 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
             return
 
         # data
-        if self.rd_setup is None:
-            self.rd_setup = data.multi_rd_setup
-        
         if self.first_timestamp is None:
             self.first_timestamp = data.timestamp
 
-        self.rd_plot_data_buffer.append(data)
+        self.history.append(data)
         self.frame_received_counter += 1
 
     def update(self):
-        if not len(self.rd_plot_data_buffer):
+        if not len(self.history):
             return
 
-        if not self.paused:
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
-            if self.rd_plot_data is not self.rd_plot_data_buffer[self.curr_data_frame_inx]:
-                self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
-
-        # Limit the buffer size to avoid memory issues
-        if len(self.rd_plot_data_buffer) > self.num_saved_frames + 100:
-            oldlen = len(self.rd_plot_data_buffer)
-            self.rd_plot_data_buffer = self.rd_plot_data_buffer[-self.num_saved_frames:]
-            num_removed = oldlen - len(self.rd_plot_data_buffer)
+        if self.initialized:
+            self.publish_view()
+
+        # frames the history overwrote since the last update
+        num_removed = self.history.evicted - self.evicted_seen
+        if num_removed:
+            self.evicted_seen = self.history.evicted
             self.frame_dropped_counter += num_removed
-            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.rd_plot_data_buffer)-1)
+            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.history)-1)
             self.set_label_curr_frame()
 
-        if self.curr_label_frame_max != len(self.rd_plot_data_buffer):
-            self.curr_label_frame_max = len(self.rd_plot_data_buffer)
+        if not self.paused:
+            self.curr_data_frame_inx = len(self.history) - 1
+            if self.drawn_frame_id != self.history.frame_id(self.curr_data_frame_inx):
+                self.draw_buffered_frame(self.curr_data_frame_inx)
+
+        if self.curr_label_frame_max != len(self.history):
+            self.curr_label_frame_max = len(self.history)
             self.set_label_curr_frame()
 
+    def draw_buffered_frame(self, index: int):
+        self.drawn_frame_id = self.history.frame_id(index)
+        self.draw_data_frame(self.history[index])
+
     def initialize_axes(self):
         self.range_axis_values = np.linspace(0, self.num_bins_range * self.rd_setup.bin_length, num=self.num_bins_range) + self.rd_setup.range_offset
         self.doppler_axis_values = np.linspace(-self.num_bins_doppler / 2, self.num_bins_doppler / 2 - 1, num=self.num_bins_doppler) * (self.rd_setup.fps / self.rd_setup.fft_size)
@@ -940,33 +960,68 @@ class MultiRangeDopplerPlotter(Ui_multiRangeDoppWin):
             plot.local_view.deleteLater()
         dct.clear()
 
+    def publish_view(self):
+        """Lets the node send only the slices drawn with the current axis combination"""
+        if self.view_publisher is None:
+            return
+        if self.curr_axis_combo == AxisCombos.RANGE_DOPPLER:
+            slice_axis, indices = 0, self.unpicked_angle_indices
+        elif self.curr_axis_combo == AxisCombos.ANGLE_RANGE:
+            slice_axis, indices = 2, self.unpicked_doppler_indices
+        else:
+            slice_axis, indices = 1, self.unpicked_range_indices
+        self.view_publisher.publish({"slice_axis": slice_axis, "indices": [int(i) for i in indices]})
+
+    def frame_slice(self, frame: MultiRDPlotData, slice_axis: int, index: int):
+        """2D slice of the cube, None if the node did not send it (the view just changed)"""
+        if frame.slice_axis is None:
+            pos = index
+        elif frame.slice_axis == slice_axis and index in frame.slice_indices:
+            pos = int(np.flatnonzero(frame.slice_indices == index)[0])
+        else:
+            return None
+
+        if slice_axis == 0:
+            return frame.rd_data[pos]
+        if slice_axis == 1:
+            return frame.rd_data[:, pos, :]
+        return frame.rd_data[:, :, pos]
+
     def draw_data_frame(self, frame: MultiRDPlotData):
         
         if not self.initialized:
-            self.is_single_angle = (frame.rd_data.shape[0] == 1)
+            full_shape = frame.full_shape if frame.full_shape is not None else frame.rd_data.shape
+            self.is_single_angle = (full_shape[0] == 1)
             if self.is_single_angle:
                 self.axisPickComboBox.setDisabled(True)
                 self.angleMinLEdit.setDisabled(True)
                 self.angleMaxLEdit.setDisabled(True)
                 self.axisPickComboBox.setToolTip("Only one angle is present in the data, cannot change axis combination")
-            self.num_bins_range = frame.rd_data.shape[1]
-            self.num_bins_doppler = frame.rd_data.shape[2]
+            self.num_bins_range = full_shape[1]
+            self.num_bins_doppler = full_shape[2]
             self.initialize_axes()
         
         self.rd_plot_data = frame
 
+        # slices missing from the frame keep showing the previous one
         if self.curr_axis_combo == AxisCombos.RANGE_DOPPLER:
             for inx, angle_inx in enumerate(self.unpicked_angle_indices):
                 plot = self.plot_or_make_new(AxisCombos.RANGE_DOPPLER, inx)
-                plot.update_data(frame.rd_data[angle_inx])
+                data = self.frame_slice(frame, 0, angle_inx)
+                if data is not None:
+                    plot.update_data(as_db(data))
         elif self.curr_axis_combo == AxisCombos.ANGLE_RANGE:
             for inx, doppler_inx in enumerate(self.unpicked_doppler_indices):
                 plot = self.plot_or_make_new(AxisCombos.ANGLE_RANGE, inx)
-                plot.update_data(frame.rd_data[:, :, doppler_inx])
+                data = self.frame_slice(frame, 2, doppler_inx)
+                if data is not None:
+                    plot.update_data(as_db(data))
         elif self.curr_axis_combo == AxisCombos.ANGLE_DOPPLER:
             for inx, range_inx in enumerate(self.unpicked_range_indices):
                 plot = self.plot_or_make_new(AxisCombos.ANGLE_DOPPLER, inx)
-                plot.update_data(frame.rd_data[:, range_inx, :])
+                data = self.frame_slice(frame, 1, range_inx)
+                if data is not None:
+                    plot.update_data(as_db(data))
 
         self.set_label_curr_frame()
         self.set_label_time()
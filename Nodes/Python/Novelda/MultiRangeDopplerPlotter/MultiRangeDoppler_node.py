@@ -1,22 +1,19 @@
 from __future__ import annotations
 
-import sys
-import subprocess
-import time
-import os
-import tempfile
 import numpy as np
 from pathlib import Path
 
 import PySignalFlow as psf
 
-from Utils.sharedmem_handler import SharedMemSender
+from Utils.plot_node_base import PlotNodeBase
+from Utils.db_payload import DB_PAYLOAD_FLOAT32, quantize_db, db_lims_usable
 from Utils.semantics import *
-from MultiRangeDopplerPlotter.BeamedRD_plotter import *
+from Utils.view_channel import ViewSubscriber, new_view_channel_name
+from MultiRangeDopplerPlotter.multi_rd_types import MultiRDSetup, MultiRDPlotData
 
 DEFAULT_START_RANGE = 0.4  # meters
 
-class MultiRangeDopplerPlotter:
+class MultiRangeDopplerPlotter(PlotNodeBase):
     def __init__(self, *_):
         self.initialized = False
 
@@ -32,6 +29,9 @@ class MultiRangeDopplerPlotter:
 
         self.angle_lim_vec = np.array([-90.0, 90.0])
 
+        # slices the plotter shows, only those are sent when live
+        self.view_subscriber: ViewSubscriber = None
+
         self.range_slices_to_plot = np.array([1.0])
         self.doppler_slices_to_plot = np.array([0.0])
         self.angle_slices_to_plot = np.array([0.0])
@@ -42,6 +42,7 @@ class MultiRangeDopplerPlotter:
             if section not in params:
                 continue
             curr_sec = params[section]
+            self.set_transport_parameters(curr_sec)
 
             if "FPS" in curr_sec:
                 self.fps = float(np.array(curr_sec["FPS"])[0])
@@ -111,36 +112,17 @@ class MultiRangeDopplerPlotter:
 
     def buildup(self):
 
-        MAX_RANGE_BINS = 192
-        MAX_AGGREGATED_FRAMES = 4
-        BYTES_PER_FLOAT = 4
-
-        # + 50_000 to make sure theres space
-        self.shm_blocksize = len(self.az_beam_angles) * self.fft_size * MAX_RANGE_BINS * MAX_AGGREGATED_FRAMES * BYTES_PER_FLOAT + 50_000
-        
         self.shm_numblocks = 10 # a lot of blocks to speed up playback loading
 
-        # put verbose=False when released
-        self.sharedmem_sender = SharedMemSender(self.shm_blocksize, self.shm_numblocks, verbose=True)
-
-        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
-        self.close_path = closesig_file.name
-        closesig_file.close()
+        if self.db_payload_type != DB_PAYLOAD_FLOAT32 and not db_lims_usable(getattr(self, "power_lim_vec", None)):
+            print("DbPayloadType needs PowerLimVec (min < max) to clamp to, sending float32")
+            self.db_payload_type = DB_PAYLOAD_FLOAT32
 
-        # start plotting process
-        worker_script = str(Path(__file__).resolve().parent / "beamedRD_procrunner.py")
-        self.plotting_process = subprocess.Popen([
-            sys.executable,  # Use the same Python executable
-            worker_script,
-            self.sharedmem_sender.sharedmem.name,
-            f"{self.shm_blocksize}",
-            f"{self.shm_numblocks}",
-            self.close_path
-        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
+        # the transport is sized from the first frame
+        self.prepare_plotting_process(str(Path(__file__).resolve().parent / "beamedRD_procrunner.py"),
+                                      "MultiRangeDopplerPlotter.BeamedRD_plotter:MultiRangeDopplerPlotter")
 
-        for line in self.plotting_process.stdout:
-            if line.strip() == "PLOTTING_PROCESS_READY":
-                break
+    def make_setup(self):
 
         param_dict = {
             "fps" : self.fps,
@@ -176,70 +158,74 @@ class MultiRangeDopplerPlotter:
             if self.angle_lim_vec.size == 2:
                 param_dict["angle_lim_vec"] = self.angle_lim_vec
 
-        self.send_data(param_dict)
-
-    def send_data(self, data):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.send_data(data): # busy wait for max speed for huge playback files
-            if time.time() - now > max_wait:
-                print("Shared memory sender timed out, exiting process")
-                self.teardown()
-                return
-
-    def extract_rangedoppler_data(self, frame):
+        if self.is_live:
+            self.view_subscriber = ViewSubscriber(new_view_channel_name())
+            param_dict["view_channel"] = self.view_subscriber.name
 
-        self.current_data = np.asarray(
-            frame[SIGNAL_SEMANTIC_RANGEDOPPLER][ARRAY_SEMANTIC_RANGEDOPPLERPOWER_4D])[0]
-    
-        self.current_data = 10 * np.log10(self.current_data + 1e-12)
-
-        # make setup info
-        rd_setup = MultiRDSetup(
+        # same for every frame, sent once instead of with each one
+        param_dict["multi_rd_setup"] = MultiRDSetup(
             fps              = self.fps,
             fft_size         = self.fft_size,
             range_offset     = self.range_offset,
             bin_length       = self.bin_length,
         )
 
-        # make the full data struct
-        # no need to put in the setup info every single time, but compared to the size of the total data
-        # and total processing the info struct is insignificant
+        return param_dict
+
+    def extract_rangedoppler_data(self, frame, slot=0, view=None):
+
+        # locals only until the end, frames of a batch can be converted in parallel
+        current_data = np.asarray(
+            frame[SIGNAL_SEMANTIC_RANGEDOPPLER][ARRAY_SEMANTIC_RANGEDOPPLERPOWER_4D])[0]
+        full_shape = current_data.shape
+
+        # [angle, range, doppler], only the slices on screen if the plotter told us
+        slice_axis, slice_indices = self.subscribed_slices(view, full_shape)
+        if slice_axis is not None:
+            current_data = np.take(current_data, slice_indices, axis=slice_axis)
+    
+        current_data = 10 * np.log10(current_data + 1e-12)
+        if self.db_payload_type != DB_PAYLOAD_FLOAT32:
+            current_data = quantize_db(current_data, self.power_lim_vec, self.db_payload_type)
+
         rd_plot_data = MultiRDPlotData(
-            multi_rd_setup=rd_setup,
-            rd_data=self.current_data,
+            rd_data=current_data,
+            full_shape=full_shape,
+            slice_axis=slice_axis,
+            slice_indices=slice_indices,
             timestamp=frame.timestamp,
             seq_num=frame.sequence_number
         )
 
-        # Store for later use and return
-        self.rd_plot_data = rd_plot_data
         return rd_plot_data
 
-    def teardown(self):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.are_all_read():
-            time.sleep(0.1)
-            if time.time() - now > max_wait:
-                break
+    def subscribed_slices(self, view: dict | None, full_shape: tuple) -> tuple[int | None, np.ndarray | None]:
+        """Cube axis and indices the plotter currently draws, (None, None) for the whole cube"""
+        if view is None:
+            return None, None # not live, or the plotter is not drawing yet
+
+        slice_axis = int(view["slice_axis"])
+        slice_indices = np.asarray(view["indices"], dtype=int)
+        slice_indices = slice_indices[(slice_indices >= 0) & (slice_indices < full_shape[slice_axis])]
+        if not slice_indices.size:
+            return None, None
+        return slice_axis, slice_indices
 
-        if os.path.exists(self.close_path):
-            os.remove(self.close_path)
-        self.sharedmem_sender.cleanup()
+    def teardown(self):
+        super().teardown()
+        if self.view_subscriber is not None:
+            self.view_subscriber.cleanup()
 
     def process(self, sf):
 
         # Exit if plotting subprocess has closed
-        if self.plotting_process.poll() is not None:
-            return None, psf.ProcessResult.EndOfData
-        
-        if not self.sharedmem_sender.check_buff_exists():
+        if self.plotting_closed():
             return None, psf.ProcessResult.EndOfData
 
-        for i in range(len(sf)):
-            frame = sf[i]
-            self.extract_rangedoppler_data(frame)
-            self.send_data(self.rd_plot_data)
+        frames = self.limit_plot_rate([sf[i] for i in range(len(sf))])
+        # one view for the whole batch
+        view = self.view_subscriber.latest() if self.view_subscriber is not None else None
+        batch = self.map_frames(lambda frame, slot: self.extract_rangedoppler_data(frame, slot, view), frames)
+        self.send_batch(batch)
 
         return None, psf.ProcessResult.Continue
\ No newline at end of file
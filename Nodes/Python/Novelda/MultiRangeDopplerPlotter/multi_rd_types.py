@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+
+from Utils.db_payload import QuantizedDb
+
+# Frame types shared by the node and the plotter, kept free of Qt so the
+# SignalFlow process does not load it
+
+@dataclass
+class MultiRDSetup:
+    fps             : int
+    fft_size        : int
+    range_offset    : float
+    bin_length      : float
+
+@dataclass
+class MultiRDPlotData:
+    rd_data : np.ndarray | QuantizedDb
+    timestamp : float
+    seq_num   : int
+    full_shape : tuple = None # [angle, range, doppler] before slicing
+    slice_axis : int = None # rd_data only holds these indices along this axis when set
+    slice_indices : np.ndarray = None
@@ -1,21 +1,20 @@
 from __future__ import annotations
 
-import sys
-import subprocess
-import time
-import os
-import tempfile
 import numpy as np
 from pathlib import Path
 
 import PySignalFlow as psf
 
-from Utils.sharedmem_handler import SharedMemSender
+from Utils.plot_node_base import PlotNodeBase
 from Presence2DPlotter.presence_types import Presence2DDataFrame
 
 from Utils.fnv1a_py import fnv1a_py
 
-class Presence2DPlotter:
+class Presence2DPlotter(PlotNodeBase):
+
+    # the plotter's time series need every frame, also when live
+    live_needs_every_frame = True
+
     def __init__(self, *_):
         self.initialized = False
 
@@ -24,6 +23,7 @@ class Presence2DPlotter:
         self.num_frames_in_pd = 0
         self.frames_between_pd = 0
         self.fps = 0
+        self.fps_param = 0 # FPS as configured, fps is what the plotter gets
         self.enable_dc_removal = False
         self.plot_linear_scale = False
         self.is_live = True
@@ -91,6 +91,7 @@ class Presence2DPlotter:
             if section not in params:
                 continue
             curr_sec = params[section]
+            self.set_transport_parameters(curr_sec)
 
             for k in ("ShowFOVLines", "ShowXYCoordinates", "HighlightDetection", "InvertedTopView", "TrailBackwardSeconds", "TrailForwardSeconds", "MaxBufferedFrames"):
                 if k in curr_sec:
@@ -142,7 +143,7 @@ class Presence2DPlotter:
                     self.OutputTag_lowpower = np.array(curr_sec["OutputTag"]).flatten()[0]
 
             if "FPS" in curr_sec:
-                self.fps = np.array(curr_sec["FPS"]).flatten()[0]
+                self.fps_param = np.array(curr_sec["FPS"]).flatten()[0]
 
             if "IsLive" in curr_sec:
                 self.is_live = np.array(curr_sec["IsLive"]).flatten()[0]
@@ -213,35 +214,23 @@ class Presence2DPlotter:
             if "Mode" in curr_sec:
                 self.RadarMode = np.array(curr_sec["Mode"])[0]
 
+        # half the configured FPS in Autonomous mode, from the parameters so it is only applied once
+        self.fps = self.fps_param / 2 if self.RadarMode == fnv1a_py("Autonomous") else self.fps_param
 
     def buildup(self):
 
-        self.shm_blocksize = 1_000_000 # change later to a more dynamic size
         self.shm_numblocks = 20 # to be able to keep up with high fps
 
-        self.sharedmem_sender = SharedMemSender(self.shm_blocksize, self.shm_numblocks, verbose=True)
-
-        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
-        self.close_path = closesig_file.name
-        closesig_file.close()
-
-        # start plotting process
-        worker_script = str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py")
-        self.plotting_process = subprocess.Popen([
-            sys.executable,  # Use the same Python executable
-            worker_script,
-            self.sharedmem_sender.sharedmem.name,
-            f"{self.shm_blocksize}",
-            f"{self.shm_numblocks}",
-            self.close_path
-        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
-
-        for line in self.plotting_process.stdout:
-            if line.strip() == "PLOTTING_PROCESS_READY":
-                break
-        
-        if self.RadarMode == fnv1a_py("Autonomous"):
-            self.fps /= 2
+        if self.plot_max_rate > 0:
+            # every frame is a point of the plotter's time series, thinning would leave gaps
+            self.warn("PlotMaxRate is ignored, the time series need every frame")
+            self.plot_max_rate = 0
+
+        # the transport is sized from the first frame
+        self.prepare_plotting_process(str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py"),
+                                      "Presence2DPlotter.Presence2DPlotter_plotter:Presence2DPlotter")
+
+    def make_setup(self):
 
         add_detection_zones_from_buffer_dict = {
             "xybuffer_performance" : self.DetZoneXYPoints_performance,
@@ -298,36 +287,12 @@ class Presence2DPlotter:
             "json_settings": json_settings_dict,
         }
 
-        self.send_data(param_dict)
-
-    def send_data(self, data):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.send_data(data): # busy wait for max speed for huge playback files
-            if time.time() - now > max_wait:
-                print("Shared memory sender timed out, exiting process")
-                self.teardown()
-                return
-
-    def teardown(self):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.are_all_read():
-            time.sleep(0.1)
-            if time.time() - now > max_wait:
-                break
-
-        if os.path.exists(self.close_path):
-            os.remove(self.close_path)
-        self.sharedmem_sender.cleanup()
+        return param_dict
 
     def process(self, sf):
 
         # Exit if plotting subprocess has closed
-        if self.plotting_process.poll() is not None:
-            return None, psf.ProcessResult.EndOfData
-        
-        if not self.sharedmem_sender.check_buff_exists():
+        if self.plotting_closed():
             return None, psf.ProcessResult.EndOfData
         
         for i in range(len(sf)):
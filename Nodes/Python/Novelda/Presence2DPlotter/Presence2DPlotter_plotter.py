@@ -20,7 +20,7 @@ from pyqtgraph.Qt.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
     QPushButton, QApplication, QCheckBox
     )
-from pyqtgraph.Qt.QtGui import QDoubleValidator, QIntValidator, QIcon, QImage, QPalette, QColor
+from pyqtgraph.Qt.QtGui import QDoubleValidator, QRegularExpressionValidator, QIcon, QImage, QPalette, QColor
 import pyqtgraph.Qt.QtCore as QtCore
 
 from Presence2DPlotter.new_main_ui import Ui_MainWindow
@@ -28,6 +28,7 @@ from Presence2DPlotter.time_series_plot import TimeSeriesPlot
 from Presence2DPlotter.top_view_plot import TopViewPlot
 from Presence2DPlotter.presence_types import HumanPresence2DIdx, DetectionZone, Pres2dData, Presence2DDataFrame
 from Presence2DPlotter.power_plot import PowerPerBinPlot
+from Utils.frame_history import SeekIndex, SEEK_PATTERN, SEEK_HELP, seek_frame
 
 from enum import IntEnum
 
@@ -99,8 +100,9 @@ class PlotMainWin(QMainWindow, Ui_MainWindow):
 
 class Presence2DPlotter:
 
-    def __init__(self, shm_on_exit=None):
+    def __init__(self, shm_on_exit=None, hosted=False):
         self.shm_on_exit = shm_on_exit
+        self.hosted = hosted # other plotters share the process, closing must not end it
         self.app = None
         self._key_filter = None
         self.mainwin = None
@@ -110,6 +112,9 @@ class Presence2DPlotter:
         self.frame_dropped_counter = 0
 
         self.paused = False
+        self.info_text = "" # set_label_info() text, render stats go below it
+        self.render_stats = ""
+        self.collapse_live_backlog = False # the time series need every frame, see ShmPlotPump
 
         self.curr_data_frame_inx = 0
         self.curr_label_frame_max = 0
@@ -156,6 +161,7 @@ class Presence2DPlotter:
 
         self.curr_ppif_data: Presence2DDataFrame = None
         self.ppif_plot_data_buffer: list[Presence2DDataFrame] = []
+        self.seek_index = SeekIndex() # timestamps and sequence numbers of ppif_plot_data_buffer
 
         self.min_time_history = 10000
         self.max_time_history = 300*1000
@@ -480,7 +486,7 @@ class Presence2DPlotter:
 
     def init_window(self):
         if self.app is None:
-            self.app = QApplication([])
+            self.app = QApplication.instance() or QApplication([])
             text_fg = self.apply_dark_theme(self.app)
         if self.mainwin is not None:
             return
@@ -564,7 +570,8 @@ class Presence2DPlotter:
         self.mainwin.powerMinLEdit.setValidator(doubleValid)
         self.mainwin.powerMaxLEdit.setValidator(doubleValid)
 
-        self.mainwin.currFrameLEdit.setValidator(QIntValidator(1, 1_000_000_000))
+        self.mainwin.currFrameLEdit.setValidator(QRegularExpressionValidator(QtCore.QRegularExpression(SEEK_PATTERN)))
+        self.mainwin.currFrameLEdit.setToolTip(SEEK_HELP)
 
         self.mainwin.trailBwdLEdit.returnPressed.connect(self._set_bwd_trail)
         self.mainwin.trailFwdLEdit.returnPressed.connect(self._set_fwd_trail)
@@ -589,9 +596,8 @@ class Presence2DPlotter:
         if self.fps is None:
             self.fps = fps
 
-        self.mainwin.infoParamLabel.setText(
-            f"FPS: {fps}"
-        )
+        self.info_text = f"FPS: {fps}"
+        self.mainwin.infoParamLabel.setText(self.info_text + self.render_stats)
 
         is_live = self.first_setup_dict["is_live"]
 
@@ -744,8 +750,8 @@ class Presence2DPlotter:
 
     def frame_edited(self):
         try:
-            curr_frame = int(self.mainwin.currFrameLEdit.text()) - 1  # Convert to 0-based index
-            if 0 <= curr_frame < len(self.ppif_plot_data_buffer):
+            curr_frame = seek_frame(self.mainwin.currFrameLEdit.text(), self.seek_index, self.first_timestamp)
+            if curr_frame is not None and 0 <= curr_frame < len(self.ppif_plot_data_buffer):
                 self.paused = True
                 self.curr_data_frame_inx = curr_frame
                 frame = self.ppif_plot_data_buffer[self.curr_data_frame_inx]
@@ -780,6 +786,12 @@ class Presence2DPlotter:
         self.mainwin.currFrameLEdit.setText(str(int(self.curr_data_frame_inx + 1)))
         self.mainwin.currFrameLEdit.setReadOnly(True)
 
+    def show_render_stats(self, text: str):
+        """Redraw pacing stats from ShmPlotPump, shown under the info text"""
+        self.render_stats = f"\n{text}"
+        if self.info_text:
+            self.mainwin.infoParamLabel.setText(self.info_text + self.render_stats)
+
     def set_label_curr_frame(self):
         # Only update the frame number if the edit field doesn't have focus
         if not self._frame_edit_has_focus:
@@ -936,7 +948,8 @@ class Presence2DPlotter:
     def exit(self):
         if self.shm_on_exit is not None:
             self.shm_on_exit()
-        pg.exit()
+        if not self.hosted:
+            pg.exit()
 
     def _set_xylims(self):
         self.top_view_plot._set_xylims()
@@ -958,7 +971,13 @@ class Presence2DPlotter:
         self.mainwin.rangeMinLEdit.setText(f"{self.ppb_plot.xlims[0]:.2f}")
         self.mainwin.rangeMaxLEdit.setText(f"{self.ppb_plot.xlims[1]:.2f}")
 
-    def receive_data(self, data: dict | Presence2DDataFrame):
+    def receive_data(self, data: dict | Presence2DDataFrame | list):
+
+        # batch of frames from send_batch()
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
         if self.first_setup_dict is None:
             if isinstance(data, dict):
                 self._handle_initial_setup(data)
@@ -988,10 +1007,6 @@ class Presence2DPlotter:
         self.first_setup_dict = data
         self.set_label_info()
 
-        # Setup fps-related params
-        if "fps" in data:
-            self.skip_n_counter = int(data["fps"] / 50)
-
         # Copy attributes from setup dict
         for k in ("max_history", "MaxHistoryTimeplotsInS", "confidence_values_performance",
                   "confidence_values_lowpower", "top_view", "xy_xlims", "xy_ylims",
@@ -1089,6 +1104,8 @@ class Presence2DPlotter:
         self.ppif_plot_data_buffer.append(data)
         idx = len(self.ppif_plot_data_buffer) - 1
         ts = float(data.new_timestamp_seqnum_tag_in.get("timestamp", 0.0))
+        # one entry per buffered frame, even without a timestamp, so drop_front() stays in step
+        self.seek_index.append(ts, int(data.new_timestamp_seqnum_tag_in.get("sequence_number", -1)))
 
         # Update detection metric plot
         if data.detection2d is not None:
@@ -1305,6 +1322,7 @@ class Presence2DPlotter:
             oldlen = len(self.ppif_plot_data_buffer)
             self.ppif_plot_data_buffer = self.ppif_plot_data_buffer[-self.num_saved_frames:]
             num_removed = oldlen - len(self.ppif_plot_data_buffer)
+            self.seek_index.drop_front(num_removed)
             self.frame_dropped_counter += num_removed
             self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0,
                                                len(self.ppif_plot_data_buffer) - 1)
@@ -1,7 +1,12 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
 from enum import IntEnum
+from typing import TYPE_CHECKING
 import numpy as np
-import pyqtgraph as pg
+
+if TYPE_CHECKING: # no Qt in the node process
+    import pyqtgraph as pg
 
 class HumanPresence2DIdx(IntEnum):
     STATE_IDX = 0
@@ -1,22 +1,19 @@
 from __future__ import annotations
 
-import sys
-import subprocess
-import time
-import os
-import tempfile
 import numpy as np
 from pathlib import Path
 
 import PySignalFlow as psf
 
-from Utils.sharedmem_handler import SharedMemSender
+from Utils.plot_node_base import PlotNodeBase
+from Utils.db_payload import DB_PAYLOAD_FLOAT32, quantize_db, db_lims_usable
+from Utils.iq_kernels import iq_power, power_to_db
 from Utils.semantics import *
-from RadarDirectBeamPlot.RadarDirectBeamPlot_plotter import *
+from RadarDirectBeamPlot.beam_types import RadarDirectBeamData
 
 DEFAULT_START_RANGE = 0.4  # meters
 
-class RadarDirectBeamPlot:
+class RadarDirectBeamPlot(PlotNodeBase):
     def __init__(self, *_):
         self.initialized = False
 
@@ -46,6 +43,7 @@ class RadarDirectBeamPlot:
             if section not in params:
                 continue
             curr_sec = params[section]
+            self.set_transport_parameters(curr_sec)
 
             if "FPS" in curr_sec:
                 self.fps = float(np.array(curr_sec["FPS"])[0])
@@ -106,32 +104,19 @@ class RadarDirectBeamPlot:
 
     def buildup(self):
 
-        MAX_RANGE_BINS = 192 * 4
-        BYTES_PER_FLOAT = 4
-
-        # + 50_000 to make sure theres space
-        self.shm_blocksize = len(self.az_beam_angles) * MAX_RANGE_BINS * BYTES_PER_FLOAT + 50_000
-        
         self.shm_numblocks = 10 # a lot of blocks to speed up playback loading
 
-        # put verbose=False when released
-        self.sharedmem_sender = SharedMemSender(self.shm_blocksize, self.shm_numblocks, verbose=True)
-
-        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
-        self.close_path = closesig_file.name
-        closesig_file.close()
-
-        # start plotting process
-        worker_script = str(Path(__file__).resolve().parent / "RadarDirectBeam_procrunner.py")
-        self.plotting_process = subprocess.Popen([
-            sys.executable,  # Use the same Python executable
-            worker_script,
-            self.sharedmem_sender.sharedmem.name,
-            f"{self.shm_blocksize}",
-            f"{self.shm_numblocks}",
-            self.close_path
-        # ], stdout=None, stderr=None, text=True, bufsize=1)
-        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
+        # clamp to the power limits if set, otherwise to the colour map
+        self.db_lims = self.power_lim_vec if self.power_lim_vec.size == 2 else self.color_map_range
+        if self.db_payload_type != DB_PAYLOAD_FLOAT32 and not db_lims_usable(self.db_lims):
+            print("DbPayloadType needs PowerLimVec or ColorMapRange (min < max) to clamp to, sending float32")
+            self.db_payload_type = DB_PAYLOAD_FLOAT32
+
+        # the transport is sized from the first frame
+        self.prepare_plotting_process(str(Path(__file__).resolve().parent / "RadarDirectBeam_procrunner.py"),
+                                      "RadarDirectBeamPlot.RadarDirectBeamPlot_plotter:RadarDirectBeamPlotter")
+
+    def make_setup(self):
 
         param_dict = {
             "fps" : self.fps,
@@ -158,22 +143,9 @@ class RadarDirectBeamPlot:
         if self.power_lim_vec.size == 2:
             param_dict["power_lim_vec"] = self.power_lim_vec
 
-        self.send_data(param_dict)
-
-        for line in self.plotting_process.stdout:
-            if line.strip() == "PLOTTING_PROCESS_READY":
-                break
+        return param_dict
 
-    def send_data(self, data):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.send_data(data): # busy wait for max speed for huge playback files
-            if time.time() - now > max_wait:
-                print("Shared memory sender timed out, exiting process")
-                self.teardown()
-                return
-
-    def extract_radardirect_beam_data(self, frame):
+    def extract_radardirect_beam_data(self, frame, slot=0):
 
         inc_data = np.asarray(
             frame[SIGNAL_SEMANTIC_RADAR_X7][ARRAY_SEMANTIC_BBIQ_MULTIFRAME_FLOAT32])
@@ -181,10 +153,13 @@ class RadarDirectBeamPlot:
         # forget elevation
         inc_data = inc_data[0]
 
-        # convert to power
-        inc_data = 20*np.log10((np.abs(inc_data[:, 0, :] + 1j*inc_data[:, 1, :])+1e-16))
+        # convert to power, all beams at once, [beam, I/Q, bin] -> [beam, bin]
+        shape = (inc_data.shape[0], inc_data.shape[2])
+        power = iq_power(inc_data[:, 0, :], inc_data[:, 1, :],
+                         self.frame_buffer(slot, "power", shape), self.frame_buffer(slot, "q_power", shape))
+        inc_data = power_to_db(power, out=power, floor=1e-32) # 20*log10(|x| + 1e-16)
 
-        self.current_data: np.ndarray = inc_data
+        inc_data = quantize_db(inc_data, self.db_lims, self.db_payload_type)
 
         radar_beam_plot_data = RadarDirectBeamData(
             power_beam_data=inc_data,
@@ -192,34 +167,17 @@ class RadarDirectBeamPlot:
             seq_num=frame.sequence_number
         )
 
-        # Store for later use and return
-        self.radar_beam_plot_data = radar_beam_plot_data
+        # with float32 the dB map is this slot's frame buffer, it is sent before the slot is reused
         return radar_beam_plot_data
 
-    def teardown(self):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.are_all_read():
-            time.sleep(0.1)
-            if time.time() - now > max_wait:
-                break
-
-        if os.path.exists(self.close_path):
-            os.remove(self.close_path)
-        self.sharedmem_sender.cleanup()
-
     def process(self, sf):
 
         # Exit if plotting subprocess has closed
-        if self.plotting_process.poll() is not None:
-            return None, psf.ProcessResult.EndOfData
-        
-        if not self.sharedmem_sender.check_buff_exists():
+        if self.plotting_closed():
             return None, psf.ProcessResult.EndOfData
 
-        for i in range(len(sf)):
-            frame = sf[i]
-            self.extract_radardirect_beam_data(frame)
-            self.send_data(self.radar_beam_plot_data)
+        frames = self.limit_plot_rate([sf[i] for i in range(len(sf))])
+        batch = self.map_frames(self.extract_radardirect_beam_data, frames)
+        self.send_batch(batch)
 
         return None, psf.ProcessResult.Continue
\ No newline at end of file
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import time
 import numpy as np
-from dataclasses import dataclass
 from pathlib import Path
 from enum import IntEnum
 import json
@@ -13,21 +12,18 @@ from pyqtgraph.Qt.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QLineEdit,
     QPushButton, QApplication, QCheckBox, QDialog, QFileDialog
     )
-from pyqtgraph.Qt.QtGui import QDoubleValidator, QIcon, QImage, QPalette, QColor
+from pyqtgraph.Qt.QtGui import QDoubleValidator, QRegularExpressionValidator, QIcon, QImage, QPalette, QColor
 import pyqtgraph.Qt.QtCore as QtCore
 
 from RadarDirectBeamPlot.RadarDirectBeamPlotui import Ui_multiRangeDoppWin
 from RadarDirectBeamPlot.xy_beam_plotw import XYBeamPlotWidget
+from Utils.db_payload import as_db
 
 from BasebandPlotter.xy_plot_widget import XY2DPlotWidget
 from MultiRangeDopplerPlotter.add_plot_dialog import AddPlotDialog
 from RadarDirectBeamPlot.ThresholdPickerDialog import PickThreshDialog
-
-@dataclass
-class RadarDirectBeamData:
-    power_beam_data: np.ndarray
-    timestamp      : float
-    seq_num        : int
+from RadarDirectBeamPlot.beam_types import RadarDirectBeamData
+from Utils.frame_history import FrameHistory, DEFAULT_HISTORY_BYTES, SEEK_PATTERN, SEEK_HELP, seek_frame
 
 class KeyPressFilter(QtCore.QObject):
     def __init__(self, callback):
@@ -106,16 +102,18 @@ class LimitEditLineHelper:
 
 class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
 
-    def __init__(self, shm_on_exit=None):
+    def __init__(self, shm_on_exit=None, hosted=False):
         self.plot = None
         self.plot_linear_scale: bool       = False
         self.shm_on_exit = shm_on_exit
+        self.hosted = hosted # other plotters share the process, closing must not end it
 
         self.range_axis_values: np.ndarray = None
         self.doppler_axis_values: np.ndarray = None
         self.power_lim_vec: np.ndarray = None
         
         self.rd_plot_data: RadarDirectBeamData = None
+        self.power_beam_db: np.ndarray = None # dequantized power of rd_plot_data
 
         self.app = None
         self.initialized = False
@@ -126,6 +124,8 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         self.num_saved_frames = 10_000
 
         self.paused = False
+        self.info_text = "" # set_label_info() text, render stats go below it
+        self.render_stats = ""
         self.curr_data_frame_inx = 0
         self.curr_label_frame_max = 0
 
@@ -133,8 +133,10 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         self.first_timestamp = None
         self.is_live = True
 
-        # timestamp received : RDRawPlotData
-        self.rd_plot_data_buffer: list[RadarDirectBeamData] = []
+        # received RadarDirectBeamData frames, oldest first
+        self.history = FrameHistory(DEFAULT_HISTORY_BYTES, self.num_saved_frames)
+        self.drawn_frame_id = None
+        self.evicted_seen = 0
 
         self.num_bins_range = 0
 
@@ -166,7 +168,7 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
 
     def init_window(self):
         if self.app is None:
-            self.app = QApplication([])
+            self.app = QApplication.instance() or QApplication([])
         if self.mwin is not None:
             return
         
@@ -215,6 +217,8 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         self.resetLimitsBtn.released.connect(self.reset_limits)
 
         self.currFrameLEdit.returnPressed.connect(self.frame_edited)
+        self.currFrameLEdit.setValidator(QRegularExpressionValidator(QtCore.QRegularExpression(SEEK_PATTERN)))
+        self.currFrameLEdit.setToolTip(SEEK_HELP)
 
         self.choose_plots_dialog = None
 
@@ -362,7 +366,7 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         state = self.checkBoxPizzaOrInterp.checkState()
         self.beam_plotter.plotting_mode = 1 if state == QtCore.Qt.CheckState.Checked else 0
         if self.rd_plot_data is not None:
-            self.draw_data_frame(self.rd_plot_data)
+            self.draw_buffered_frame(self.curr_data_frame_inx)
 
     def gen_angle_slice_list(self, angles: list[float]):
         self._angle_slices.clear()
@@ -385,7 +389,7 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
             self.range_baseband_plot.plot_or_update_data(
                 inx,
                 self.beam_plotter.range_vec,
-                self.rd_plot_data.power_beam_data[inx],
+                self.power_beam_db[inx],
                 line_color=self._plot_line_colors[(len(self.range_baseband_plot.plot_data_items)-1)%len(self._plot_line_colors)],
                 legend_label=f"Angle Slice {self._az_beam_angles[inx]:.1f} deg"
             )
@@ -397,7 +401,7 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
             self.angle_baseband_plot.plot_or_update_data(
                 inx,
                 self._az_beam_angles,
-                self.rd_plot_data.power_beam_data[:, inx],
+                self.power_beam_db[:, inx],
                 line_color=self._plot_line_colors[(len(self.angle_baseband_plot.plot_data_items))%len(self._plot_line_colors)],
                 legend_label=f"Range Slice {self.beam_plotter.range_vec[inx]:.1f} m"
             )
@@ -424,11 +428,11 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         if not self.initialized:
             return
         
-        curr_frame = int(self.currFrameLEdit.text()) - 1
-        if 0 <= curr_frame < len(self.rd_plot_data_buffer):
+        curr_frame = seek_frame(self.currFrameLEdit.text(), self.history.seek, self.first_timestamp)
+        if curr_frame is not None and 0 <= curr_frame < len(self.history):
             self.paused = True
             self.curr_data_frame_inx = curr_frame
-            self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+            self.draw_buffered_frame(self.curr_data_frame_inx)
         else:
             self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
@@ -436,8 +440,8 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         if self.first_timestamp is None or not self.initialized:
             return
 
-        curr_frame_ts = self.rd_plot_data_buffer[self.curr_data_frame_inx].timestamp
-        curr_frame_seq = self.rd_plot_data_buffer[self.curr_data_frame_inx].seq_num
+        curr_frame_ts = self.history.timestamp(self.curr_data_frame_inx)
+        curr_frame_seq = self.history.seq_num(self.curr_data_frame_inx)
         timetxt = time.strftime('%Y.%m.%d %H:%M:%S', time.localtime(curr_frame_ts/1000))
         rel_time_txt = (curr_frame_ts - self.first_timestamp)/1000
         self.seqNumTimeLabel.setText(
@@ -460,10 +464,9 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
     def set_label_info(self):
         fps = self.first_setup_dict["fps"]
         is_live = self.first_setup_dict.get("is_live", True)
-        self.infoParamLabel.setText(
-            (f"FPS: {fps}"
+        self.info_text = (f"FPS: {fps}"
             f"\nDC Removal Smooth Coeff: {self.dc_smooth_coeff:.2f}")
-        )
+        self.infoParamLabel.setText(self.info_text + self.render_stats)
 
         liveplay_color = "#82f17e" if is_live else "#369ee4"
         liveplay_text = "Live" if is_live else "Playback"
@@ -476,6 +479,12 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         """)
         self.liveOrPlaybackLabel.setText(liveplay_text)
             
+    def show_render_stats(self, text: str):
+        """Redraw pacing stats from ShmPlotPump, shown under the info text"""
+        self.render_stats = f"\n{text}"
+        if self.info_text:
+            self.infoParamLabel.setText(self.info_text + self.render_stats)
+
     def set_label_curr_frame(self):
         self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
         self.totalNumFramesBuffLabel.setText(f"/ {self.curr_label_frame_max}")
@@ -507,16 +516,16 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         return False
 
     def move_frame(self, direction: int):
-        if not self.initialized or len(self.rd_plot_data_buffer) <= 1:
+        if not self.initialized or len(self.history) <= 1:
             return
         self.paused = True
         self.curr_data_frame_inx += direction
         if self.curr_data_frame_inx < 0:
             self.curr_data_frame_inx = 0
-        elif self.curr_data_frame_inx >= len(self.rd_plot_data_buffer):
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
+        elif self.curr_data_frame_inx >= len(self.history):
+            self.curr_data_frame_inx = len(self.history) - 1
 
-        self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+        self.draw_buffered_frame(self.curr_data_frame_inx)
         self.currFrameLEdit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
     def toggle_pause(self):
@@ -533,18 +542,18 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
     def exit(self):
         if self.shm_on_exit is not None:
             self.shm_on_exit()
-        pg.exit()
+        self.history.close() # the spill file, the host process may live on
+        if not self.hosted:
+            pg.exit()
     
     def handle_first_setup(self, setup_dict: dict):
         self.first_setup_dict = setup_dict
         if "num_saved_frames" in setup_dict:
-            self.num_saved_frames = setup_dict["num_saved_frames"]
-            if self.num_saved_frames < 0:
-                self.num_saved_frames = 100_000
-            else:
-                self.num_saved_frames = int(self.num_saved_frames)
-
-        self._drop_frames_threshold = self.num_saved_frames + self.first_setup_dict["fps"]*5
+            # < 0 leaves only the MaxBufferedBytes cap
+            self.num_saved_frames = int(setup_dict["num_saved_frames"])
+            if self.num_saved_frames == 0:
+                self.num_saved_frames = 1
+        self.history.configure(setup_dict, self.num_saved_frames)
 
         self.dc_smooth_coeff = self.first_setup_dict.get("dc_smooth_coeff", None)
 
@@ -644,7 +653,13 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
     
         return self.linear_thresh_vec
         
-    def receive_data(self, data: RadarDirectBeamData | dict):
+    def receive_data(self, data: RadarDirectBeamData | dict | list):
+
+        # batch of frames from send_batch()
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
 
         # setup
         if self.first_setup_dict is None:
@@ -655,50 +670,58 @@ class RadarDirectBeamPlotter(Ui_multiRangeDoppWin):
         if self.first_timestamp is None:
             self.first_timestamp = data.timestamp
 
-        self.rd_plot_data_buffer.append(data)
+        self.history.append(data)
         self.frame_received_counter += 1
 
     def update(self):
-        if not len(self.rd_plot_data_buffer):
+        if not len(self.history):
             return
 
-        if not self.paused:
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
-            if self.rd_plot_data is not self.rd_plot_data_buffer[self.curr_data_frame_inx]:
-                self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
-
-        # Limit the buffer size to avoid memory issues
-        if len(self.rd_plot_data_buffer) > self._drop_frames_threshold:
-            oldlen = len(self.rd_plot_data_buffer)
-            self.rd_plot_data_buffer = self.rd_plot_data_buffer[-self.num_saved_frames:]
-            num_removed = oldlen - len(self.rd_plot_data_buffer)
+        # frames the history overwrote since the last update
+        num_removed = self.history.evicted - self.evicted_seen
+        if num_removed:
+            self.evicted_seen = self.history.evicted
             self.frame_dropped_counter += num_removed
-            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.rd_plot_data_buffer)-1)
+            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx - num_removed, 0, len(self.history)-1)
             self.set_label_curr_frame()
 
-        if self.curr_label_frame_max != len(self.rd_plot_data_buffer):
-            self.curr_label_frame_max = len(self.rd_plot_data_buffer)
+        if not self.paused:
+            self.curr_data_frame_inx = len(self.history) - 1
+            if self.drawn_frame_id != self.history.frame_id(self.curr_data_frame_inx):
+                self.draw_buffered_frame(self.curr_data_frame_inx)
+
+        if self.curr_label_frame_max != len(self.history):
+            self.curr_label_frame_max = len(self.history)
             self.set_label_curr_frame()
         
         self.set_label_time()
 
+    def draw_buffered_frame(self, index: int):
+        self.drawn_frame_id = self.history.frame_id(index)
+        self.draw_data_frame(self.history[index])
+
     def draw_data_frame(self, frame: RadarDirectBeamData):
         
         self.rd_plot_data = frame
+        # own copy, the history row can be overwritten while paused on it
+        power_beam_db = as_db(frame.power_beam_data)
+        if self.power_beam_db is None or self.power_beam_db.shape != power_beam_db.shape:
+            self.power_beam_db = np.empty_like(power_beam_db)
+        self.power_beam_db[:] = power_beam_db
 
         # generate power and phase beam data if there arent any
 
         if self.linear_thresh_vec is not None:
             if self._buff_for_beam_thresh is None:
-                self._buff_for_beam_thresh = np.empty_like(frame.power_beam_data)
+                self._buff_for_beam_thresh = np.empty_like(self.power_beam_db)
 
-            self._buff_for_beam_thresh[:] = frame.power_beam_data
+            self._buff_for_beam_thresh[:] = self.power_beam_db
 
             self._buff_for_beam_thresh[self._buff_for_beam_thresh < self.linear_thresh_vec] = -200.0
             
             self.beam_plotter.update_data(self._buff_for_beam_thresh)
         else:
-            self.beam_plotter.update_data(frame.power_beam_data)
+            self.beam_plotter.update_data(self.power_beam_db)
         
         self.draw_angle_slices()
         self.draw_range_slices()
@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+
+from Utils.db_payload import QuantizedDb
+
+# Frame types shared by the node and the plotter, kept free of Qt so the
+# SignalFlow process does not load it
+
+@dataclass
+class RadarDirectBeamData:
+    power_beam_data: np.ndarray | QuantizedDb
+    timestamp      : float
+    seq_num        : int
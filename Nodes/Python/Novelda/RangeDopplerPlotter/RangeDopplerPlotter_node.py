@@ -1,17 +1,14 @@
 from __future__ import annotations
 
-import sys
-import subprocess
-import time
-import os
-import tempfile
 import numpy as np
 from pathlib import Path
 
 import PySignalFlow as psf
 
-from Utils.sharedmem_handler import SharedMemSender
-from RangeDopplerPlotter.RangeDopplerPlotter_plotter import *
+from Utils.plot_node_base import PlotNodeBase
+from Utils.db_payload import DB_PAYLOAD_FLOAT32, quantize_db, db_lims_usable
+from Utils.iq_kernels import iq_power, power_to_db
+from RangeDopplerPlotter.rd_types import RDRawSetup, RDRawPlotData
 
 SIGNAL_SEMANTIC_RANGEDOPPLER = "rangedoppler"
 ARRAY_SEMANTIC_RANGEDOPPLER_POWER_AGGREGATED_RAWCHANNELS = "rangedoppler_power_aggregated_rawchannels"
@@ -20,7 +17,7 @@ ARRAY_SEMANTIC_RADAR_TRXMASK = "radar_trx_mask"
 
 DEFAULT_START_RANGE = 0.4  # meters
 
-class RangeDopplerPlotter:
+class RangeDopplerPlotter(PlotNodeBase):
     def __init__(self, *_):
         self.initialized = False
 
@@ -34,11 +31,18 @@ class RangeDopplerPlotter:
 
         self.z_lim_vec = np.array([-70.0, 10.0])
 
+        self.crop_range = True # only send the range bins inside XLimVec
+        self.plot_tx_channels = np.array([], dtype=int) # physical TX to send, empty for all
+        self.plot_rx_channels = np.array([], dtype=int) # RX to send, empty for all
+
+        self.rd_setup: RDRawSetup = None
+
     def set_parameters(self, context, params, sections):
         for section in sections:
             if section not in params:
                 continue
             curr_sec = params[section]
+            self.set_transport_parameters(curr_sec)
 
             if "FPS" in curr_sec:
                 self.fps = float(np.array(curr_sec["FPS"])[0])
@@ -74,6 +78,12 @@ class RangeDopplerPlotter:
                         self.x_lim_vec = newxlim
                 except Exception as e:
                     pass
+            if "CropRange" in curr_sec:
+                self.crop_range = np.array(curr_sec["CropRange"], dtype=bool)[0]
+            if "PlotTxChannels" in curr_sec:
+                self.plot_tx_channels = np.array(curr_sec["PlotTxChannels"], dtype=int).flatten()
+            if "PlotRxChannels" in curr_sec:
+                self.plot_rx_channels = np.array(curr_sec["PlotRxChannels"], dtype=int).flatten()
             if "YLimVec" in curr_sec:
                 try:
                     newylim = np.array(curr_sec["YLimVec"])
@@ -84,37 +94,18 @@ class RangeDopplerPlotter:
 
     def buildup(self):
 
-        MAX_RANGE_BINS = 192
-        MAX_AGGREGATED_FRAMES = 4
-        BYTES_PER_FLOAT = 4
-
-        # + 50_000 to make sure theres space
-        self.shm_blocksize = self.fft_size * MAX_RANGE_BINS * MAX_AGGREGATED_FRAMES * BYTES_PER_FLOAT + 50_000
-        
         self.shm_numblocks = 10 # a lot of blocks to speed up playback loading
         self.convert2pwr = True
 
-        # put verbose=False when released
-        self.sharedmem_sender = SharedMemSender(self.shm_blocksize, self.shm_numblocks, verbose=True)
-
-        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
-        self.close_path = closesig_file.name
-        closesig_file.close()
+        if self.db_payload_type != DB_PAYLOAD_FLOAT32 and not db_lims_usable(self.z_lim_vec):
+            print("DbPayloadType needs ZLimVec (min < max) to clamp to, sending float32")
+            self.db_payload_type = DB_PAYLOAD_FLOAT32
 
-        # start plotting process
-        worker_script = str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py")
-        self.plotting_process = subprocess.Popen([
-            sys.executable,  # Use the same Python executable
-            worker_script,
-            self.sharedmem_sender.sharedmem.name,
-            f"{self.shm_blocksize}",
-            f"{self.shm_numblocks}",
-            self.close_path
-        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
+        # the transport is sized from the first frame
+        self.prepare_plotting_process(str(Path(__file__).resolve().parent / "x7plotting_proc_runner.py"),
+                                      "RangeDopplerPlotter.RangeDopplerPlotter_plotter:RangeDopplerPlotter")
 
-        for line in self.plotting_process.stdout:
-            if line.strip() == "PLOTTING_PROCESS_READY":
-                break
+    def make_setup(self):
 
         param_dict = {
             "fps" : self.fps,
@@ -142,25 +133,42 @@ class RangeDopplerPlotter:
             if self.y_lim_vec.size == 2:
                 param_dict["y_lim_vec"] = self.y_lim_vec
 
-        self.send_data(param_dict)
-
-    def send_data(self, data):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.send_data(data): # busy wait for max speed for huge playback files
-            if time.time() - now > max_wait:
-                print("Shared memory sender timed out, exiting process")
-                self.teardown()
-                return
-
-    def extract_rangedoppler_data(self, frame):
-
+        # same for every frame, sent once instead of with each one
+        param_dict["rd_setup"] = self.rd_setup
+
+        return param_dict
+
+    def range_roi(self, num_bins_range: int) -> slice:
+        """Range bins covering XLimVec, all of them without it or with CropRange off"""
+        if not self.crop_range or not hasattr(self, "x_lim_vec"):
+            return slice(0, num_bins_range)
+        start = int(np.floor((self.x_lim_vec[0] - self.range_offset) / self.bin_length))
+        stop = int(np.ceil((self.x_lim_vec[1] - self.range_offset) / self.bin_length)) + 1
+        start = min(max(start, 0), num_bins_range - 1)
+        stop = min(max(stop, start + 1), num_bins_range)
+        return slice(start, stop)
+
+    def selected_channels(self, trx_mask: np.ndarray, num_rx: int) -> tuple[np.ndarray, np.ndarray]:
+        """TX loop and RX indices to send, from PlotTxChannels and PlotRxChannels"""
+        tx_loops = np.arange(trx_mask.shape[0])
+        if self.plot_tx_channels.size:
+            tx_loops = tx_loops[np.isin(trx_mask[:, 1], self.plot_tx_channels)]
+        rx_channels = np.arange(num_rx)
+        if self.plot_rx_channels.size:
+            rx_channels = rx_channels[np.isin(rx_channels, self.plot_rx_channels)]
+        return tx_loops, rx_channels
+
+    def extract_rangedoppler_data(self, frame, slot=0) -> tuple[RDRawPlotData, RDRawSetup | None]:
+        """
+        Plot data of one frame, and the setup it implies until the node has
+        one. Writes no node state, frames of a batch can be converted in parallel.
+        """
         if self.convert2pwr:
-            self.current_data = np.asarray(
+            current_data = np.asarray(
                 frame[SIGNAL_SEMANTIC_RANGEDOPPLER][ARRAY_SEMANTIC_RANGEDOPPLER_POWER_AGGREGATED_RAWCHANNELS]
             )
         else:
-            self.current_data = np.asarray(
+            current_data = np.asarray(
                 frame[SIGNAL_SEMANTIC_RANGEDOPPLER][ARRAY_SEMANTIC_RANGEDOPPLER_IQ_AGGREGATED_RAWCHANNELS]
             )
 
@@ -168,83 +176,81 @@ class RangeDopplerPlotter:
             frame[SIGNAL_SEMANTIC_RANGEDOPPLER][ARRAY_SEMANTIC_RADAR_TRXMASK]
         )
 
-        self.num_tx_channels, self.num_rx_channels, self.num_bins_range, self.num_bins_doppler = self.current_data.shape
-
-        # prepare container for per (physical_tx, rx) power matrices
-        per_channel_data = {}
-
-        for tx_loop in range(self.num_tx_channels):
-            physical_tx = int(trx_mask[tx_loop, 1])  # already 0-based (assumption)
-
-            for rx in range(self.num_rx_channels):
-                rd_slice = self.current_data[tx_loop, rx, :, :]  # shape (range, doppler or doppler*2 for IQ)
-
-                if not self.convert2pwr:
-                    i_comp = rd_slice[:, 0::2]
-                    q_comp = rd_slice[:, 1::2]
-                    rd_slice = i_comp * i_comp + q_comp * q_comp
-                    if rx == 0 and tx_loop == 0:  # adjust doppler bins once
-                        self.num_bins_doppler = rd_slice.shape[1]
-
-                if not self.plot_linear_scale:
-                    rd_slice[rd_slice == 0] = 1e-16
-                    rd_slice = 10 * np.log10(rd_slice)
-
-                per_channel_data[(physical_tx, rx)] = rd_slice
-
-        # make setup info
-        rd_setup = RDRawSetup(
-            num_tx_channels  = self.num_tx_channels,
-            num_rx_channels  = self.num_rx_channels,
-            num_bins_range   = self.num_bins_range,
-            num_bins_doppler = self.num_bins_doppler,
-            fps              = self.fps,
-            fft_size         = self.fft_size,
-            range_offset     = self.range_offset,
-            bin_length       = self.bin_length,
-            zlim_vec         = self.z_lim_vec,
-            convert2pwr      = self.convert2pwr,
-        )
+        # crop to the range ROI and channel subset before any conversion, the
+        # range crop is a view, the channel selection only copies what is kept
+        range_bins = self.range_roi(current_data.shape[2])
+        power = current_data[:, :, range_bins]
+        tx_loops, rx_channels = self.selected_channels(trx_mask, power.shape[1])
+        if tx_loops.size != power.shape[0]:
+            power = power[tx_loops]
+        if rx_channels.size != power.shape[1]:
+            power = power[:, rx_channels]
+
+        num_tx_channels, num_rx_channels, num_bins_range, num_bins_doppler = power.shape
+
+        # whole [tx, rx, range, doppler] array at once, the input is never written to
+        input_power = power
+        if not self.convert2pwr:
+            # doppler bins are interleaved I/Q
+            num_bins_doppler //= 2
+            shape = power.shape[:3] + (num_bins_doppler,)
+            i_comp = power[..., 0::2]
+            q_comp = power[..., 1::2]
+            power = iq_power(i_comp, q_comp, self.frame_buffer(slot, "power", shape),
+                             self.frame_buffer(slot, "q_power", shape))
+
+        rd_data = power
+        if not self.plot_linear_scale:
+            # in place when power is already our own buffer
+            rd_data = power if power is not input_power else self.frame_buffer(slot, "db", power.shape)
+            power_to_db(power, out=rd_data)
+            rd_data = quantize_db(rd_data, self.z_lim_vec, self.db_payload_type)
+        elif self.plot_sender_thread and rd_data is input_power:
+            # linear power straight from the frame, it has to outlive process()
+            rd_data = rd_data.copy()
+
+        # per (physical_tx, rx) power matrices, views into rd_data
+        per_channel_data = {
+            (int(trx_mask[tx_loop, 1]), int(rx)) : rd_data[i, j] # physical tx already 0-based (assumption)
+            for i, tx_loop in enumerate(tx_loops)
+            for j, rx in enumerate(rx_channels)
+        }
+
+        rd_setup = None
+        if self.rd_setup is None:
+            rd_setup = RDRawSetup(
+                num_tx_channels  = num_tx_channels,
+                num_rx_channels  = num_rx_channels,
+                num_bins_range   = num_bins_range,
+                num_bins_doppler = num_bins_doppler,
+                fps              = self.fps,
+                fft_size         = self.fft_size,
+                range_offset     = self.range_offset + range_bins.start * self.bin_length, # first cropped bin
+                bin_length       = self.bin_length,
+                zlim_vec         = self.z_lim_vec,
+                convert2pwr      = self.convert2pwr,
+            )
 
-        # make the full data struct
-        # no need to put in the setup info every single time, but compared to the size of the total data
-        # and total processing the info struct is insignificant
         rd_plot_data = RDRawPlotData(
-            RDRawSetup=rd_setup,
             rd_dict_data=per_channel_data,
             trx_mask=trx_mask,
             timestamp=frame.timestamp,
             seq_num=frame.sequence_number
         )
 
-        # Store for later use and return
-        self.rd_plot_data = rd_plot_data
-        return rd_plot_data
-
-    def teardown(self):
-        max_wait = 2
-        now = time.time()
-        while not self.sharedmem_sender.are_all_read():
-            time.sleep(0.1)
-            if time.time() - now > max_wait:
-                break
-
-        if os.path.exists(self.close_path):
-            os.remove(self.close_path)
-        self.sharedmem_sender.cleanup()
+        return rd_plot_data, rd_setup
 
     def process(self, sf):
 
         # Exit if plotting subprocess has closed
-        if self.plotting_process.poll() is not None:
-            return None, psf.ProcessResult.EndOfData
-        
-        if not self.sharedmem_sender.check_buff_exists():
+        if self.plotting_closed():
             return None, psf.ProcessResult.EndOfData
 
-        for i in range(len(sf)):
-            frame = sf[i]
-            self.extract_rangedoppler_data(frame)
-            self.send_data(self.rd_plot_data)
+        frames = self.limit_plot_rate([sf[i] for i in range(len(sf))])
+        extracted = self.map_frames(self.extract_rangedoppler_data, frames)
+        if self.rd_setup is None and extracted:
+            # on the flow thread, before the first send puts it in the setup
+            self.rd_setup = extracted[0][1]
+        self.send_batch([rd_plot_data for rd_plot_data, _ in extracted])
 
         return None, psf.ProcessResult.Continue
\ No newline at end of file
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import time
 import numpy as np
-from dataclasses import dataclass
 from pathlib import Path
 
 import pyqtgraph as pg
@@ -11,33 +10,13 @@ from pyqtgraph.Qt.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QVBoxLayout, QHBoxLayout, QLabel, QSlider, QLineEdit,
     QPushButton, QApplication, QCheckBox
     )
-from pyqtgraph.Qt.QtGui import QDoubleValidator, QIcon, QImage, QPalette, QColor
+from pyqtgraph.Qt.QtGui import QDoubleValidator, QRegularExpressionValidator, QIcon, QImage, QPalette, QColor
 import pyqtgraph.Qt.QtCore as QtCore
 
 from RangeDopplerPlotter.surface_plot_widget import Matrix3DPlot, AxisConfig, CameraState
-
-ALL_TX_OFF = 2**16-1
-
-@dataclass
-class RDRawSetup:
-    num_tx_channels : int
-    num_rx_channels : int
-    num_bins_range  : int
-    num_bins_doppler: int
-    fps             : int
-    fft_size        : int
-    range_offset    : float
-    bin_length      : float
-    zlim_vec        : np.ndarray[float, 2]
-    convert2pwr     : bool
-
-@dataclass
-class RDRawPlotData:
-    RDRawSetup: RDRawSetup
-    rd_dict_data   : dict[tuple[int, int], np.ndarray] # for tx0rx0, (0,0) : dataArray
-    trx_mask  : np.ndarray
-    timestamp : float
-    seq_num   : int
+from Utils.db_payload import as_db
+from RangeDopplerPlotter.rd_types import ALL_TX_OFF, RDRawSetup, RDRawPlotData
+from Utils.frame_history import FrameHistory, DEFAULT_HISTORY_BYTES, SEEK_PATTERN, SEEK_HELP, seek_frame
 
 class KeyPressFilter(QtCore.QObject):
     def __init__(self, callback):
@@ -69,10 +48,11 @@ class PlotMainWin(QMainWindow):
 
 class RangeDopplerPlotter:
 
-    def __init__(self, shm_on_exit=None):
+    def __init__(self, shm_on_exit=None, hosted=False):
         self.plot = None
         self.plot_linear_scale: bool       = False
         self.shm_on_exit = shm_on_exit
+        self.hosted = hosted # other plotters share the process, closing must not end it
 
         self.x_lim_vec: np.ndarray = None
         self.y_lim_vec: np.ndarray = None
@@ -90,6 +70,8 @@ class RangeDopplerPlotter:
         self.num_saved_frames = 100
 
         self.paused = False
+        self.info_text = "" # set_label_info() text, render stats go below it
+        self.render_stats = ""
         self.curr_data_frame_inx = 0
         self.curr_label_frame_max = 0
 
@@ -102,8 +84,10 @@ class RangeDopplerPlotter:
         self.frame_received_counter = 0
         self.frame_dropped_counter = 0
 
-        # timestamp received : RDRawPlotData
-        self.rd_plot_data_buffer: list[RDRawPlotData] = []
+        # received RDRawPlotData frames, oldest first
+        self.history = FrameHistory(DEFAULT_HISTORY_BYTES, self.num_saved_frames)
+        self.drawn_frame_id = None
+        self.evicted_seen = 0
         self.plot_dict: dict[tuple[int, int], Matrix3DPlot] = {}
 
         self.range_axis = AxisConfig("Range", "m", 0, 100, 100)
@@ -137,7 +121,7 @@ class RangeDopplerPlotter:
 
     def init_window(self):
         if self.app is None:
-            self.app = QApplication([])
+            self.app = QApplication.instance() or QApplication([])
         if self.mainwin is not None:
             return
         
@@ -256,6 +240,8 @@ class RangeDopplerPlotter:
 
         _, self.frame_lineedit, self.frame_buffered_label = self.make_double_lineedit(
             controls_right_vbox, "Current RD Plot / total buffered:", "/", width=80)
+        self.frame_lineedit.setValidator(QRegularExpressionValidator(QtCore.QRegularExpression(SEEK_PATTERN)))
+        self.frame_lineedit.setToolTip(SEEK_HELP)
 
         # reset limits button, grid label, grid checkbox
         reset_wiref_check_w = QWidget(self.mainwidget)
@@ -329,11 +315,11 @@ class RangeDopplerPlotter:
         if not self.initialized:
             return
         
-        curr_frame = int(self.frame_lineedit.text()) - 1
-        if 0 <= curr_frame < len(self.rd_plot_data_buffer):
+        curr_frame = seek_frame(self.frame_lineedit.text(), self.history.seek, self.first_timestamp)
+        if curr_frame is not None and 0 <= curr_frame < len(self.history):
             self.paused = True
             self.curr_data_frame_inx = curr_frame
-            self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+            self.draw_buffered_frame(self.curr_data_frame_inx)
         else:
             self.frame_lineedit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
@@ -341,8 +327,8 @@ class RangeDopplerPlotter:
         if self.first_timestamp is None or not self.initialized:
             return
 
-        curr_frame_ts = self.rd_plot_data_buffer[self.curr_data_frame_inx].timestamp
-        curr_frame_seq = self.rd_plot_data_buffer[self.curr_data_frame_inx].seq_num
+        curr_frame_ts = self.history.timestamp(self.curr_data_frame_inx)
+        curr_frame_seq = self.history.seq_num(self.curr_data_frame_inx)
         timetxt = time.strftime('%Y.%m.%d %H:%M:%S', time.localtime(curr_frame_ts/1000))
         rel_time_txt = (curr_frame_ts - self.first_timestamp)/1000
         self.time_label.setText(f"{timetxt}\nSince Start: {rel_time_txt:.1f}s\nSequence number: {curr_frame_seq}"
@@ -373,12 +359,11 @@ class RangeDopplerPlotter:
         fps = self.first_setup_dict["fps"]
         enable_dc_removal = self.first_setup_dict["enable_dc_removal"]
         is_live = self.first_setup_dict.get("is_live", True)
-        self.infolabel.setText(
-            (f"FPS: {fps}"
+        self.info_text = (f"FPS: {fps}"
             f"\nRangeDoppler integration time: {num_frames_in_pd/fps:.1f} s"
             f"\nRangeDoppler update rate: {frames_btw_pd/fps:.1f} s"
             f"\nEnable DC Removal: {enable_dc_removal}")
-        )
+        self.infolabel.setText(self.info_text + self.render_stats)
 
         liveplay_color = "#82f17e" if is_live else "#369ee4"
         liveplay_text = "Live" if is_live else "Playback"
@@ -391,6 +376,12 @@ class RangeDopplerPlotter:
         """)
         self.live_or_playback_label.setText(liveplay_text)
             
+    def show_render_stats(self, text: str):
+        """Redraw pacing stats from ShmPlotPump, shown under the info text"""
+        self.render_stats = f"\n{text}"
+        if self.info_text:
+            self.infolabel.setText(self.info_text + self.render_stats)
+
     def set_label_curr_frame(self):
         self.frame_lineedit.setText(f"{int(self.curr_data_frame_inx + 1)}")
         self.frame_buffered_label.setText(f"/ {self.curr_label_frame_max}")
@@ -471,16 +462,16 @@ class RangeDopplerPlotter:
             plot.switch_cam_state(state)
 
     def move_frame(self, direction: int):
-        if not self.initialized or len(self.rd_plot_data_buffer) <= 1:
+        if not self.initialized or len(self.history) <= 1:
             return
         self.paused = True
         self.curr_data_frame_inx += direction
         if self.curr_data_frame_inx < 0:
             self.curr_data_frame_inx = 0
-        elif self.curr_data_frame_inx >= len(self.rd_plot_data_buffer):
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
+        elif self.curr_data_frame_inx >= len(self.history):
+            self.curr_data_frame_inx = len(self.history) - 1
 
-        self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
+        self.draw_buffered_frame(self.curr_data_frame_inx)
         self.frame_lineedit.setText(f"{int(self.curr_data_frame_inx + 1)}")
 
     def toggle_pause(self):
@@ -497,7 +488,9 @@ class RangeDopplerPlotter:
     def exit(self):
         if self.shm_on_exit is not None:
             self.shm_on_exit()
-        pg.exit()
+        self.history.close() # the spill file, the host process may live on
+        if not self.hosted:
+            pg.exit()
 
     def change_range_lims(self, xlim_min, xlim_max):
         if self.range_axis.min_val != xlim_min or self.range_axis.max_val != xlim_max:
@@ -522,58 +515,65 @@ class RangeDopplerPlotter:
 
         return new_plot
 
-    def receive_data(self, data: RDRawPlotData | dict):
+    def receive_data(self, data: RDRawPlotData | dict | list):
+
+        # batch of frames from send_batch()
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
 
         # setup
         if isinstance(data, dict):
             self.first_setup_dict = data
+            if data.get("rd_setup") is not None:
+                self.rd_setup = data["rd_setup"]
             self.set_label_info()
             if "fps" in data and "num_frames_in_pd" in data:
                 fps = data["fps"]
                 framespd = data["num_frames_in_pd"]
                 self.waiting_label.setText(f"Waiting for data... expected {int(framespd/fps)} seconds after start")
             if "num_saved_frames" in data:
+                # < 0 leaves only the MaxBufferedBytes cap
                 self.num_saved_frames = data["num_saved_frames"]
-                if self.num_saved_frames < 0:
-                    self.num_saved_frames = 100_000
-                elif self.num_saved_frames < 1:
+                if self.num_saved_frames == 0:
                     self.num_saved_frames = 1
+            self.history.configure(data, self.num_saved_frames)
 
             return
 
         # data
-        if self.rd_setup is None:
-            self.rd_setup = data.RDRawSetup
-        
         if self.first_timestamp is None:
             self.first_timestamp = data.timestamp
 
-        self.rd_plot_data_buffer.append(data)
+        self.history.append(data)
         self.frame_received_counter += 1
 
     def update(self):
-        if not len(self.rd_plot_data_buffer):
+        if not len(self.history):
             return
 
-        if not self.paused:
-            self.curr_data_frame_inx = len(self.rd_plot_data_buffer) - 1
-            if not (self.rd_plot_data is self.rd_plot_data_buffer[self.curr_data_frame_inx]):
-                self.draw_data_frame(self.rd_plot_data_buffer[self.curr_data_frame_inx])
-
-        # Limit the buffer size to avoid memory issues
-        bufflim = self.num_saved_frames + 100
-        if len(self.rd_plot_data_buffer) > bufflim:
-            oldlen = len(self.rd_plot_data_buffer)
-            self.rd_plot_data_buffer = self.rd_plot_data_buffer[-self.num_saved_frames:]
-            num_removed = oldlen - len(self.rd_plot_data_buffer)
+        # frames the history overwrote since the last update
+        num_removed = self.history.evicted - self.evicted_seen
+        if num_removed:
+            self.evicted_seen = self.history.evicted
             self.frame_dropped_counter += num_removed
-            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx-num_removed, 0, len(self.rd_plot_data_buffer)-1)
+            self.curr_data_frame_inx = np.clip(self.curr_data_frame_inx-num_removed, 0, len(self.history)-1)
             self.set_label_curr_frame()
 
-        if self.curr_label_frame_max != len(self.rd_plot_data_buffer):
-            self.curr_label_frame_max = len(self.rd_plot_data_buffer)
+        if not self.paused:
+            self.curr_data_frame_inx = len(self.history) - 1
+            if self.drawn_frame_id != self.history.frame_id(self.curr_data_frame_inx):
+                self.draw_buffered_frame(self.curr_data_frame_inx)
+
+        if self.curr_label_frame_max != len(self.history):
+            self.curr_label_frame_max = len(self.history)
             self.set_label_curr_frame()
 
+    def draw_buffered_frame(self, index: int):
+        self.drawn_frame_id = self.history.frame_id(index)
+        self.draw_data_frame(self.history[index])
+
     def initialize_axes(self):
         self.x_lim_vec = np.array([0, self.rd_setup.num_bins_range * self.rd_setup.bin_length]) + self.rd_setup.range_offset
         self.y_lim_vec = np.array([-self.rd_setup.num_bins_doppler / 2, self.rd_setup.num_bins_doppler / 2 - 1]) * (self.rd_setup.fps / self.rd_setup.fft_size)
@@ -608,7 +608,7 @@ class RangeDopplerPlotter:
                 continue
 
             # Update the plot with the new data
-            plot.update_data(data_slice)
+            plot.update_data(as_db(data_slice))
 
         if not self.did_first_lims_change:
             self.did_first_lims_change = True
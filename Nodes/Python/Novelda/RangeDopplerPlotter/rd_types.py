@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+
+from Utils.db_payload import QuantizedDb
+
+# Frame types shared by the node and the plotter, kept free of Qt so the
+# SignalFlow process does not load it
+
+ALL_TX_OFF = 2**16-1
+
+@dataclass
+class RDRawSetup:
+    num_tx_channels : int
+    num_rx_channels : int
+    num_bins_range  : int
+    num_bins_doppler: int
+    fps             : int
+    fft_size        : int
+    range_offset    : float
+    bin_length      : float
+    zlim_vec        : np.ndarray[float, 2]
+    convert2pwr     : bool
+
+@dataclass
+class RDRawPlotData:
+    rd_dict_data   : dict[tuple[int, int], np.ndarray | QuantizedDb] # for tx0rx0, (0,0) : dataArray
+    trx_mask  : np.ndarray
+    timestamp : float
+    seq_num   : int
@@ -1,42 +1,30 @@
 from __future__ import annotations
 
-import os
 import sys
 
-from pyqtgraph.Qt import QtCore
-QTimer = QtCore.QTimer
-
-from Utils.sharedmem_handler import SharedMemReceiver
+from Utils.sharedmem_handler import open_shm_receiver
+from Utils.plot_proc_runner import ShmPlotPump
 from RangeDopplerPlotter.RangeDopplerPlotter_plotter import RangeDopplerPlotter
 
-def main_loop(sharedmem: SharedMemReceiver, plotter: RangeDopplerPlotter, 
-              close_path: str, poll_timer):
-
-    if not os.path.exists(close_path):
-        poll_timer.stop()
-        sharedmem.cleanup()
-        return
-        # done with receiving data
-
-    while sharedmem.check_data_ready():
-        data = sharedmem.read_objdata()
-        plotter.receive_data(data)
-
-    plotter.update()
-
-
 if __name__ == "__main__":
     shm_name       = sys.argv[1]
     shm_blocksize  = sys.argv[2]
     shm_blockcount = sys.argv[3]
     close_path     = sys.argv[4]
+    notify_port    = sys.argv[5] if len(sys.argv) > 5 else None
+    stats_log      = sys.argv[6] if len(sys.argv) > 6 else None
+    stats_interval = float(sys.argv[7]) if len(sys.argv) > 7 else 1.0
 
-    sharedmem = SharedMemReceiver(
+    sharedmem = open_shm_receiver(
         shm_name=shm_name,
         block_size=shm_blocksize,
         num_blocks=shm_blockcount,
         verbose=False
         )
+    if notify_port is not None:
+        sharedmem.connect_notify(notify_port)
+    if stats_log:
+        sharedmem.enable_stats_log(stats_log, stats_interval)
 
     plotter = RangeDopplerPlotter(shm_on_exit=sharedmem.cleanup)
     plotter.init_window()
@@ -46,11 +34,7 @@ if __name__ == "__main__":
         data = sharedmem.read_objdata()
         plotter.receive_data(data)
 
-    poll_timer = QTimer(plotter.mainwin)
-    poll_timer.timeout.connect(lambda: main_loop(sharedmem, plotter, close_path, poll_timer))
-
-    UPDATE_FREQ = 40
-    started = poll_timer.start(1000 / UPDATE_FREQ)
+    pump = ShmPlotPump(sharedmem, plotter, close_path, plotter.mainwin)
 
     # Start event loop (blocking)
     plotter.start_event_loop()
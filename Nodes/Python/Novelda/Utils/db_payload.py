@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import numpy as np
+from dataclasses import dataclass
+
+# values for the DbPayloadType node parameter
+DB_PAYLOAD_FLOAT32 = "float32" # plain dB values, default
+DB_PAYLOAD_FLOAT16 = "float16"
+DB_PAYLOAD_UINT8 = "uint8" # 256 levels, the same the colormap uses
+
+@dataclass
+class QuantizedDb:
+    """
+    dB map clamped to the plot's power limits and stored as uint8 or float16,
+    value = codes * scale + offset. The plotters keep it like this in their
+    history and only dequantize the frames they draw or read values from.
+    """
+    codes : np.ndarray
+    scale : float
+    offset: float
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __getitem__(self, index) -> QuantizedDb:
+        return QuantizedDb(self.codes[index], self.scale, self.offset)
+
+    def dequantize(self) -> np.ndarray:
+        out = self.codes.astype(np.float32)
+        out *= self.scale
+        out += self.offset
+        return out
+
+def db_lims_usable(lims) -> bool:
+    """lims can be quantized to, (min, max) with min < max. Checked once in buildup(), not per frame"""
+    return lims is not None and np.size(lims) == 2 and float(lims[0]) < float(lims[1])
+
+def quantize_db(db_data: np.ndarray, lims, payload_type: str) -> np.ndarray | QuantizedDb:
+    """
+    Clamps db_data to lims = (min, max) and quantizes it, float32 payloads are
+    returned as they are. lims must pass db_lims_usable().
+    """
+    if payload_type == DB_PAYLOAD_FLOAT32:
+        return db_data
+
+    lo, hi = float(lims[0]), float(lims[1])
+    clamped = np.clip(db_data, lo, hi)
+    clamped -= lo # float16 is most precise close to 0
+
+    if payload_type == DB_PAYLOAD_FLOAT16:
+        return QuantizedDb(clamped.astype(np.float16), 1.0, lo)
+
+    if payload_type == DB_PAYLOAD_UINT8:
+        scale = (hi - lo) / 255
+        clamped *= 1 / scale
+        return QuantizedDb(np.rint(clamped).astype(np.uint8), scale, lo)
+
+    raise ValueError(f"Unknown dB payload type {payload_type}, use {DB_PAYLOAD_FLOAT32}, {DB_PAYLOAD_FLOAT16} or {DB_PAYLOAD_UINT8}")
+
+def as_db(data: np.ndarray | QuantizedDb) -> np.ndarray:
+    """dB values of data whether it was quantized or not"""
+    if isinstance(data, QuantizedDb):
+        return data.dequantize()
+    return data
@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import time
+import tempfile
+import numpy as np
+
+from Utils.sharedmem_handler import split_arrays, join_arrays
+
+DEFAULT_HISTORY_BYTES = 1 << 30 # per plotter, for the MaxBufferedBytes node parameter
+ROW_ALIGN = 64 # array offsets in a row, so every dtype can be viewed in place
+INITIAL_RING_BYTES = 32 << 20 # first ring allocation without a frame count, grown by doubling up to the caps
+
+def _aligned(nbytes: int) -> int:
+    return (nbytes + ROW_ALIGN - 1) // ROW_ALIGN * ROW_ALIGN
+
+def _nbytes(dtype: np.dtype, shape: tuple) -> int:
+    return int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+class SeekIndex:
+    """
+    Timestamps and sequence numbers of the frames a plotter keeps, oldest
+    first, for seeking with searchsorted. Grows at the end as frames arrive,
+    drop_front() forgets the oldest ones the plotter let go of. Both are
+    sorted for a live stream; if a source restarted its sequence numbers or
+    clock the search falls back to the closest value.
+    """
+    def __init__(self):
+        self.timestamps = np.empty(1024, dtype=np.float64)
+        self.seq_nums = np.empty(1024, dtype=np.int64)
+        self.first = 0 # dropped from the front, compacted now and then
+        self.size = 0
+        self.timestamps_sorted = True
+        self.seq_nums_sorted = True
+
+    def __len__(self):
+        return self.size - self.first
+
+    def append(self, timestamp: float, seq_num: int):
+        if self.size == len(self.timestamps):
+            self._compact(max(len(self.timestamps), 2 * len(self)))
+        if len(self) > 0:
+            self.timestamps_sorted &= bool(timestamp >= self.timestamps[self.size - 1])
+            self.seq_nums_sorted &= bool(seq_num >= self.seq_nums[self.size - 1])
+        self.timestamps[self.size] = timestamp
+        self.seq_nums[self.size] = seq_num
+        self.size += 1
+
+    def _compact(self, capacity: int):
+        timestamps = np.empty(capacity, dtype=np.float64)
+        seq_nums = np.empty(capacity, dtype=np.int64)
+        timestamps[:len(self)] = self.timestamps[self.first:self.size]
+        seq_nums[:len(self)] = self.seq_nums[self.first:self.size]
+        self.timestamps, self.seq_nums = timestamps, seq_nums
+        self.size -= self.first
+        self.first = 0
+
+    def drop_front(self, num: int):
+        self.first = min(self.first + num, self.size)
+
+    def clear(self):
+        self.first = self.size = 0
+        self.timestamps_sorted = self.seq_nums_sorted = True
+
+    def _index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"frame {index} not in seek index of {len(self)}")
+        return self.first + index
+
+    def timestamp(self, index: int) -> float:
+        return float(self.timestamps[self._index(index)])
+
+    def seq_num(self, index: int) -> int:
+        return int(self.seq_nums[self._index(index)])
+
+    def index_at_time(self, timestamp: float) -> int | None:
+        """Last frame at or before timestamp (ms), the first one if all are later"""
+        if len(self) == 0:
+            return None
+        timestamps = self.timestamps[self.first:self.size]
+        if not self.timestamps_sorted:
+            return int(np.nanargmin(np.abs(timestamps - timestamp)))
+        return max(int(np.searchsorted(timestamps, timestamp, side="right")) - 1, 0)
+
+    def index_of_seq(self, seq_num: int) -> int | None:
+        """First frame with a sequence number of at least seq_num, the last one if there is none"""
+        if len(self) == 0:
+            return None
+        seq_nums = self.seq_nums[self.first:self.size]
+        if not self.seq_nums_sorted:
+            return int(np.argmin(np.abs(seq_nums - seq_num)))
+        return min(int(np.searchsorted(seq_nums, seq_num, side="left")), len(self) - 1)
+
+# what seek_frame() understands, for a QRegularExpressionValidator on the frame edits
+SEEK_PATTERN = r"\s*(#\d*|\d+(\.\d*)?s?|\d{1,2}(:\d{0,2}){1,2}(\.\d*)?)?\s*"
+SEEK_HELP = "Frame number, #<sequence number>, <seconds>s since the first frame, or a time of day HH:MM[:SS]"
+
+def clock_to_timestamp(text: str, reference: float) -> float:
+    """HH:MM[:SS.s] on the local date of reference (ms epoch) to ms epoch"""
+    parts = [float(part) for part in text.split(":")]
+    hours, minutes = parts[0], parts[1]
+    seconds = parts[2] if len(parts) > 2 else 0.0
+
+    day = time.localtime(reference / 1000)
+    midnight = time.mktime((day.tm_year, day.tm_mon, day.tm_mday, 0, 0, 0, 0, 0, -1))
+    return (midnight + hours * 3600 + minutes * 60 + seconds) * 1000
+
+def seek_frame(text: str, seek: SeekIndex, first_timestamp: float = None) -> int | None:
+    """
+    History index for what was typed in a plotter's frame edit: a 1-based
+    frame number, #<sequence number>, <seconds>s since first_timestamp, or a
+    time of day HH:MM[:SS]. None if text is none of these or there is nothing
+    to seek in.
+    """
+    text = text.strip()
+    if not text or len(seek) == 0:
+        return None
+    try:
+        if text.startswith("#"):
+            return seek.index_of_seq(int(text[1:]))
+        if ":" in text:
+            return seek.index_at_time(clock_to_timestamp(text, seek.timestamp(-1)))
+        if text.endswith("s"):
+            start = first_timestamp if first_timestamp is not None else seek.timestamp(0)
+            return seek.index_at_time(start + float(text[:-1]) * 1000)
+        return int(text) - 1
+    except ValueError:
+        return None
+
+class HistorySpill:
+    """
+    Frames evicted from a FrameHistory ring, appended to a scratch file and
+    read back through a memory map of it. The file is a temporary one in
+    directory, removed by the OS when the plotting process ends. With float16
+    the float32 arrays are stored as float16, half the disk for dB maps that
+    are quantized for display anyway.
+    """
+    def __init__(self, directory: str, float16: bool = False):
+        self.file = tempfile.TemporaryFile(dir=directory or None, prefix="x7history_", suffix=".bin")
+        self.directory = directory
+        self.float16 = float16
+        self.size = 0 # bytes written
+        self.map: np.memmap = None
+        self.records: list = [] # (offset, skeleton, [(offset, stored dtype, shape, dtype)]) per frame
+
+    def __len__(self):
+        return len(self.records)
+
+    def write(self, skeleton, layout: list, arrays: list):
+        start = self.size
+        spill_layout = []
+        self.file.seek(start)
+        for (_, dtype, shape), arr in zip(layout, arrays):
+            stored = arr.astype(np.float16) if self.float16 and dtype == np.float32 else arr
+            offset = self.size - start
+            self.file.write(np.ascontiguousarray(stored).data)
+            padded = _aligned(stored.nbytes)
+            self.file.write(bytes(padded - stored.nbytes))
+            self.size += padded
+            spill_layout.append((offset, stored.dtype, shape, dtype))
+
+        self.records.append((start, skeleton, spill_layout))
+
+    def read(self, index: int):
+        start, skeleton, spill_layout = self.records[index]
+        if self.map is None or len(self.map) < self.size:
+            # the file grew since it was last mapped
+            self.file.flush()
+            self.map = np.memmap(self.file, dtype=np.uint8, mode="r", shape=(self.size,))
+
+        arrays = []
+        for offset, stored_dtype, shape, dtype in spill_layout:
+            begin = start + offset
+            arr = self.map[begin:begin + _nbytes(stored_dtype, shape)].view(stored_dtype).reshape(shape)
+            arrays.append(arr if stored_dtype == dtype else arr.astype(dtype))
+        return join_arrays(skeleton, arrays)
+
+    def close(self):
+        self.map = None
+        self.file.close()
+
+class FrameHistory:
+    """
+    The frames a plotter keeps to scroll back through, in one ring of rows
+    instead of a list of separately allocated frames. A row holds
+    the arrays of one frame, the rest of the frame (the split_arrays skeleton)
+    is kept next to it. The timestamps and sequence numbers of all frames in
+    the history, ring and spill, are in seek, a SeekIndex.
+
+    The ring holds as many rows as fit in max_bytes, and at most max_frames
+    when that is > 0. It is sized from the first frame: max_frames rows, or
+    INITIAL_RING_BYTES worth when that is smaller or there is no frame
+    count, and doubles when full until it reaches the caps. Appending is
+    amortized O(1), once at the caps it overwrites the oldest frame, counted
+    in evicted. With a spill (see enable_spill()) the oldest
+    frame goes to disk instead and stays in the history, so keeping
+    everything is bounded by the disk rather than RAM.
+
+    Index 0 is the oldest frame, -1 the newest. Frames read back are views on
+    their row, valid until the frame is evicted; keep an index, not the frame,
+    to draw it again later. Spilled frames are read back from the file.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_HISTORY_BYTES, max_frames: int = -1):
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+
+        self.capacity = 0
+        self.row_bytes = 0
+        self.rows: np.ndarray = None # [capacity, row_bytes] uint8
+        self.skeletons: list = [] # (skeleton, [(offset, dtype, shape)]) per row
+        self.seek = SeekIndex()
+
+        self.start = 0 # row of the oldest frame
+        self.count = 0 # frames in the ring
+        self.appended = 0
+        self.evicted = 0
+        self.spill: HistorySpill = None
+
+    def __len__(self):
+        return self.num_spilled + self.count
+
+    @property
+    def num_spilled(self) -> int:
+        return 0 if self.spill is None else len(self.spill)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.rows is None else self.rows.nbytes
+
+    def capacity_for(self, row_bytes: int) -> int:
+        capacity = max(1, self.max_bytes // row_bytes)
+        if self.max_frames > 0:
+            capacity = min(capacity, self.max_frames)
+        return capacity
+
+    def _grown_capacity(self, row_bytes: int, wanted: int) -> int:
+        """Rows for a ring that should hold wanted, at least INITIAL_RING_BYTES worth, within the caps"""
+        return min(self.capacity_for(row_bytes), max(wanted, INITIAL_RING_BYTES // row_bytes, 1))
+
+    def set_limits(self, max_bytes: int = None, max_frames: int = None):
+        """New caps from the setup, keeps the newest frames that still fit"""
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if max_frames is not None:
+            self.max_frames = max_frames
+        if self.rows is not None:
+            self._reallocate(self.row_bytes, self._grown_capacity(self.row_bytes, self.capacity))
+
+    def enable_spill(self, directory: str, float16: bool = False):
+        """Frames evicted from the ring from now on go to a scratch file in directory"""
+        if self.spill is None:
+            self.spill = HistorySpill(directory, float16)
+
+    def configure(self, setup: dict, max_frames: int):
+        """Caps and spill from the setup dict a plotter got from its node"""
+        if setup.get("spill_dir"):
+            self.enable_spill(setup["spill_dir"], bool(setup.get("spill_float16", False)))
+        self.set_limits(setup.get("max_buffered_bytes", DEFAULT_HISTORY_BYTES), max_frames)
+
+    def _ring_row(self, ring_index: int) -> int:
+        return (self.start + ring_index) % self.capacity
+
+    def _locate(self, index: int) -> tuple[bool, int]:
+        """(spilled, index in the spill or ring) of a history index"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"frame {index} not in history of {len(self)}")
+        num_spilled = self.num_spilled
+        if index < num_spilled:
+            return True, index
+        return False, index - num_spilled
+
+    def _row_arrays(self, row: int) -> list:
+        _, layout = self.skeletons[row]
+        return [self._view(row, offset, dtype, shape) for offset, dtype, shape in layout]
+
+    def _evict_row(self, row: int):
+        """The frame in row leaves the ring, to the spill if there is one"""
+        if self.spill is None:
+            self.evicted += 1
+            self.seek.drop_front(1)
+            return
+        skeleton, layout = self.skeletons[row]
+        self.spill.write(skeleton, layout, self._row_arrays(row))
+
+    def _reallocate(self, row_bytes: int, capacity: int):
+        """New ring of capacity rows of row_bytes, the newest frames are copied over"""
+        keep = min(self.count, capacity)
+
+        for ring_index in range(self.count - keep):
+            self._evict_row(self._ring_row(ring_index))
+
+        rows = np.empty((capacity, row_bytes), dtype=np.uint8)
+        skeletons = [None] * capacity
+
+        for new_row, ring_index in enumerate(range(self.count - keep, self.count)):
+            row = self._ring_row(ring_index)
+            rows[new_row, :self.row_bytes] = self.rows[row]
+            skeletons[new_row] = self.skeletons[row]
+
+        self.rows, self.skeletons = rows, skeletons
+        self.capacity, self.row_bytes = capacity, row_bytes
+        self.start, self.count = 0, keep
+
+    def append(self, frame):
+        arrays = []
+        skeleton = split_arrays(frame, arrays, min_bytes=0) # every numeric array goes in the row
+
+        layout = []
+        offset = 0
+        for _, arr in arrays:
+            layout.append((offset, arr.dtype, arr.shape))
+            offset += _aligned(arr.nbytes)
+
+        # first frame, or one with more array data than the rows have room for
+        if self.rows is None or offset > self.row_bytes:
+            row_bytes = _aligned(max(offset, 1))
+            self._reallocate(row_bytes, self._grown_capacity(row_bytes, self.count))
+        elif self.count == self.capacity and self.capacity < self.capacity_for(self.row_bytes):
+            self._reallocate(self.row_bytes, self._grown_capacity(self.row_bytes, 2 * self.capacity))
+
+        if self.count < self.capacity:
+            row = self._ring_row(self.count)
+            self.count += 1
+        else:
+            row = self.start
+            self._evict_row(row)
+            self.start = (self.start + 1) % self.capacity
+
+        for (offset, dtype, shape), (_, arr) in zip(layout, arrays):
+            np.copyto(self._view(row, offset, dtype, shape), arr)
+        self.skeletons[row] = (skeleton, layout)
+        self.seek.append(getattr(frame, "timestamp", np.nan), getattr(frame, "seq_num", -1))
+        self.appended += 1
+
+    def _view(self, row: int, offset: int, dtype: np.dtype, shape: tuple) -> np.ndarray:
+        return self.rows[row, offset:offset + _nbytes(dtype, shape)].view(dtype).reshape(shape)
+
+    def __getitem__(self, index: int):
+        spilled, i = self._locate(index)
+        if spilled:
+            return self.spill.read(i)
+        row = self._ring_row(i)
+        skeleton, _ = self.skeletons[row]
+        return join_arrays(skeleton, self._row_arrays(row))
+
+    def frame_id(self, index: int) -> int:
+        """Number of the frame since the history was created, stays the same while the ring moves"""
+        if index < 0:
+            index += len(self)
+        return self.evicted + index
+
+    def index_of(self, frame_id: int) -> int | None:
+        """Current index of a frame_id(), None once it was evicted"""
+        index = frame_id - self.evicted
+        return index if 0 <= index < len(self) else None
+
+    def timestamp(self, index: int) -> float:
+        return self.seek.timestamp(index)
+
+    def seq_num(self, index: int) -> int:
+        return self.seek.seq_num(index)
+
+    def clear(self):
+        self.evicted += len(self)
+        self.start = 0
+        self.count = 0
+        self.skeletons = [None] * self.capacity
+        self.seek.clear()
+        if self.spill is not None:
+            # a fresh scratch file, the old one goes away with its frames
+            directory, float16 = self.spill.directory, self.spill.float16
+            self.spill.close()
+            self.spill = HistorySpill(directory, float16)
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
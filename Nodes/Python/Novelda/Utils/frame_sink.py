@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import time
+import pickle
+import importlib
+import numpy as np
+
+from Utils.sharedmem_handler import ShmBatch, split_arrays, join_arrays
+
+# values for the PlotSink node parameter
+SINK_NULL = "null" # count and drop, for the node side throughput ceiling
+SINK_NPY = "npy" # npy:<path>, every record appended to one file, see read_npy_frames()
+SINK_CALLBACK = "callback" # callback:<module>:<function>, called with each record
+
+class FrameSink:
+    """
+    Where a headless plot node puts its records instead of the plotting
+    process. Gets the setup dict once, then every record the node would have
+    sent: a frame, or a ShmBatch of the frames of one process() call.
+    """
+    def __init__(self):
+        self.records = 0
+        self.frames = 0
+        self.started = None
+
+    def write_setup(self, setup: dict):
+        pass
+
+    def write(self, record):
+        if self.started is None:
+            self.started = time.perf_counter()
+        self.records += 1
+        self.frames += len(record) if type(record) is ShmBatch else 1
+
+    def close(self):
+        pass
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        rate = self.frames / elapsed if elapsed > 0 else 0.0
+        return f"{self.frames} frames in {self.records} records, {rate:.1f} frames/s"
+
+class NullSink(FrameSink):
+    pass
+
+class NpyAppendSink(FrameSink):
+    """
+    Appends every record to one file as consecutive .npy arrays: the number of
+    arrays, the pickled skeleton and then the raw arrays, like the typed array
+    payloads of the shared memory transport. Read back with read_npy_frames().
+    """
+    def __init__(self, path: str):
+        super().__init__()
+        self.file = open(path, "wb")
+
+    def _append(self, obj):
+        arrays = []
+        skeleton = split_arrays(obj, arrays)
+        np.save(self.file, np.array([len(arrays)], dtype=np.int64))
+        np.save(self.file, np.frombuffer(pickle.dumps(skeleton, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8))
+        for _, arr in arrays:
+            np.save(self.file, arr)
+
+    def write_setup(self, setup: dict):
+        self._append(setup)
+
+    def write(self, record):
+        super().write(record)
+        self._append(record)
+
+    def close(self):
+        self.file.close()
+
+def read_npy_frames(path: str):
+    """Yields the records of an NpyAppendSink file, the setup dict first"""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                num_arrays = int(np.load(f)[0])
+            except (EOFError, ValueError):
+                return # end of file
+            skeleton = pickle.loads(np.load(f).tobytes())
+            arrays = [np.load(f) for _ in range(num_arrays)]
+            yield join_arrays(skeleton, arrays)
+
+class CallbackSink(FrameSink):
+    """
+    Calls callback(record) for every record. Arrays in it can be conversion
+    buffers the node reuses, copy what you keep past the call.
+    """
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def write(self, record):
+        super().write(record)
+        self.callback(record)
+
+def make_frame_sink(spec: str) -> FrameSink:
+    """Sink for a PlotSink parameter value: null, npy:<path> or callback:<module>:<function>"""
+    kind, _, target = spec.partition(":")
+    kind = kind.lower()
+
+    if kind == SINK_NULL:
+        return NullSink()
+
+    if kind == SINK_NPY and target:
+        return NpyAppendSink(target)
+
+    if kind == SINK_CALLBACK and ":" in target:
+        module_name, function_name = target.rsplit(":", 1)
+        return CallbackSink(getattr(importlib.import_module(module_name), function_name))
+
+    raise ValueError(f"Unknown plot sink {spec}, use {SINK_NULL}, {SINK_NPY}:<path> or {SINK_CALLBACK}:<module>:<function>")
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import numpy as np
+
+# Magnitude and dB of I/Q data in float32, written into caller owned buffers.
+# Work on whole [rx, ...] or [beam, ...] arrays at once, with I and Q passed as
+# views so no complex temporaries are made.
+
+POWER_FLOOR = 1e-16 # no log of 0
+
+def iq_magnitude(i_comp: np.ndarray, q_comp: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """|I + jQ|"""
+    return np.hypot(i_comp, q_comp, out=out)
+
+def iq_power(i_comp: np.ndarray, q_comp: np.ndarray, out: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """I^2 + Q^2, scratch has the shape of out"""
+    np.multiply(i_comp, i_comp, out=out)
+    out += np.multiply(q_comp, q_comp, out=scratch)
+    return out
+
+def power_to_db(power: np.ndarray, out: np.ndarray, floor: float = POWER_FLOOR) -> np.ndarray:
+    """10*log10(power), out may be power itself"""
+    np.maximum(power, floor, out=out)
+    np.log10(out, out=out)
+    out *= 10
+    return out
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+# Import time of each SignalFlow node module in a fresh interpreter, and
+# whether it dragged in Qt or OpenGL. The node modules only need the frame
+# types, the plotters are imported by the plotting process.
+#
+#   python Utils/node_import_time.py [module ...]
+#
+# Exits with 1 if a node fails to import or imports a GUI module, so it can
+# gate a build.
+
+NOVELDA_DIR = str(Path(__file__).resolve().parent.parent)
+
+NODE_MODULES = [
+    "BasebandPlotter.BasebandPlotter_node",
+    "BasebandPlotter.radar_direct_param_node",
+    "RangeDopplerPlotter.RangeDopplerPlotter_node",
+    "MultiRangeDopplerPlotter.MultiRangeDoppler_node",
+    "MultiRangeDopplerPlotter.multi_rd_param_node",
+    "RadarDirectBeamPlot.RadarDirectBeamPlot_node",
+    "RadarDirectBeamPlot.radardirect_beam_param_node",
+    "Presence2DPlotter.Presence2DPlotter_node",
+]
+
+GUI_MODULES = ["PySide6", "PyQt5", "PyQt6", "pyqtgraph", "OpenGL"]
+
+# run in the child, prints one json line
+MEASURE = """
+import sys, json, time
+sys.path.insert(0, {path!r})
+before = set(sys.modules)
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = set(sys.modules) - before
+print(json.dumps({{
+    "seconds": elapsed,
+    "modules": len(loaded),
+    "gui": sorted(name for name in loaded if name.split(".")[0] in {gui!r}),
+}}))
+"""
+
+def measure(module: str) -> dict:
+    code = MEASURE.format(path=NOVELDA_DIR, module=module, gui=GUI_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(modules: list[str]) -> int:
+    failed = False
+    for module in modules:
+        m = measure(module)
+        if "error" in m:
+            print(f"{module:50s} failed: {m['error']}")
+            failed = True
+            continue
+        gui = {name.split(".")[0] for name in m["gui"]}
+        print(f"{module:50s} {m['seconds']*1000:8.1f} ms {m['modules']:5d} modules"
+              + (f"  GUI: {', '.join(sorted(gui))}" if gui else ""))
+        failed = failed or bool(gui)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or NODE_MODULES))
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import sys
+import json
+import subprocess
+import threading
+from pathlib import Path
+
+HOST_SCRIPT = str(Path(__file__).resolve().parent / "plot_host_runner.py")
+
+class HostedPlot:
+    """
+    Stands in for the plotting subprocess of one node when its window lives in
+    the shared plot host. poll() is not None once the host is gone or the
+    window was closed, which the node sees as its plot going away.
+
+    The wakeup socket is only drained on the thread that created the sender
+    (the sender thread with PlotSenderThread), which also sleeps on it; other
+    threads only read the peer_closed it leaves, so no wakeup is eaten under
+    a waiting sender.
+    """
+    def __init__(self, host_process: subprocess.Popen, channel: int, sender):
+        self.host_process = host_process
+        self.channel = channel
+        self.sender = sender
+        self.owner = threading.current_thread()
+
+    def poll(self):
+        returncode = self.host_process.poll()
+        if returncode is not None:
+            return returncode
+        if threading.current_thread() is self.owner:
+            window_open = self.sender.drain_notify()
+        else:
+            window_open = not self.sender.peer_closed
+        if not window_open:
+            return 0 # the window cleaned up its end of the channel
+        return None
+
+class PlotHost:
+    """
+    One Qt process hosting the windows of all plot nodes with PlotHost set,
+    instead of a Python + Qt + OpenGL process per node. Each window gets its
+    own shared memory channel, the host only shares the process and event loop.
+
+    Channels are attached over the host's stdin as JSON lines, the host
+    answers with PLOTTING_PROCESS_READY <channel> once the window is up.
+    """
+    def __init__(self):
+        self.process: subprocess.Popen = None
+        self.lock = threading.Lock()
+        self.next_channel = 0
+
+    def attach(self, plotter_class: str, runner_args: list, sender) -> HostedPlot:
+        """
+        Opens a window of plotter_class ("package.module:Class") reading the
+        channel described by runner_args, the same arguments a plotting process
+        gets. Returns once the window is ready.
+        """
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                # first window, or the user closed all windows of the previous host
+                self.process = subprocess.Popen([sys.executable, HOST_SCRIPT],
+                                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                stderr=None, text=True, bufsize=1)
+
+            channel = self.next_channel
+            self.next_channel += 1
+
+            self.process.stdin.write(json.dumps({
+                "channel": channel,
+                "plotter": plotter_class,
+                "args": runner_args
+            }) + "\n")
+            self.process.stdin.flush()
+
+            # the host connects the wakeup socket before the window reports ready
+            sender.accept_notify()
+
+            ready_line = f"PLOTTING_PROCESS_READY {channel}"
+            for line in self.process.stdout:
+                if line.strip() == ready_line:
+                    break
+
+            return HostedPlot(self.process, channel, sender)
+
+_shared_host: PlotHost = None
+_shared_host_lock = threading.Lock()
+
+def shared_plot_host() -> PlotHost:
+    """The plot host of this flow, started by the first node that attaches"""
+    global _shared_host
+    with _shared_host_lock:
+        if _shared_host is None:
+            _shared_host = PlotHost()
+        return _shared_host
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import sys
+import json
+import queue
+import threading
+import importlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore, QtWidgets
+
+from Utils.sharedmem_handler import open_shm_receiver
+from Utils.plot_proc_runner import ShmPlotPump
+
+ATTACH_POLL_MS = 100 # how often the event loop looks for new channels
+
+class PlotHostRunner:
+    """
+    Plot host process, see Utils.plot_host. Reads attach requests from stdin
+    on a thread and opens a plotter window per channel on the Qt thread. The
+    process ends when the last window is closed, or when the flow goes away
+    before it opened any.
+    """
+    def __init__(self):
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        self.requests = queue.Queue()
+        self.channels = {} # channel -> (plotter, pump)
+
+        threading.Thread(target=self.read_requests, daemon=True).start()
+
+        self.attach_timer = QtCore.QTimer()
+        self.attach_timer.timeout.connect(self.attach_pending)
+        self.attach_timer.start(ATTACH_POLL_MS)
+
+    def read_requests(self):
+        for line in sys.stdin:
+            if line.strip():
+                self.requests.put(json.loads(line))
+        self.requests.put(None) # the flow closed our stdin
+
+    def attach_pending(self):
+        while not self.requests.empty():
+            request = self.requests.get()
+            if request is None:
+                self.attach_timer.stop()
+                if not self.channels:
+                    self.app.quit()
+                return
+            self.attach(request)
+
+    def attach(self, request: dict):
+        args = request["args"]
+        shm_name       = args[0]
+        shm_blocksize  = args[1]
+        shm_blockcount = args[2]
+        close_path     = args[3]
+        notify_port    = args[4] if len(args) > 4 else None
+        stats_log      = args[5] if len(args) > 5 else None
+        stats_interval = float(args[6]) if len(args) > 6 else 1.0
+
+        module_name, class_name = request["plotter"].split(":")
+        plotter_class = getattr(importlib.import_module(module_name), class_name)
+
+        sharedmem = open_shm_receiver(
+            shm_name=shm_name,
+            block_size=shm_blocksize,
+            num_blocks=shm_blockcount,
+            verbose=False
+            )
+        if notify_port is not None:
+            sharedmem.connect_notify(notify_port)
+        if stats_log:
+            sharedmem.enable_stats_log(stats_log, stats_interval)
+
+        plotter = plotter_class(shm_on_exit=sharedmem.cleanup, hosted=True)
+        plotter.init_window()
+        print(f"PLOTTING_PROCESS_READY {request['channel']}", flush=True)
+
+        if sharedmem.check_data_ready(): # for the params dict
+            data = sharedmem.read_objdata()
+            plotter.receive_data(data)
+
+        window = getattr(plotter, "mainwin", None) or plotter.mwin
+        pump = ShmPlotPump(sharedmem, plotter, close_path, window)
+        self.channels[request["channel"]] = (plotter, pump)
+
+    def run(self):
+        self.app.exec()
+        for _, pump in self.channels.values():
+            pump.stop()
+            pump.sharedmem.cleanup()
+        pg.exit()
+
+if __name__ == "__main__":
+    PlotHostRunner().run()
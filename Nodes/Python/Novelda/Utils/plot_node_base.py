@@ -0,0 +1,496 @@
+from __future__ import annotations
+
+import sys
+import subprocess
+import os
+import tempfile
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from Utils.sharedmem_handler import (
+    SharedMemRingSender, SharedMemMailboxSender, SharedMemBroadcastSender, ShmBatch, RecordTooLarge,
+    record_size, frame_schema
+    )
+from Utils.db_payload import DB_PAYLOAD_FLOAT32
+from Utils.plot_host import HostedPlot, shared_plot_host
+from Utils.frame_sink import FrameSink, SINK_NULL, make_frame_sink
+from Utils.frame_history import DEFAULT_HISTORY_BYTES
+from Utils.render_scheduler import DEFAULT_TARGET_FPS, DEFAULT_CPU_SHARE
+
+class PlotNodeBase:
+    """
+    Shared plumbing of the plot nodes: the shared memory transport, the plotting
+    subprocess and the socket it uses to wake the node up when there is free
+    space again, so a full ring costs a sleep instead of a spinning core.
+
+    Live data goes through a latest-wins mailbox, the node never waits for the
+    GUI and frames it couldnt keep up with are skipped and counted. Playback
+    goes through the ring so every frame arrives. Nodes whose plotter keeps a
+    time series of every live frame set live_needs_every_frame, their live
+    data goes through the ring as well and waits for the plotter instead of
+    being skipped. With ShmBroadcast the data goes through a broadcast ring
+    other processes can attach to as well.
+
+    The transport is sized from the first record instead of a worst case guess:
+    subclasses call prepare_plotting_process() in buildup() and implement
+    make_setup(). On the first send the block size is measured, the segment
+    and plotting process are created and the setup dict, with the frame
+    schema, goes out once before any frame. Setup that is the same for every
+    frame belongs in make_setup(), not in the frames.
+
+    With PlotMaxRate (Hz) live frames are thinned out before any conversion or
+    pickling, only the latest frame of each display interval is sent and the
+    rest are counted as rate_limited. Playback is never thinned, the plotter
+    keeps the full history there. Nodes whose plotter keeps a time series of
+    every frame (Presence2DPlotter) do not thin at all.
+
+    With PlotSenderThread the pickling and shared memory writes run on a
+    sender thread behind a small bounded queue, so a slow plot does not hold
+    up the flow. Live frames that find the queue full push out the oldest one
+    (counted as queue_full), playback and live_needs_every_frame wait for room. Conversions that write
+    into reused buffers take them from the set of self.buffer_set, a set is
+    not handed out again before its frames are sent.
+
+    With PlotHost the window opens in the plot host shared by all plot nodes
+    of the flow that set it, instead of a plotting process of its own. The
+    shared memory channel and setup are the same either way.
+
+    With PlotHeadless no plotting process is started at all, the prepared
+    records go to the frame sink named by PlotSink (see Utils.frame_sink)
+    as fast as the node makes them, e.g. to process a recording at full speed
+    or to measure the node side throughput.
+
+    With PlotWorkerThreads > 1 the frames of a batch are converted on a
+    thread pool, see map_frames(). The conversions are NumPy calls that let go
+    of the GIL, which helps fast playback of large recordings.
+
+    MaxBufferedBytes caps the memory of the frame history the plotter keeps
+    for scrolling back (see Utils.frame_history), MaxBufferedFrames only caps
+    the number of frames on top of that. With PlotSpillDir the frames that no
+    longer fit go to a scratch file in that directory instead of being
+    dropped, as float16 with PlotSpillFloat16. These go out with the setup.
+
+    PlotTargetFps and PlotCpuShare pace the plotter's live redraws, see
+    Utils.render_scheduler. They go out with the setup as well.
+
+    With ShmStatsLog both ends append their transport stats (throughput,
+    occupancy, latency, drops by cause) to that file as JSON lines.
+
+    Subclasses set self.shm_numblocks (and self.is_live) in buildup() and pass
+    each parameter section to set_transport_parameters().
+    """
+    SEND_TIMEOUT = 2 # seconds, plotting process considered dead after this
+    SETUP_TIMEOUT = 30 # seconds, the plotting process may still be starting up
+
+    SENDER_QUEUE_DEPTH = 2 # records waiting for the sender thread, one more is being sent
+
+    SCHEMA_SIZE_MARGIN = 1.25 # pickled parts of a frame can vary a bit in size
+    SCHEMA_HEADER_SLACK = 4096 # record headers of the transports
+
+    shm_broadcast = False
+    shm_drop_slow_readers = None # None: drop slow readers when live
+    shm_stats_log = None # JSON lines file for the transport stats of both ends
+    shm_stats_interval = 1.0 # seconds between stats lines
+    db_payload_type = DB_PAYLOAD_FLOAT32 # dB maps as float16 or uint8, see Utils.db_payload
+    plot_max_rate = 0 # Hz, frames sent per display interval when live, 0 sends all
+    plot_sender_thread = False
+    live_needs_every_frame = False # lossless transport when live too, see class docstring
+    plot_worker_threads = 1 # threads converting the frames of a batch
+    max_buffered_bytes = DEFAULT_HISTORY_BYTES # plotter frame history
+    plot_spill_dir = None # directory for the plotter's history spill file
+    plot_spill_float16 = False
+    plot_target_fps = DEFAULT_TARGET_FPS # live redraws per second at most
+    plot_cpu_share = DEFAULT_CPU_SHARE # of the plotting process' Qt thread for redraws
+    frame_pool: ThreadPoolExecutor = None
+    plot_host = False # window in the shared plot host process, see Utils.plot_host
+    plot_headless = False
+    plot_sink = SINK_NULL # PlotSink spec, used when headless
+    frame_sink: FrameSink = None
+
+    sharedmem_sender = None
+    plotting_process = None
+    frames_oversized = 0
+    frames_rate_limited = 0
+    rate_limit_due = None # key -> monotonic time the next frame of that key may go out
+    frames_queue_dropped = 0
+    transport_closed = False
+
+    send_queue = None
+    sender_thread = None
+    free_buffer_sets = None
+    buffer_set = 0 # reused conversion buffers to fill for the next record
+    frame_buffers: dict = None # (buffer_set, slot, name) -> float32 array
+
+    def set_transport_parameters(self, curr_sec):
+        if "ShmBroadcast" in curr_sec:
+            self.shm_broadcast = np.array(curr_sec["ShmBroadcast"], dtype=bool)[0]
+        if "ShmDropSlowReaders" in curr_sec:
+            self.shm_drop_slow_readers = np.array(curr_sec["ShmDropSlowReaders"], dtype=bool)[0]
+        if "ShmStatsLog" in curr_sec:
+            self.shm_stats_log = str(curr_sec["ShmStatsLog"].values[0]) or None
+        if "ShmStatsInterval" in curr_sec:
+            self.shm_stats_interval = float(np.array(curr_sec["ShmStatsInterval"])[0])
+        if "DbPayloadType" in curr_sec:
+            self.db_payload_type = str(curr_sec["DbPayloadType"].values[0]).lower()
+        if "PlotMaxRate" in curr_sec:
+            self.plot_max_rate = float(np.array(curr_sec["PlotMaxRate"])[0])
+        if "PlotHeadless" in curr_sec:
+            self.plot_headless = np.array(curr_sec["PlotHeadless"], dtype=bool)[0]
+        if "PlotSink" in curr_sec:
+            self.plot_sink = str(curr_sec["PlotSink"].values[0])
+        if "PlotHost" in curr_sec:
+            self.plot_host = np.array(curr_sec["PlotHost"], dtype=bool)[0]
+        if "PlotWorkerThreads" in curr_sec:
+            self.plot_worker_threads = int(np.array(curr_sec["PlotWorkerThreads"])[0])
+        if "PlotSenderThread" in curr_sec:
+            self.plot_sender_thread = np.array(curr_sec["PlotSenderThread"], dtype=bool)[0]
+        if "MaxBufferedBytes" in curr_sec:
+            self.max_buffered_bytes = int(np.array(curr_sec["MaxBufferedBytes"])[0])
+        if "PlotSpillDir" in curr_sec:
+            self.plot_spill_dir = str(curr_sec["PlotSpillDir"].values[0]) or None
+        if "PlotSpillFloat16" in curr_sec:
+            self.plot_spill_float16 = np.array(curr_sec["PlotSpillFloat16"], dtype=bool)[0]
+        if "PlotTargetFps" in curr_sec:
+            self.plot_target_fps = float(np.array(curr_sec["PlotTargetFps"])[0])
+        if "PlotCpuShare" in curr_sec:
+            self.plot_cpu_share = float(np.array(curr_sec["PlotCpuShare"])[0])
+
+    def prepare_plotting_process(self, worker_script: str, plotter_class: str):
+        """
+        The process is started by the first send, once the frame size is known.
+        plotter_class ("package.module:Class") is what the plot host opens with PlotHost.
+        """
+        self.worker_script = worker_script
+        self.plotter_class = plotter_class
+
+    def make_setup(self) -> dict:
+        """Parameter dict sent to the plotter before the first frame"""
+        raise NotImplementedError
+
+    def limit_plot_rate(self, frames: list, key=None) -> list:
+        """
+        Frames of one process() call that are due for display, oldest first.
+        When live with PlotMaxRate set, only the latest frame is kept once every
+        display interval, per key(frame) if given (e.g. per TX so every channel
+        still gets drawn). The others are counted and never converted.
+        """
+        if self.plot_max_rate <= 0 or not getattr(self, "is_live", True):
+            return frames
+        if self.rate_limit_due is None:
+            self.rate_limit_due = {}
+
+        now = time.monotonic()
+        picked = {}
+        for inx in reversed(range(len(frames))):
+            frame_key = None if key is None else key(frames[inx])
+            if frame_key in picked or now < self.rate_limit_due.get(frame_key, 0):
+                continue
+            picked[frame_key] = inx
+
+        for frame_key in picked:
+            self.rate_limit_due[frame_key] = now + 1 / self.plot_max_rate
+
+        skipped = len(frames) - len(picked)
+        if skipped:
+            self.frames_rate_limited += skipped
+            if self.sharedmem_sender is not None:
+                self.sharedmem_sender.transport_stats.on_drop("rate_limited", skipped)
+        return [frames[inx] for inx in sorted(picked.values())]
+
+    def map_frames(self, extract, frames: list) -> list:
+        """
+        extract(frame, slot) for every frame of a batch, results in frame order.
+        Runs on the worker pool with PlotWorkerThreads > 1, so extract must only
+        write per frame state, e.g. into its own frame_buffer() slot.
+        """
+        if self.plot_worker_threads <= 1 or len(frames) < 2:
+            return [extract(frame, slot) for slot, frame in enumerate(frames)]
+        if self.frame_buffers is None:
+            self.frame_buffers = {} # before the workers race to create it
+        if self.frame_pool is None:
+            self.frame_pool = ThreadPoolExecutor(max_workers=self.plot_worker_threads, thread_name_prefix="plot-frames")
+        return list(self.frame_pool.map(extract, frames, range(len(frames))))
+
+    def frame_buffer(self, slot: int, name: str, shape: tuple) -> np.ndarray:
+        """
+        float32 scratch reused between process() calls, one per frame in the batch
+        since they are sent together, and per buffer set with PlotSenderThread
+        """
+        if self.frame_buffers is None:
+            self.frame_buffers = {}
+        key = (self.buffer_set, slot, name)
+        buf = self.frame_buffers.get(key)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.float32)
+            self.frame_buffers[key] = buf
+        return buf
+
+    def plotting_closed(self):
+        if self.transport_closed:
+            return True
+        if self.plot_headless:
+            return False # nobody to close it
+        if self.sharedmem_sender is None or self.plotting_process is None:
+            return False # waiting for the first frame
+        return self.plotting_process.poll() is not None or not self.sharedmem_sender.check_buff_exists()
+
+    def negotiate_transport(self, first_record):
+        """Sizes the transport to fit first_record, starts the plotting process and sends the setup"""
+        setup = self.make_setup()
+        setup["frame_schema"] = frame_schema(first_record)
+        setup["max_buffered_bytes"] = self.max_buffered_bytes
+        setup["render_target_fps"] = self.plot_target_fps
+        setup["render_cpu_share"] = self.plot_cpu_share
+        if self.plot_spill_dir:
+            setup["spill_dir"] = self.plot_spill_dir
+            setup["spill_float16"] = bool(self.plot_spill_float16)
+
+        # the setup goes through the same blocks, it can be the bigger one for small frames
+        max_size = max(record_size(first_record, typed_arrays=True), record_size(setup, typed_arrays=True))
+        self.shm_blocksize = int(max_size * self.SCHEMA_SIZE_MARGIN) + self.SCHEMA_HEADER_SLACK
+
+        self.start_plotting_process(self.worker_script)
+        self.wait_plotting_process_ready()
+
+        self.send_setup(setup)
+
+    def skips_frames(self) -> bool:
+        """True if frames the plotter could not keep up with may be skipped"""
+        return getattr(self, "is_live", True) and not self.live_needs_every_frame
+
+    def start_plotting_process(self, worker_script: str):
+
+        skips_frames = self.skips_frames()
+
+        # put verbose=False when released
+        if self.shm_broadcast:
+            drop_slow_readers = skips_frames if self.shm_drop_slow_readers is None else self.shm_drop_slow_readers
+            self.sharedmem_sender = SharedMemBroadcastSender(self.shm_blocksize * self.shm_numblocks, verbose=True,
+                                                             typed_arrays=True, drop_slow_readers=drop_slow_readers,
+                                                             sticky_size=self.shm_blocksize)
+            print(f"Broadcasting plot data on shared memory {self.sharedmem_sender.sharedmem.name}, "
+                  "attach with Utils.sharedmem_handler.open_shm_receiver()")
+        elif skips_frames:
+            self.sharedmem_sender = SharedMemMailboxSender(self.shm_blocksize, verbose=True, typed_arrays=True)
+        else:
+            # frames only take the space they need in the ring, blocksize is the worst case
+            self.sharedmem_sender = SharedMemRingSender(self.shm_blocksize * self.shm_numblocks, verbose=True, typed_arrays=True)
+        notify_port = self.sharedmem_sender.listen_notify()
+
+        stats_args = []
+        if self.shm_stats_log:
+            self.sharedmem_sender.enable_stats_log(self.shm_stats_log, self.shm_stats_interval)
+            stats_args = [self.shm_stats_log, f"{self.shm_stats_interval}"]
+
+        closesig_file = tempfile.NamedTemporaryFile(prefix="x7_run_", delete=False)
+        self.close_path = closesig_file.name
+        closesig_file.close()
+
+        runner_args = [
+            self.sharedmem_sender.sharedmem.name,
+            f"{self.shm_blocksize}",
+            f"{self.shm_numblocks}",
+            self.close_path,
+            f"{notify_port}",
+            *stats_args
+        ]
+
+        if self.plot_host:
+            # returns with the window up and the wakeup socket connected
+            self.plotting_process = shared_plot_host().attach(self.plotter_class, runner_args, self.sharedmem_sender)
+            return
+
+        self.plotting_process = subprocess.Popen([
+            sys.executable,  # Use the same Python executable
+            worker_script,
+            *runner_args
+        ], stdout=subprocess.PIPE, stderr=None, text=True, bufsize=1)
+
+    def wait_plotting_process_ready(self):
+        if isinstance(self.plotting_process, HostedPlot):
+            return # attach() already waited
+        # the plotting process connects first thing, a broadcast reader waits
+        # for the accept before it gets to report ready
+        self.sharedmem_sender.accept_notify()
+
+        for line in self.plotting_process.stdout:
+            if line.strip() == "PLOTTING_PROCESS_READY":
+                break
+
+    def send_setup(self, data):
+        """
+        Sends data that must not be skipped, like the first parameter dict.
+        Straight to the transport, never through the sender thread's queue:
+        the first send negotiates the transport on whichever thread makes it,
+        and the setup has to be out before the frame that triggered it.
+        """
+        if isinstance(self.sharedmem_sender, SharedMemBroadcastSender):
+            # every reader gets it first, also the ones attaching later
+            self.sharedmem_sender.set_sticky(data)
+            return
+
+        self._send(lambda: self.sharedmem_sender.send_data_wait(data, timeout=self.SETUP_TIMEOUT))
+        if self.transport_closed:
+            return
+        if isinstance(self.sharedmem_sender, SharedMemMailboxSender):
+            # later frames would overwrite it in the mailbox, wait until it is picked up
+            self.sharedmem_sender.wait_all_read(timeout=self.SETUP_TIMEOUT)
+
+    def warn(self, msg: str):
+        """Warnings of the node, prefixed with its class to tell the plot nodes of a flow apart"""
+        print(f"{type(self).__name__}: {msg}")
+
+    def _send(self, send):
+        try:
+            sent = send()
+        except RecordTooLarge as e:
+            # a frame grew past what the first one negotiated, skip it instead of stopping the flow
+            self.frames_oversized += 1
+            self.warn(f"Frame bigger than the negotiated transport, dropped {self.frames_oversized} so far: {e}")
+            return
+
+        if not sent:
+            self.warn("Shared memory sender timed out, exiting process")
+            self.close_transport()
+
+    def _write_to_sink(self, record):
+        if self.frame_sink is None:
+            self.frame_sink = make_frame_sink(self.plot_sink)
+            setup = self.make_setup()
+            setup["frame_schema"] = frame_schema(record)
+            self.frame_sink.write_setup(setup)
+        self.frame_sink.write(record)
+
+    def _send_data_now(self, data):
+        if self.plot_headless:
+            self._write_to_sink(data)
+            return
+        if self.sharedmem_sender is None:
+            self.negotiate_transport(data)
+        self._send(lambda: self.sharedmem_sender.send_data_wait(data, timeout=self.SEND_TIMEOUT))
+
+    def _send_batch_now(self, items: list):
+        if self.plot_headless:
+            self._write_to_sink(ShmBatch(items))
+            return
+        if self.sharedmem_sender is None:
+            self.negotiate_transport(ShmBatch(items))
+        self._send(lambda: self.sharedmem_sender.send_batch_wait(items, timeout=self.SEND_TIMEOUT))
+
+    def send_data(self, data):
+        self._submit(self._send_data_now, data, 1)
+
+    def send_batch(self, items: list):
+        """Sends all frames of one process() call as a single record"""
+        if not len(items):
+            return
+        self._submit(self._send_batch_now, items, len(items))
+
+    def _submit(self, send_now, payload, num_frames: int):
+        if self.transport_closed:
+            return
+        if not self.plot_sender_thread:
+            send_now(payload)
+            return
+        if self.sender_thread is None:
+            self.start_sender_thread()
+
+        item = (send_now, payload, num_frames, self.buffer_set)
+        if self.skips_frames():
+            # latest wins, like the mailbox behind it
+            while True:
+                try:
+                    self.send_queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    self._drop_queued()
+        else:
+            # playback (or a time series) needs every frame, wait for the sender unless it is gone
+            while self.sender_thread.is_alive():
+                try:
+                    self.send_queue.put(item, timeout=self.SEND_TIMEOUT)
+                    break
+                except queue.Full:
+                    pass
+            else:
+                self.free_buffer_sets.put(self.buffer_set)
+
+        # the set just queued stays untouched until the sender is done with it
+        self.buffer_set = self.free_buffer_sets.get()
+
+    def _drop_queued(self):
+        try:
+            _, _, num_frames, buffer_set = self.send_queue.get_nowait()
+        except queue.Empty:
+            return # the sender just took it
+        self.free_buffer_sets.put(buffer_set)
+        self.frames_queue_dropped += num_frames
+        if self.sharedmem_sender is not None:
+            self.sharedmem_sender.transport_stats.on_drop("queue_full", num_frames)
+
+    def start_sender_thread(self):
+        self.send_queue = queue.Queue(maxsize=self.SENDER_QUEUE_DEPTH)
+        # queued, one being sent and one being filled
+        self.free_buffer_sets = queue.Queue()
+        for buffer_set in range(1, self.SENDER_QUEUE_DEPTH + 2):
+            self.free_buffer_sets.put(buffer_set)
+        self.buffer_set = 0
+
+        self.sender_thread = threading.Thread(target=self._sender_loop, name="plot-sender", daemon=True)
+        self.sender_thread.start()
+
+    def _sender_loop(self):
+        while True:
+            item = self.send_queue.get()
+            if item is None:
+                return
+            send_now, payload, _, buffer_set = item
+            try:
+                if not self.transport_closed:
+                    send_now(payload)
+                if self.plotting_process is not None:
+                    # a hosted plot drains its wakeup socket on this thread, see HostedPlot
+                    self.plotting_process.poll()
+            finally:
+                self.free_buffer_sets.put(buffer_set)
+
+    def stop_sender_thread(self):
+        if self.sender_thread is None:
+            return
+        try:
+            # whatever is queued still goes out first
+            self.send_queue.put(None, timeout=self.SEND_TIMEOUT)
+        except queue.Full:
+            pass
+        self.sender_thread.join(timeout=self.SEND_TIMEOUT * 2)
+        if self.sender_thread.is_alive():
+            self.warn("Plot sender thread did not finish in time")
+
+    def teardown(self):
+        if self.frame_pool is not None:
+            self.frame_pool.shutdown()
+        self.stop_sender_thread()
+        if self.frame_sink is not None:
+            self.frame_sink.close()
+            print(f"Headless plot node wrote {self.frame_sink.summary()} to {self.plot_sink}")
+            self.frame_sink = None
+        self.close_transport()
+
+    def close_transport(self):
+        if self.sharedmem_sender is None or self.transport_closed:
+            return # never got a frame, nothing was started
+        self.transport_closed = True
+        self.sharedmem_sender.wait_all_read(timeout=2)
+
+        drops = self.sharedmem_sender.stats()["drops"]
+        if len(drops):
+            # skipped: the plot fell behind live data, full/timeout: the flow outran the plot,
+            # rate_limited: thinned out by PlotMaxRate, queue_full: the sender thread fell behind live data
+            self.warn(f"Plot transport dropped frames, by cause: {drops}")
+
+        if os.path.exists(self.close_path):
+            os.remove(self.close_path)
+        self.sharedmem_sender.cleanup()
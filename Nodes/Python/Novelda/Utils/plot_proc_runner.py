@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import os
+import time
+import queue
+import threading
+
+from pyqtgraph.Qt import QtCore
+QTimer = QtCore.QTimer
+
+from Utils.sharedmem_handler import SharedMemUser, ShmBatch
+from Utils.render_scheduler import RenderScheduler
+
+POLL_FREQ = 40 # Hz, only used when the node didnt give a wakeup socket
+FALLBACK_POLL_MS = 500 # close_path check and safety net when woken by the reader
+READER_WAIT_S = 0.1 # longest sleep of the reader thread between looks at the stop flag
+MAX_QUEUED_RECORDS = 64 # past this the reader leaves records in shared memory, the node drops as usual
+DRAIN_BUDGET_S = 0.015 # GUI time per tick for handing frames to the plotter, the rest waits a tick
+
+class _RecordsReady(QtCore.QObject):
+    signal = QtCore.Signal()
+
+class ShmReaderThread:
+    """
+    Reads records from shared memory into a queue on its own thread, so the
+    unpickling and copying out of the segment happens off the Qt thread. Sleeps
+    on the node's wakeup socket, or polls at POLL_FREQ without one. Calls
+    on_ready after a put unless it was called since the consumer last cleared
+    woken, so the consumer is woken once per drain rather than per record.
+    A read the producer kept overwriting (RuntimeError from a mailbox) is
+    counted in skipped_reads and the transport's drops, and tried again.
+    """
+    def __init__(self, sharedmem: SharedMemUser, on_ready):
+        self.sharedmem = sharedmem
+        self.on_ready = on_ready
+        self.records = queue.Queue(maxsize=MAX_QUEUED_RECORDS)
+        self.running = True
+        self.woken = False
+        self.skipped_reads = 0
+        self.thread = threading.Thread(target=self.run, name="ShmReader", daemon=True)
+        self.thread.start()
+
+    def wait_for_data(self):
+        if self.sharedmem.notify_fileno() is None or self.sharedmem.peer_closed:
+            time.sleep(1 / POLL_FREQ)
+        else:
+            self.sharedmem.wait_notify(READER_WAIT_S)
+
+    def put(self, record):
+        while self.running:
+            try:
+                self.records.put(record, timeout=READER_WAIT_S)
+                return
+            except queue.Full:
+                pass # the GUI is behind, wait for it instead of reading more
+
+    def run(self):
+        try:
+            while self.running and self.sharedmem.check_buff_exists():
+                if not self.sharedmem.check_data_ready():
+                    self.wait_for_data()
+                    continue
+                try:
+                    data = self.sharedmem.read_objdata()
+                except RuntimeError:
+                    self.skip_read()
+                    continue
+                if data is None: # None when a broadcast reader was dropped mid read
+                    continue
+                self.put(data)
+                if not self.woken:
+                    self.woken = True
+                    self.on_ready()
+        except (ValueError, TypeError, BufferError, OSError):
+            pass # the segment was closed under us, the plotter is exiting
+
+    def skip_read(self):
+        self.skipped_reads += 1
+        if getattr(self.sharedmem, "transport_stats", None) is not None:
+            self.sharedmem.transport_stats.on_drop("overwritten")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=2 * READER_WAIT_S + 1 / POLL_FREQ)
+
+class ShmPlotPump:
+    """
+    Moves data from shared memory into the plotter in the plotting process.
+    A ShmReaderThread reads and unpickles, the Qt thread takes records from its
+    queue when woken and spends at most DRAIN_BUDGET_S per tick on them, so a
+    backlog does not freeze the window. With live data (is_live in the setup)
+    and the plotter not paused, a backlog of frames is collapsed to the newest
+    one, setup dicts always get through. A plotter with a collapse_key(frame)
+    keeps the newest frame per key instead, like the node's PlotMaxRate, so
+    e.g. every TX plot of the baseband plotter still gets its frame.
+    Playback is never collapsed, every frame goes into the plotter's
+    history. Plotters that need every live frame, e.g. for a time series,
+    set collapse_live_backlog = False.
+
+    Live redraws (plotter.update()) are paced by a RenderScheduler; one that
+    is not due yet is put off with a timer. Plotters with show_render_stats()
+    get its stats for their info label.
+    """
+    def __init__(self, sharedmem: SharedMemUser, plotter, close_path: str, parent_widget):
+        self.sharedmem = sharedmem
+        self.plotter = plotter
+        self.close_path = close_path
+        self.frames_collapsed = 0
+        self.is_live = False # until a setup says so, nothing is collapsed
+
+        self.scheduler = RenderScheduler()
+        if getattr(plotter, "first_setup_dict", None):
+            self.note_setup(plotter.first_setup_dict)
+        self.redraw_timer = QTimer(parent_widget)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.timeout.connect(self.redraw)
+
+        # queued, so pump() runs on the Qt thread however the reader emits
+        self.ready = _RecordsReady(parent_widget)
+        self.ready.signal.connect(self.pump, QtCore.Qt.ConnectionType.QueuedConnection)
+        self.reader = ShmReaderThread(sharedmem, self.ready.signal.emit)
+
+        self.poll_timer = QTimer(parent_widget)
+        self.poll_timer.timeout.connect(self.pump)
+        self.poll_timer.start(FALLBACK_POLL_MS)
+
+    def stop(self):
+        self.poll_timer.stop()
+        self.redraw_timer.stop()
+        self.reader.stop()
+
+    def take_records(self) -> list:
+        records = []
+        while True:
+            try:
+                records.append(self.reader.records.get_nowait())
+            except queue.Empty:
+                return records
+
+    def note_setup(self, setup: dict):
+        self.scheduler.configure_from(setup)
+        if "is_live" in setup:
+            self.is_live = bool(setup["is_live"])
+
+    def collapse(self, records: list) -> list:
+        """
+        Setup dicts in order, of the live frames between them only the newest,
+        per collapse_key(frame) if the plotter has one. Frames after a setup
+        that switched to playback are all kept.
+        """
+        key = getattr(self.plotter, "collapse_key", None)
+        kept = []
+        collapsed = self.frames_collapsed
+        newest = {} # key -> (arrival, frame)
+        arrival = 0
+        for record in records:
+            for item in (record if type(record) is ShmBatch else (record,)):
+                arrival += 1
+                if isinstance(item, dict):
+                    kept.extend(frame for _, frame in sorted(newest.values(), key=lambda kept_frame: kept_frame[0]))
+                    newest.clear()
+                    kept.append(item)
+                    self.note_setup(item)
+                    continue
+                if not self.is_live:
+                    kept.append(item)
+                    continue
+                frame_key = None if key is None else key(item)
+                if frame_key in newest:
+                    self.frames_collapsed += 1
+                newest[frame_key] = (arrival, item)
+        kept.extend(frame for _, frame in sorted(newest.values(), key=lambda kept_frame: kept_frame[0]))
+        self.scheduler.on_frames(self.frames_collapsed - collapsed) # skipped as far as the redraws go
+        return kept
+
+    def deliver(self, data, showing: bool):
+        if isinstance(data, dict):
+            self.note_setup(data)
+        elif showing:
+            self.scheduler.on_frames(len(data) if type(data) is ShmBatch else 1)
+        self.plotter.receive_data(data)
+
+    def pump(self):
+        if not os.path.exists(self.close_path):
+            self.stop()
+            self.sharedmem.cleanup()
+            return
+            # done with receiving data
+
+        self.reader.woken = False # records put from here on wake us again
+        showing = not getattr(self.plotter, "paused", False)
+        if self.is_live and showing and getattr(self.plotter, "collapse_live_backlog", True):
+            for data in self.collapse(self.take_records()):
+                self.deliver(data, showing)
+        else:
+            deadline = time.perf_counter() + DRAIN_BUDGET_S
+            while time.perf_counter() < deadline:
+                try:
+                    data = self.reader.records.get_nowait()
+                except queue.Empty:
+                    break
+                self.deliver(data, showing)
+            else:
+                # out of time, the rest after the window had its turn
+                QTimer.singleShot(0, self.pump)
+
+        self.redraw()
+
+    def redraw(self):
+        if getattr(self.plotter, "paused", False) or not self.scheduler.frames_pending:
+            self.plotter.update() # bookkeeping only, nothing new to draw
+            return
+
+        started = time.perf_counter()
+        wait = self.scheduler.time_to_render(started)
+        if wait > 0:
+            if not self.redraw_timer.isActive():
+                self.redraw_timer.start(int(wait * 1000) + 1)
+            return
+
+        self.plotter.update()
+        finished = time.perf_counter()
+        self.scheduler.rendered(started, finished)
+
+        if hasattr(self.plotter, "show_render_stats") and self.scheduler.stats_due(finished):
+            self.plotter.show_render_stats(self.scheduler.stats_text())
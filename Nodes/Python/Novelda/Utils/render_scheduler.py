@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import math
+
+DEFAULT_TARGET_FPS = 30.0
+DEFAULT_CPU_SHARE = 0.7 # of the Qt thread for redraws, the rest for input and taking in frames
+MIN_CPU_SHARE = 0.05
+RENDER_TIME_SMOOTHING = 0.2 # weight of the newest redraw in the render time average
+STATS_INTERVAL = 1.0 # seconds between render stats for the info label
+
+class RenderScheduler:
+    """
+    Paces the live redraws of a plotter. Measures how long each redraw takes
+    and spaces them by max(1 / target_fps, render time / cpu_share), so a
+    plotter whose draws take longer than the frame interval (several
+    Matrix3DPlots at a large FFTSize) still leaves the event loop time for
+    input and paints instead of starving it. Frames arriving between redraws
+    are only buffered, all but the newest of them count as skipped.
+
+    Qt-free, the pump asks time_to_render() and reports rendered().
+    """
+    def __init__(self, target_fps: float = DEFAULT_TARGET_FPS, cpu_share: float = DEFAULT_CPU_SHARE):
+        self.target_fps = DEFAULT_TARGET_FPS
+        self.cpu_share = DEFAULT_CPU_SHARE
+        self.configure(target_fps, cpu_share)
+
+        self.render_time = 0.0 # seconds, smoothed
+        self.last_render = -math.inf
+        self.renders = 0
+        self.frames_pending = 0 # arrived since the last redraw
+        self.frames_rendered = 0
+        self.frames_skipped = 0
+        self.last_stats = -math.inf
+
+    def configure(self, target_fps: float = None, cpu_share: float = None):
+        if target_fps is not None and target_fps > 0:
+            self.target_fps = float(target_fps)
+        if cpu_share is not None and cpu_share > 0:
+            self.cpu_share = min(max(float(cpu_share), MIN_CPU_SHARE), 1.0)
+
+    def configure_from(self, setup: dict):
+        """Targets from the setup dict a plotter got from its node"""
+        self.configure(setup.get("render_target_fps"), setup.get("render_cpu_share"))
+
+    @property
+    def interval(self) -> float:
+        """Seconds between redraws"""
+        return max(1 / self.target_fps, self.render_time / self.cpu_share)
+
+    def on_frames(self, count: int):
+        self.frames_pending += count
+
+    def time_to_render(self, now: float) -> float:
+        """Seconds until the next redraw is due, <= 0 when it is"""
+        return self.last_render + self.interval - now
+
+    def rendered(self, started: float, finished: float):
+        elapsed = finished - started
+        if self.renders == 0:
+            self.render_time = elapsed
+        else:
+            self.render_time += RENDER_TIME_SMOOTHING * (elapsed - self.render_time)
+        self.renders += 1
+        self.last_render = started
+
+        if self.frames_pending:
+            self.frames_rendered += 1
+            self.frames_skipped += self.frames_pending - 1
+        self.frames_pending = 0
+
+    def stats_due(self, now: float) -> bool:
+        if now - self.last_stats < STATS_INTERVAL:
+            return False
+        self.last_stats = now
+        return True
+
+    def stats_text(self) -> str:
+        total = self.frames_rendered + self.frames_skipped
+        skipped_pct = 100 * self.frames_skipped / total if total else 0.0
+        return (f"Redraw: {self.render_time * 1000:.1f} ms, {1 / self.interval:.1f} FPS max"
+                f"\nSkipped frames: {self.frames_skipped} of {total} ({skipped_pct:.0f}%)")
@@ -3,13 +3,28 @@ from __future__ import annotations
 import pickle
 import time
 import os
+import socket
+import select
+import struct
+import threading
+from collections import deque
 from pathlib import Path
+from dataclasses import is_dataclass, fields, replace
 from multiprocessing import shared_memory, resource_tracker
 import numpy as np
 import json
 
 SHS = 4 # size of size header
-THS = SHS + 1 # total header size
+FHS = 1 # size of format header
+TSS = 8 # size of the send time in the record headers, f64 seconds since the epoch
+THS = SHS + FHS + 1 + TSS # total header size, status + format + size + send time
+
+# payload formats, stored in the format byte of each block
+FMT_PICKLE = 0 # whole object pickled
+FMT_TYPED_ARRAYS = 1 # pickled skeleton + raw array bytes
+
+ARRAY_ALIGN = 64 # raw arrays start on cache line boundaries
+MIN_RAW_ARRAY_BYTES = 1024 # smaller arrays are just pickled with the skeleton
 
 # for cleaning up possible mem leaks in case the process is killed abruptly
 REG_FILE = str(Path(__file__).resolve().parent / "logs" / "sharedmem_reg.txt")
@@ -19,6 +34,260 @@ REG_FILE = str(Path(__file__).resolve().parent / "logs" / "sharedmem_reg.txt")
 # but better to be safe than sorry, it seems that on inferior systems (linux, mac)
 # the memory stays allocated even after the process ends
 
+class RecordTooLarge(MemoryError):
+    """A single record is bigger than the transport can ever hold"""
+
+class ShmBatch(list):
+    """Several objects sent as one record, see SharedMemOwner.send_batch()"""
+
+class _ArrayRef:
+    """Placeholder left in the pickled skeleton where a raw array was taken out"""
+    def __init__(self, index: int):
+        self.index = index
+
+def _align(offset: int, alignment: int = ARRAY_ALIGN) -> int:
+    return (offset + alignment - 1) // alignment * alignment
+
+def _write_time(buf: memoryview, offset: int, t: float):
+    buf[offset: offset + TSS] = struct.pack("<d", t)
+
+def _read_time(buf: memoryview, offset: int) -> float:
+    return struct.unpack_from("<d", buf, offset)[0]
+
+def _frame_count(obj) -> int:
+    return len(obj) if type(obj) is ShmBatch else 1
+
+class TransportStats:
+    """
+    Counters of one end of a transport, see ShmStatsEndpoint.stats().
+    Totals count from the start, the rates are over the time since the
+    previous snapshot. Latency is send to read, from the time in the record
+    header, so it is only measured on the receiving end.
+    """
+    LATENCY_SAMPLES = 1024 # percentiles over the most recent records
+
+    def __init__(self, side: str, shm_name: str, extra_drops=None):
+        """extra_drops: returns drops counted elsewhere, e.g. by the reader in the segment header"""
+        self.side = side
+        self.shm_name = shm_name
+        self.extra_drops = extra_drops
+
+        self.records = 0
+        self.frames = 0
+        self.bytes = 0
+        self.occupancy_high_water = 0.0
+        self.drops: dict[str, int] = {}
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+
+        self.prev_snapshot = (time.time(), 0, 0, 0) # time, records, frames, bytes
+
+        self.log_file = None
+        self.log_interval = 1.0
+        self.last_dump = 0.0
+
+    def on_record(self, nbytes: int, frames=1, occupancy=None, sent_at=None):
+        self.records += 1
+        self.frames += frames
+        self.bytes += nbytes
+        if occupancy is not None:
+            self.occupancy_high_water = max(self.occupancy_high_water, occupancy)
+        if sent_at:
+            self.latencies.append(time.time() - sent_at)
+        self.maybe_dump()
+
+    def on_drop(self, cause: str, count=1):
+        self.drops[cause] = self.drops.get(cause, 0) + count
+        self.maybe_dump()
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        then, records, frames, nbytes = self.prev_snapshot
+        elapsed = max(now - then, 1e-9)
+        self.prev_snapshot = (now, self.records, self.frames, self.bytes)
+
+        drops = dict(self.drops)
+        if self.extra_drops is not None:
+            drops.update(self.extra_drops())
+
+        latency_ms = None
+        if len(self.latencies):
+            p50, p95, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 95, 99]) * 1000
+            latency_ms = {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+        return {
+            "time": now,
+            "side": self.side,
+            "shm": self.shm_name,
+            "records": self.records,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "records_per_s": (self.records - records) / elapsed,
+            "frames_per_s": (self.frames - frames) / elapsed,
+            "bytes_per_s": (self.bytes - nbytes) / elapsed,
+            "occupancy_high_water": self.occupancy_high_water,
+            "latency_ms": latency_ms,
+            "drops": drops,
+        }
+
+    def enable_log(self, path: str, interval=1.0):
+        """Appends a snapshot as a JSON line every interval seconds while records flow"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.log_file = open(path, "a")
+        self.log_interval = interval
+
+    def maybe_dump(self, force=False):
+        if self.log_file is None:
+            return
+        now = time.time()
+        if not force and now - self.last_dump < self.log_interval:
+            return
+        self.last_dump = now
+        self.log_file.write(json.dumps(self.snapshot()) + "\n")
+        self.log_file.flush()
+
+    def close_log(self):
+        if self.log_file is not None:
+            self.maybe_dump(force=True)
+            self.log_file.close()
+            self.log_file = None
+
+def split_arrays(obj, arrays: list, name: str = "", min_bytes: int = MIN_RAW_ARRAY_BYTES):
+    """
+    Walks dataclasses, dicts, lists and tuples and replaces every large numeric
+    ndarray (min_bytes or more) with an _ArrayRef. The arrays are appended to
+    arrays as (name, array).
+    Returns the skeleton object, the input object is not modified.
+    """
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject or obj.nbytes < min_bytes:
+            return obj
+        arrays.append((name, obj))
+        return _ArrayRef(len(arrays) - 1)
+
+    if is_dataclass(obj) and not isinstance(obj, type):
+        changes = {f.name: split_arrays(getattr(obj, f.name), arrays, f"{name}.{f.name}", min_bytes)
+                   for f in fields(obj) if f.init}
+        if all(v is getattr(obj, k) for k, v in changes.items()):
+            # untouched, keep the object so pickle can share it, e.g. a setup used by every frame in a batch
+            return obj
+        return replace(obj, **changes)
+
+    if isinstance(obj, dict):
+        return {k: split_arrays(v, arrays, f"{name}[{k!r}]", min_bytes) for k, v in obj.items()}
+
+    if type(obj) is list:
+        return [split_arrays(v, arrays, f"{name}[{i}]", min_bytes) for i, v in enumerate(obj)]
+
+    if type(obj) is ShmBatch:
+        return ShmBatch(split_arrays(v, arrays, f"{name}[{i}]", min_bytes) for i, v in enumerate(obj))
+
+    if type(obj) is tuple:
+        return tuple(split_arrays(v, arrays, f"{name}[{i}]", min_bytes) for i, v in enumerate(obj))
+
+    return obj
+
+def join_arrays(skeleton, arrays: list):
+    """Inverse of split_arrays, puts the arrays back in place of the _ArrayRefs"""
+    if isinstance(skeleton, _ArrayRef):
+        return arrays[skeleton.index]
+
+    if is_dataclass(skeleton) and not isinstance(skeleton, type):
+        changes = {f.name: join_arrays(getattr(skeleton, f.name), arrays)
+                   for f in fields(skeleton) if f.init}
+        if all(v is getattr(skeleton, k) for k, v in changes.items()):
+            return skeleton
+        return replace(skeleton, **changes)
+
+    if isinstance(skeleton, dict):
+        return {k: join_arrays(v, arrays) for k, v in skeleton.items()}
+
+    if type(skeleton) is list:
+        return [join_arrays(v, arrays) for v in skeleton]
+
+    if type(skeleton) is ShmBatch:
+        return ShmBatch(join_arrays(v, arrays) for v in skeleton)
+
+    if type(skeleton) is tuple:
+        return tuple(join_arrays(v, arrays) for v in skeleton)
+
+    return skeleton
+
+class TypedArrayPayload:
+    """
+    Typed array encoding of an object, avoids pickling the big arrays.
+
+    Layout, offsets relative to the start of the shared memory buffer:
+        [header size, SHS bytes][pickled header][pad to ARRAY_ALIGN][array 0][pad][array 1]...
+
+    The header is (skeleton, descriptors), where each descriptor is
+    (field name, dtype, shape, strides, offset from start of array area, nbytes)
+    """
+    def __init__(self, obj):
+        self.arrays: list[tuple[str, np.ndarray]] = []
+        skeleton = split_arrays(obj, self.arrays)
+
+        self.descriptors = []
+        arr_area_size = 0
+        for name, arr in self.arrays:
+            arr_area_size = _align(arr_area_size)
+            c_strides = tuple(int(np.prod(arr.shape[i + 1:], dtype=np.int64)) * arr.itemsize
+                              for i in range(arr.ndim))
+            self.descriptors.append((name, arr.dtype, arr.shape, c_strides, arr_area_size, arr.nbytes))
+            arr_area_size += arr.nbytes
+
+        self.header = pickle.dumps((skeleton, self.descriptors))
+        self.arr_area_size = arr_area_size
+
+    def size_at(self, start_inx: int) -> int:
+        """Number of bytes needed when written at start_inx, alignment depends on the position"""
+        arr_area_start = _align(start_inx + SHS + len(self.header))
+        return arr_area_start + self.arr_area_size - start_inx
+
+    def write(self, buf: memoryview, start_inx: int):
+        header_size = len(self.header)
+        buf[start_inx: start_inx + SHS] = header_size.to_bytes(SHS, byteorder="little")
+        buf[start_inx + SHS: start_inx + SHS + header_size] = self.header
+
+        arr_area_start = _align(start_inx + SHS + header_size)
+        for (_, arr), (_, dtype, shape, _, offset, nbytes) in zip(self.arrays, self.descriptors):
+            if not nbytes:
+                continue
+            dst = np.ndarray(shape, dtype=dtype, buffer=buf, offset=arr_area_start + offset)
+            np.copyto(dst, arr, casting="no")
+            del dst # dont keep exports of the shared memory alive
+
+    @staticmethod
+    def read(buf: memoryview, start_inx: int, copy_arrays=True, writeable=False):
+        """writeable only applies to views, copy_arrays=False, into a private writable buffer"""
+        header_size = int.from_bytes(buf[start_inx: start_inx + SHS], byteorder="little")
+        skeleton, descriptors = pickle.loads(buf[start_inx + SHS: start_inx + SHS + header_size])
+
+        arr_area_start = _align(start_inx + SHS + header_size)
+        arrays = []
+        for _, dtype, shape, strides, offset, nbytes in descriptors:
+            count = nbytes // dtype.itemsize if dtype.itemsize else 0
+            flat = np.frombuffer(buf, dtype=dtype, count=count, offset=arr_area_start + offset)
+            arr = np.lib.stride_tricks.as_strided(flat, shape=shape, strides=strides, writeable=writeable)
+            arrays.append(arr.copy() if copy_arrays else arr)
+
+        return join_arrays(skeleton, arrays)
+
+def record_size(pickleable_data, typed_arrays=False) -> int:
+    """
+    Payload bytes one record of this object takes, without the transport's own
+    record header. Typed arrays are counted with the worst case alignment
+    padding, so the size holds wherever in the segment the record ends up.
+    """
+    if typed_arrays:
+        return TypedArrayPayload(pickleable_data).size_at(0) + ARRAY_ALIGN
+    return len(pickle.dumps(pickleable_data))
+
+def frame_schema(pickleable_data) -> list[tuple[str, str, tuple]]:
+    """(field name, dtype, shape) of every array sent raw in typed array mode"""
+    arrays = []
+    split_arrays(pickleable_data, arrays)
+    return [(name, arr.dtype.str, arr.shape) for name, arr in arrays]
+
 class MemBlock:
         """
         0 = available for write
@@ -41,17 +310,40 @@ class MemBlock:
         def make_available_read(self):
             self.sharedmem.buf[self.start_inx] = 1
         
+        def payload_start(self):
+            return self.start_inx + THS
+
+        def write_header(self, fmt: int, data_size: int):
+            self.sharedmem.buf[self.start_inx + 1] = fmt
+            self.sharedmem.buf[self.start_inx + 2: self.start_inx + 2 + SHS] = data_size.to_bytes(SHS, byteorder="little")
+            _write_time(self.sharedmem.buf, self.start_inx + 2 + SHS, time.time())
+
         def write_data(self, data: bytes):
             data_size = len(data)
 
-            self.sharedmem.buf[self.start_inx + 1: self.start_inx + THS] = data_size.to_bytes(SHS, byteorder="little")
+            self.write_header(FMT_PICKLE, data_size)
             self.sharedmem.buf[self.start_inx + THS: self.start_inx + THS + data_size] = data
+            return data_size
+
+        def write_typed_arrays(self, payload: TypedArrayPayload):
+            data_size = payload.size_at(self.payload_start())
+
+            self.write_header(FMT_TYPED_ARRAYS, data_size)
+            payload.write(self.sharedmem.buf, self.payload_start())
+            return data_size
+
+        def read_data_size(self):
+            return int.from_bytes(self.sharedmem.buf[self.start_inx + 2: self.start_inx + 2 + SHS], byteorder="little")
+
+        def read_sent_at(self):
+            return _read_time(self.sharedmem.buf, self.start_inx + 2 + SHS)
 
-        def read_data_as_obj(self):
-            # Read data size
-            size_bytes = self.sharedmem.buf[self.start_inx + 1: self.start_inx + THS]
-            data_size = int.from_bytes(size_bytes, byteorder="little")
+        def read_data_as_obj(self, copy_arrays=True):
+            data_size = self.read_data_size()
             
+            if self.sharedmem.buf[self.start_inx + 1] == FMT_TYPED_ARRAYS:
+                return TypedArrayPayload.read(self.sharedmem.buf, self.payload_start(), copy_arrays=copy_arrays)
+
             objdata = pickle.loads(self.sharedmem.buf[self.start_inx + THS: self.start_inx + THS + data_size])
             return objdata
         
@@ -59,13 +351,77 @@ class MemBlock:
             return data_size + THS <= self.block_size
 
 
-class SharedMemSender:
+class ShmNotifyEndpoint:
+    """
+    One end of a loopback socket between sender and receiver. Each side writes a
+    byte after it publishes data or frees space, so the other side can sleep in
+    select() or a QSocketNotifier instead of polling the shared memory.
+    Sockets instead of pipes/eventfd since windows can only select() on sockets.
+    """
+    notify_sock: socket.socket = None
+    peer_closed = False
 
-    def __init__(self, block_size, num_blocks, verbose=True):
-        self.block_size = block_size
-        self.num_blocks = num_blocks
-        self.total_size = block_size * num_blocks
-        self.sharedmem = shared_memory.SharedMemory(create=True, size=self.total_size)
+    def notify_fileno(self):
+        return None if self.notify_sock is None else self.notify_sock.fileno()
+
+    def notify_peer(self):
+        if self.notify_sock is None:
+            return
+        try:
+            self.notify_sock.send(b"\x01")
+        except (BlockingIOError, InterruptedError):
+            pass # socket buffer full, the peer has plenty of wakeups pending
+        except OSError:
+            self.peer_closed = True
+
+    def drain_notify(self):
+        """Eats pending wakeups, returns False if the peer closed its end"""
+        if self.notify_sock is None:
+            return not self.peer_closed
+        try:
+            while True:
+                if not self.notify_sock.recv(4096):
+                    self.peer_closed = True
+                    break
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.peer_closed = True
+        return not self.peer_closed
+
+    def wait_notify(self, timeout):
+        """Sleeps until the peer writes a wakeup or timeout seconds have passed"""
+        if self.notify_sock is None or self.peer_closed:
+            time.sleep(min(timeout, 0.001))
+            return
+        select.select([self.notify_sock], [], [], timeout)
+        self.drain_notify()
+
+    def close_notify(self):
+        if self.notify_sock is not None:
+            self.notify_sock.close()
+            self.notify_sock = None
+
+class ShmStatsEndpoint:
+    """Throughput, occupancy, latency and drop counters of one end, see TransportStats"""
+    transport_stats: TransportStats = None
+
+    def stats(self) -> dict:
+        return self.transport_stats.snapshot()
+
+    def enable_stats_log(self, path: str, interval=1.0):
+        """Appends stats() to path as JSON lines every interval seconds"""
+        self.transport_stats.enable_log(path, interval)
+
+class SharedMemOwner(ShmNotifyEndpoint, ShmStatsEndpoint):
+    """
+    Creates and owns a shared memory segment, registers it for stale cleanup
+    and unlinks it on cleanup(). Base for the senders. The name is random
+    unless the reader has to find the segment by a name agreed on beforehand.
+    """
+    def __init__(self, total_size, verbose=True, name=None):
+        self.total_size = total_size
+        self.sharedmem = shared_memory.SharedMemory(name=name, create=True, size=self.total_size)
 
         self.verbose = verbose
         self.did_unlink = False
@@ -77,15 +433,9 @@ class SharedMemSender:
         reg = {f"{self.sharedmem.name}" : time.time()}
         self.save_registry(reg)
 
-        # Initialize all blocks as available for writing
-        for i in range(num_blocks):
-            self.sharedmem.buf[i * block_size] = 0
+        self.transport_stats = TransportStats("sender", self.sharedmem.name, self.skipped_drops)
+        self.last_record_size = 0 # set by try_write()
 
-        self.blocks = [MemBlock(self.sharedmem, i * block_size, block_size) for i in range(num_blocks)]
-        self.current_block_inx = 0
-
-        self.total_data_dropped = 0
-    
     def check_buff_exists(self):
         return self.sharedmem is not None and self.sharedmem.buf is not None
     
@@ -128,55 +478,142 @@ class SharedMemSender:
         if len(removed):
             self.logthis(f"Cleaned up {len(removed)} forgotten shared_memory files")
 
-    def advance_block(self):
-        self.current_block_inx = (self.current_block_inx + 1) % self.num_blocks
+    def listen_notify(self):
+        """Opens the wakeup socket, returns the port to hand to the receiving process"""
+        self.notify_listener = socket.create_server(("127.0.0.1", 0))
+        return self.notify_listener.getsockname()[1]
+
+    def accept_notify(self, timeout=10):
+        self.notify_listener.settimeout(timeout)
+        try:
+            self.notify_sock, _ = self.notify_listener.accept()
+            self.notify_sock.setblocking(False)
+        except OSError as e:
+            self.logthis(f"Receiver never connected for wakeups, polling instead: {e}")
+        finally:
+            self.notify_listener.close()
+
+    def try_write(self, pickleable_data):
+        """Writes one record if there is room and sets last_record_size, returns False otherwise"""
+        raise NotImplementedError
+
+    def occupancy(self) -> float:
+        """Fraction of the transport holding records not read yet"""
+        raise NotImplementedError
+
+    def frames_skipped(self):
+        """Records the reader never got, for transports that overwrite or drop readers"""
+        return 0
+
+    def skipped_drops(self):
+        if not self.check_buff_exists():
+            return {}
+        skipped = self.frames_skipped()
+        return {"skipped": skipped} if skipped else {}
+
+    def _try_write_counted(self, pickleable_data):
+        try:
+            return self.try_write(pickleable_data)
+        except RecordTooLarge:
+            # a batch that is too large is split up by _send_split, only count what is given up on
+            if _frame_count(pickleable_data) < 2:
+                self.transport_stats.on_drop("too_large", _frame_count(pickleable_data))
+            raise
+
+    def _sent(self, pickleable_data):
+        self.transport_stats.on_record(self.last_record_size, _frame_count(pickleable_data), self.occupancy())
+        self.notify_peer()
 
     def send_data(self, pickleable_data, on_not_available=""):
 
         if not self.check_buff_exists():
             return False
 
-        # check if the proper next block is available
-        current_block = self.blocks[self.current_block_inx]
-        if not current_block.check_available_for_write():
+        if not self._try_write_counted(pickleable_data):
             self.total_data_dropped += 1
+            self.transport_stats.on_drop("full", _frame_count(pickleable_data))
             if on_not_available.lower() == "throw":
                 raise MemoryError("Previous data wasn't read, dropping data")
             elif on_not_available.lower() == "print":
                 self.logthis(f"Previous data wasn't read, dropping data, total: {self.total_data_dropped}")
+            return False
+
+        self._sent(pickleable_data)
+        return True
+
+    def send_data_wait(self, pickleable_data, timeout):
+        """
+        Blocks until there is room for the data, sleeping on the wakeup socket.
+        Returns False on timeout or when the receiver is gone.
+        """
+        if not self.check_buff_exists():
+            return False
+
+        deadline = time.time() + timeout
+        while not self._try_write_counted(pickleable_data):
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.peer_closed:
+                self.transport_stats.on_drop("receiver_gone" if self.peer_closed else "timeout",
+                                             _frame_count(pickleable_data))
                 return False
-            else:
-                return False
+            self.wait_notify(remaining)
 
-        bdata = pickle.dumps(pickleable_data)
-         
-        data_size = len(bdata)
+        self._sent(pickleable_data)
+        return True
 
-        # check if data fits
-        if not current_block.will_it_fit(data_size):
-            raise MemoryError("Data won't fit in block, increase block size")
-        
-        current_block.write_data(bdata)
-        current_block.make_available_read()
+    def _send_split(self, items: list, send):
+        """Sends items as one ShmBatch record, halving it until the parts fit"""
+        try:
+            return send(ShmBatch(items))
+        except RecordTooLarge:
+            if len(items) < 2:
+                raise
+        half = len(items) // 2
+        return self._send_split(items[:half], send) and self._send_split(items[half:], send)
 
-        self.advance_block()
+    def send_batch(self, items: list, on_not_available=""):
+        """
+        Sends several objects as one record, the receiver gets them back as a
+        ShmBatch from read_objdata() or as a list from read_batch(). Objects
+        shared by the items, like a common setup, are only serialized once.
+        A batch too big for one record is split up.
+        """
+        if not len(items):
+            return True
+        return self._send_split(list(items), lambda batch: self.send_data(batch, on_not_available))
 
+    def send_batch_wait(self, items: list, timeout):
+        """send_batch() that blocks like send_data_wait()"""
+        if not len(items):
+            return True
+        return self._send_split(list(items), lambda batch: self.send_data_wait(batch, timeout))
+
+    def wait_all_read(self, timeout):
+        deadline = time.time() + timeout
+        while self.check_buff_exists() and not self.are_all_read():
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.peer_closed:
+                return False
+            self.wait_notify(remaining)
         return True
 
-    def are_all_read(self):
-        if not self.check_buff_exists():
-            return False
-        return all(block.check_available_for_write() for block in self.blocks)
+    def release_views(self):
+        """Override to release memoryviews held on the segment before it is closed"""
+        pass
 
     def cleanup(self):
         if self.did_unlink:
             return
+        self.close_notify()
+        if self.transport_stats is not None:
+            self.transport_stats.close_log()
         if hasattr(self, 'sharedmem'):
             reg = self.load_registry()
             if self.sharedmem.name in reg:
                 del reg[self.sharedmem.name]
                 self.save_registry(reg)
 
+            self.release_views()
             self.sharedmem.close()
             self.sharedmem.unlink()
             self.did_unlink = True
@@ -184,22 +621,137 @@ class SharedMemSender:
     def __del__(self):
         self.cleanup()
 
-class SharedMemReceiver:
+class SharedMemSender(SharedMemOwner):
+
+    def __init__(self, block_size, num_blocks, verbose=True, typed_arrays=False):
+        """
+        typed_arrays: write numpy arrays as raw bytes next to a small pickled header
+        instead of pickling them, saves a copy on each side for big frames
+        """
+        self.block_size = block_size
+        self.num_blocks = num_blocks
+        super().__init__(block_size * num_blocks, verbose=verbose)
+
+        self.typed_arrays = typed_arrays
+
+        # Initialize all blocks as available for writing
+        for i in range(num_blocks):
+            self.sharedmem.buf[i * block_size] = 0
+
+        self.blocks = [MemBlock(self.sharedmem, i * block_size, block_size) for i in range(num_blocks)]
+        self.current_block_inx = 0
+
+        self.total_data_dropped = 0
+
+    def advance_block(self):
+        self.current_block_inx = (self.current_block_inx + 1) % self.num_blocks
+
+    def try_write(self, pickleable_data):
+
+        # check if the proper next block is available
+        current_block = self.blocks[self.current_block_inx]
+        if not current_block.check_available_for_write():
+            return False
+
+        if self.typed_arrays:
+            payload = TypedArrayPayload(pickleable_data)
+
+            if not current_block.will_it_fit(payload.size_at(current_block.payload_start())):
+                raise RecordTooLarge("Data won't fit in block, increase block size")
+
+            self.last_record_size = current_block.write_typed_arrays(payload)
+        else:
+            bdata = pickle.dumps(pickleable_data)
+            
+            data_size = len(bdata)
+
+            # check if data fits
+            if not current_block.will_it_fit(data_size):
+                raise RecordTooLarge("Data won't fit in block, increase block size")
+            
+            self.last_record_size = current_block.write_data(bdata)
+
+        current_block.make_available_read()
+
+        self.advance_block()
+
+        return True
+
+    def occupancy(self):
+        return sum(not block.check_available_for_write() for block in self.blocks) / self.num_blocks
+
+    def are_all_read(self):
+        if not self.check_buff_exists():
+            return False
+        return all(block.check_available_for_write() for block in self.blocks)
+
+class SharedMemUser(ShmNotifyEndpoint, ShmStatsEndpoint):
+    """Attaches to a segment created by a sender. Base for the receivers."""
+    def __init__(self, shm_name: str, verbose=False):
+        self.sharedmem = shared_memory.SharedMemory(name=shm_name)
+        self.total_size = self.sharedmem.size
+
+        self.verbose = verbose
+        self.did_cleanup = False
+
+        self.transport_stats = TransportStats("receiver", shm_name)
+
+    def check_buff_exists(self):
+        return self.sharedmem is not None and self.sharedmem.buf is not None
+
+    def read_batch(self, copy_arrays=True):
+        """Reads the next record as a list, one item unless it was sent with send_batch()"""
+        objdata = self.read_objdata(copy_arrays=copy_arrays)
+        if objdata is None:
+            return []
+        if type(objdata) is ShmBatch:
+            return list(objdata)
+        return [objdata]
+
+    def connect_notify(self, port: int):
+        """Connects to the sender's wakeup socket, see SharedMemOwner.listen_notify()"""
+        self.notify_sock = socket.create_connection(("127.0.0.1", int(port)), timeout=10)
+        self.notify_sock.setblocking(False)
+
+    def release_views(self):
+        """Override to give back held data and release memoryviews before the segment is closed"""
+        pass
+
+    def cleanup(self):
+        if self.did_cleanup:
+            return
+        self.did_cleanup = True
+        self.release_views()
+        self.close_notify()
+        self.transport_stats.close_log()
+        try:
+            self.sharedmem.close()
+        except BufferError:
+            # array views from read_objdata(copy_arrays=False) still alive, the
+            # mapping goes away with them
+            pass
+
+        # it registers itself on construction even though create=False, python issue,
+        # manually unregister if not windows
+        if not os.name=="nt":
+            resource_tracker.unregister(f"/{self.sharedmem.name}", 'shared_memory')
+
+    def __del__(self):
+        self.cleanup()
+
+class SharedMemReceiver(SharedMemUser):
     
     def __init__(self, shm_name: str, block_size: int, num_blocks: int, verbose=False):
+        super().__init__(shm_name, verbose=verbose)
         self.block_size = int(block_size)
         self.num_blocks = int(num_blocks)
         self.total_size = self.block_size * self.num_blocks
-        self.sharedmem = shared_memory.SharedMemory(name=shm_name)
         
         self.blocks = [MemBlock(self.sharedmem, i * self.block_size, self.block_size) for i in range(self.num_blocks)]
         self.current_block_inx = 0
-        
-        self.verbose = verbose
-        self.did_cleanup = False
-    
-    def check_buff_exists(self):
-        return self.sharedmem is not None and self.sharedmem.buf is not None
+
+        # block read without copying the arrays, given back on the next read
+        self.held_block: MemBlock = None
     
     def advance_block(self):
         self.current_block_inx = (self.current_block_inx + 1) % self.num_blocks
@@ -209,42 +761,794 @@ class SharedMemReceiver:
             return False
         return self.blocks[self.current_block_inx].check_available_for_read()
     
-    def read_objdata(self):
+    def release_held_block(self):
+        if self.held_block is not None:
+            self.held_block.make_available_write()
+            self.held_block = None
+            self.notify_peer()
+
+    def read_objdata(self, copy_arrays=True):
+        """
+        copy_arrays=False returns typed arrays as read-only views into the shared memory,
+        they are only valid until the next read_objdata() or release_held_block() call
+        """
         if not self.check_buff_exists():
             return None
 
+        self.release_held_block()
+
         if not self.check_data_ready():
             raise RuntimeError("Data not ready for reading, always check first")
 
-        objdata = self.blocks[self.current_block_inx].read_data_as_obj()
-        self.blocks[self.current_block_inx].make_available_write()
+        current_block = self.blocks[self.current_block_inx]
+        objdata = current_block.read_data_as_obj(copy_arrays=copy_arrays)
+        self.transport_stats.on_record(current_block.read_data_size(), _frame_count(objdata),
+                                       sent_at=current_block.read_sent_at())
+        if copy_arrays:
+            current_block.make_available_write()
+            self.notify_peer()
+        else:
+            self.held_block = current_block
         self.advance_block()
         
         return objdata
+
+    def release_views(self):
+        self.release_held_block()
+
+# ---------------- variable size ring ----------------
+
+RING_MAGIC = b"X7RB"
+
+# control area, cursors on separate cache lines so producer and consumer dont share one
+RING_CAPACITY_OFFS = 8
+RING_HEAD_OFFS = 64 # total bytes written, only written by the producer
+RING_WRITTEN_OFFS = 72 # number of records written, only written by the producer
+RING_TAIL_OFFS = 128 # total bytes consumed, only written by the consumer
+RING_CTRL_SIZE = 192
+
+RING_RHS = 16 # record header size, [record size u32][format u8][pad][send time f64]
+RING_TIME_OFFS = 8
+RING_RECORD_ALIGN = 8
+RING_WRAP = 2**32 - 1 # record size marking "continue at the start of the ring"
+
+class SharedMemRingSender(SharedMemOwner):
+    """
+    Single producer, single consumer byte ring with variable length records.
+
+    Unlike SharedMemSender there are no fixed blocks, every record only takes
+    the space it needs, so capacity only has to cover the real throughput.
+    The head and tail cursors are ever increasing byte counts, the producer
+    only writes head and the consumer only writes tail, so no locking is needed.
+    A record never wraps, if it doesnt fit before the end of the ring a wrap
+    marker is written and the record starts at the beginning.
+    """
+    MAGIC = RING_MAGIC
+    CTRL_SIZE = RING_CTRL_SIZE
+
+    def __init__(self, capacity, verbose=True, typed_arrays=False, extra_size=0):
+        """extra_size: bytes reserved after the ring data for subclasses"""
+        self.capacity = _align(int(capacity), RING_RECORD_ALIGN)
+        super().__init__(self.CTRL_SIZE + self.capacity + extra_size, verbose=verbose)
+
+        self.typed_arrays = typed_arrays
+
+        self.sharedmem.buf[:self.CTRL_SIZE] = bytes(self.CTRL_SIZE)
+        self.sharedmem.buf[RING_CAPACITY_OFFS: RING_CAPACITY_OFFS + 8] = self.capacity.to_bytes(8, byteorder="little")
+        self.sharedmem.buf[:len(self.MAGIC)] = self.MAGIC
+
+        self.cursors = self.sharedmem.buf[:self.CTRL_SIZE].cast("Q")
+        self.head = 0
+        self.records_written = 0
+
+        self.total_data_dropped = 0
+
+    def max_record_size(self):
+        # a record has to fit contiguously even when the free space is split by the end of the ring
+        return self.capacity // 2
+
+    def min_tail(self):
+        """Oldest byte still needed by a reader"""
+        return self.cursors[RING_TAIL_OFFS // 8]
+
+    def free_space(self):
+        return self.capacity - (self.head - self.min_tail())
+
+    def make_space(self, needed):
+        """Called when a record doesnt fit, returns True if room was made"""
+        return False
+
+    def _prepare_record(self, pickleable_data, pos):
+        """Returns (record size, format, write function) for a record starting at ring position pos"""
+        payload_start = self.CTRL_SIZE + pos + RING_RHS
+        if self.typed_arrays:
+            payload = TypedArrayPayload(pickleable_data)
+            size = _align(RING_RHS + payload.size_at(payload_start), RING_RECORD_ALIGN)
+            return size, FMT_TYPED_ARRAYS, lambda start: payload.write(self.sharedmem.buf, start)
+
+        bdata = pickle.dumps(pickleable_data)
+        size = _align(RING_RHS + len(bdata), RING_RECORD_ALIGN)
+
+        def write(start):
+            self.sharedmem.buf[start: start + len(bdata)] = bdata
+        return size, FMT_PICKLE, write
+
+    def try_write(self, pickleable_data):
+
+        pos = self.head % self.capacity
+        rec_size, fmt, write = self._prepare_record(pickleable_data, pos)
+
+        until_end = self.capacity - pos
+        skip = 0
+        if rec_size > until_end:
+            # typed array padding depends on the position, redo it for the start of the ring
+            skip = until_end
+            rec_size, fmt, write = self._prepare_record(pickleable_data, 0)
+
+        if rec_size > self.max_record_size():
+            raise RecordTooLarge("Data won't fit in ring, increase capacity")
+
+        if skip + rec_size > self.free_space() and not self.make_space(skip + rec_size):
+            return False
+
+        if skip:
+            self.sharedmem.buf[self.CTRL_SIZE + pos: self.CTRL_SIZE + pos + 4] = RING_WRAP.to_bytes(4, byteorder="little")
+            pos = 0
+
+        start = self.CTRL_SIZE + pos
+        self.sharedmem.buf[start: start + 4] = rec_size.to_bytes(4, byteorder="little")
+        self.sharedmem.buf[start + 4] = fmt
+        _write_time(self.sharedmem.buf, start + RING_TIME_OFFS, time.time())
+        write(start + RING_RHS)
+        self.last_record_size = rec_size
+
+        # publish, the consumer only looks at bytes before head
+        self.head += skip + rec_size
+        self.records_written += 1
+        self.cursors[RING_WRITTEN_OFFS // 8] = self.records_written
+        self.cursors[RING_HEAD_OFFS // 8] = self.head
+
+        return True
+
+    def occupancy(self):
+        return (self.head - self.min_tail()) / self.capacity
+
+    def are_all_read(self):
+        if not self.check_buff_exists():
+            return False
+        return self.min_tail() == self.head
+
+    def release_views(self):
+        if hasattr(self, "cursors"):
+            self.cursors.release()
+
+class SharedMemRingReceiver(SharedMemUser):
+
+    MAGIC = RING_MAGIC
+    CTRL_SIZE = RING_CTRL_SIZE
     
-    def cleanup(self):
-        if self.did_cleanup:
+    def __init__(self, shm_name: str, verbose=False):
+        super().__init__(shm_name, verbose=verbose)
+
+        if bytes(self.sharedmem.buf[:len(self.MAGIC)]) != self.MAGIC:
+            raise RuntimeError(f"Shared memory {shm_name} is not a ring")
+
+        self.capacity = int.from_bytes(self.sharedmem.buf[RING_CAPACITY_OFFS: RING_CAPACITY_OFFS + 8], byteorder="little")
+        self.cursors = self.sharedmem.buf[:self.CTRL_SIZE].cast("Q")
+        self.tail_offs = self.attach_reader()
+        self.tail = self.cursors[self.tail_offs // 8]
+
+        # tail after a record read without copying the arrays, published on the next read
+        self.held_tail = None
+
+    def attach_reader(self):
+        """Returns the offset of this reader's tail cursor in the control area"""
+        return RING_TAIL_OFFS
+
+    def check_data_ready(self):
+        if not self.check_buff_exists():
+            return False
+        return self.cursors[RING_HEAD_OFFS // 8] != self.tail
+
+    def release_held_block(self):
+        if self.held_tail is not None:
+            self.cursors[self.tail_offs // 8] = self.held_tail
+            self.held_tail = None
+            self.notify_peer()
+
+    def read_objdata(self, copy_arrays=True):
+        """
+        copy_arrays=False returns typed arrays as read-only views into the shared memory,
+        they are only valid until the next read_objdata() or release_held_block() call
+        """
+        if not self.check_buff_exists():
+            return None
+
+        self.release_held_block()
+
+        if not self.check_data_ready():
+            raise RuntimeError("Data not ready for reading, always check first")
+
+        objdata = self.read_record(copy_arrays)
+        self.transport_stats.on_record(self.last_record_size, _frame_count(objdata), sent_at=self.last_sent_at)
+
+        if copy_arrays:
+            self.cursors[self.tail_offs // 8] = self.tail
+            self.notify_peer()
+        else:
+            self.held_tail = self.tail
+
+        return objdata
+
+    def read_record(self, copy_arrays):
+        """Parses the record at the tail and moves the local tail past it, without publishing it"""
+        pos = self.tail % self.capacity
+        rec_size = int.from_bytes(self.sharedmem.buf[self.CTRL_SIZE + pos: self.CTRL_SIZE + pos + 4], byteorder="little")
+        if rec_size == RING_WRAP:
+            self.tail += self.capacity - pos
+            pos = 0
+            rec_size = int.from_bytes(self.sharedmem.buf[self.CTRL_SIZE: self.CTRL_SIZE + 4], byteorder="little")
+
+        start = self.CTRL_SIZE + pos
+        fmt = self.sharedmem.buf[start + 4]
+        self.last_sent_at = _read_time(self.sharedmem.buf, start + RING_TIME_OFFS)
+        self.last_record_size = rec_size
+        if fmt == FMT_TYPED_ARRAYS:
+            objdata = TypedArrayPayload.read(self.sharedmem.buf, start + RING_RHS, copy_arrays=copy_arrays)
+        else:
+            objdata = pickle.loads(self.sharedmem.buf[start + RING_RHS: start + rec_size])
+
+        self.tail += rec_size
+        return objdata
+
+    def release_views(self):
+        self.release_held_block()
+        if hasattr(self, "cursors"):
+            self.cursors.release()
+
+# ---------------- broadcast ring ----------------
+
+BROADCAST_MAGIC = b"X7BC"
+
+BROADCAST_PORT_OFFS = 16 # wakeup/registration socket of the producer
+BROADCAST_STICKY_GEN_OFFS = 24 # odd while the sticky record is written, 0 if there is none
+BROADCAST_STICKY_LEN_OFFS = 32
+BROADCAST_STICKY_SIZE_OFFS = 40 # size of the sticky area after the ring data
+BROADCAST_READERS_OFFS = 128 # reader table, one cache line per reader
+BROADCAST_READER_STRIDE = 64
+BROADCAST_MAX_READERS = 8
+BROADCAST_CTRL_SIZE = BROADCAST_READERS_OFFS + BROADCAST_MAX_READERS * BROADCAST_READER_STRIDE
+
+# reader table entry
+BROADCAST_ACTIVE = 0 # producer, 1 while the reader is attached
+BROADCAST_TAIL = 8 # consumer, bytes consumed
+BROADCAST_KICK = 16 # producer, differs from ack while the reader is dropped
+BROADCAST_ACK = 24 # consumer
+BROADCAST_READ = 32 # consumer, records read
+BROADCAST_SKIPPED = 40 # consumer, records skipped after being dropped
+
+def _reader_field(reader: int, field: int) -> int:
+    """Index into the control area cast to u64"""
+    return (BROADCAST_READERS_OFFS + reader * BROADCAST_READER_STRIDE + field) // 8
+
+class SharedMemBroadcastSender(SharedMemRingSender):
+    """
+    Ring with one tail cursor per reader, so the same stream can be read by the
+    plotting process, a recorder and an analysis process at the same time.
+    Space is reclaimed once every attached reader has passed it.
+
+    Readers register over the wakeup socket, whose port is in the header, so
+    attaching only needs the shared memory name (see open_shm_receiver). An
+    accept thread hands out the reader slots, so a reader can attach while
+    the producer is idle, e.g. paused or before its first record. The
+    reader table and reader_socks are only changed under readers_lock.
+    A reader that is too slow either holds the producer back (send_data_wait
+    waits, send_data drops the new record) or, with drop_slow_readers, is
+    dropped: on its next read it skips to the newest data and counts what it missed.
+
+    Readers start at the newest data, the sticky record (set_sticky()) is what
+    every reader gets first no matter when it attaches, e.g. the plot parameters.
+    """
+    MAGIC = BROADCAST_MAGIC
+    CTRL_SIZE = BROADCAST_CTRL_SIZE
+    ACCEPT_POLL_S = 0.1 # longest the accept thread sleeps between looks at accepting
+
+    def __init__(self, capacity, verbose=True, typed_arrays=False, drop_slow_readers=False, sticky_size=65536):
+        self.sticky_size = _align(int(sticky_size), RING_RECORD_ALIGN)
+        super().__init__(capacity, verbose=verbose, typed_arrays=typed_arrays, extra_size=self.sticky_size)
+
+        self.drop_slow_readers = drop_slow_readers
+        self.sticky_start = self.CTRL_SIZE + self.capacity
+        self.cursors[BROADCAST_STICKY_SIZE_OFFS // 8] = self.sticky_size
+        self.reader_socks: dict[int, socket.socket] = {}
+        self.readers_lock = threading.RLock()
+        self.readers_changed = threading.Condition(self.readers_lock)
+
+        port = super().listen_notify()
+        self.notify_listener.setblocking(False)
+        self.cursors[BROADCAST_PORT_OFFS // 8] = port
+
+        self.accepting = True
+        self.accept_thread = threading.Thread(target=self.accept_loop, name="ShmBroadcastAccept", daemon=True)
+        self.accept_thread.start()
+
+    def listen_notify(self):
+        # listening since construction, readers find the port in the header
+        return self.cursors[BROADCAST_PORT_OFFS // 8]
+
+    def set_sticky(self, pickleable_data):
+        bdata = pickle.dumps(pickleable_data)
+        if len(bdata) > self.sticky_size:
+            raise MemoryError("Sticky data won't fit, increase sticky_size")
+
+        gen = self.cursors[BROADCAST_STICKY_GEN_OFFS // 8]
+        self.cursors[BROADCAST_STICKY_GEN_OFFS // 8] = gen + 1
+        self.cursors[BROADCAST_STICKY_LEN_OFFS // 8] = len(bdata)
+        self.sharedmem.buf[self.sticky_start: self.sticky_start + len(bdata)] = bdata
+        self.cursors[BROADCAST_STICKY_GEN_OFFS // 8] = gen + 2
+
+        self.notify_peer()
+
+    def accept_loop(self):
+        while self.accepting:
+            try:
+                readable, _, _ = select.select([self.notify_listener], [], [], self.ACCEPT_POLL_S)
+            except (OSError, ValueError):
+                return # listener closed
+            if readable:
+                self.accept_readers()
+
+    def accept_readers(self):
+        while True:
+            try:
+                conn, _ = self.notify_listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return # listener closed
+
+            with self.readers_lock:
+                self.register_reader(conn)
+
+    def register_reader(self, conn: socket.socket):
+        free = [i for i in range(BROADCAST_MAX_READERS) if i not in self.reader_socks]
+        if not len(free):
+            self.logthis(f"All {BROADCAST_MAX_READERS} reader slots of {self.sharedmem.name} taken, refusing reader")
+            conn.close()
             return
-        self.did_cleanup = True
-        self.sharedmem.close()
 
-        # it registers itself on construction even though create=False, python issue,
-        # manually unregister if not windows
-        if not os.name=="nt":
-            resource_tracker.unregister(f"/{self.sharedmem.name}", 'shared_memory')
+        # new readers start at the newest data
+        reader = free[0]
+        self.cursors[_reader_field(reader, BROADCAST_TAIL)] = self.head
+        self.cursors[_reader_field(reader, BROADCAST_KICK)] = self.cursors[_reader_field(reader, BROADCAST_ACK)]
+        self.cursors[_reader_field(reader, BROADCAST_READ)] = self.records_written
+        self.cursors[_reader_field(reader, BROADCAST_SKIPPED)] = 0
+        self.cursors[_reader_field(reader, BROADCAST_ACTIVE)] = 1
 
-    def __del__(self):
-        self.cleanup()
+        conn.sendall(bytes([reader]))
+        conn.setblocking(False)
+        self.reader_socks[reader] = conn
+        self.logthis(f"Reader {reader} attached to {self.sharedmem.name}")
+        self.readers_changed.notify_all()
 
-        
+    def detach_reader(self, reader: int):
+        with self.readers_lock:
+            self.cursors[_reader_field(reader, BROADCAST_ACTIVE)] = 0
+            self.reader_socks.pop(reader).close()
+        self.logthis(f"Reader {reader} detached from {self.sharedmem.name}")
 
-        
+    def accept_notify(self, timeout=10):
+        """Waits until the first reader, normally the plotting process, has attached"""
+        with self.readers_changed:
+            if not self.readers_changed.wait_for(lambda: len(self.reader_socks), timeout):
+                self.logthis("No reader attached to the broadcast")
 
+    def notify_peer(self):
+        with self.readers_lock:
+            for reader, sock in list(self.reader_socks.items()):
+                try:
+                    sock.send(b"\x01")
+                except (BlockingIOError, InterruptedError):
+                    pass
+                except OSError:
+                    self.detach_reader(reader)
 
+    def drain_notify(self):
+        """Eats pending wakeups and drops readers that went away"""
+        with self.readers_lock:
+            for reader, sock in list(self.reader_socks.items()):
+                try:
+                    while True:
+                        if not sock.recv(4096):
+                            self.detach_reader(reader)
+                            break
+                except (BlockingIOError, InterruptedError):
+                    pass
+                except OSError:
+                    self.detach_reader(reader)
+        return True
 
-        
+    def wait_notify(self, timeout):
+        with self.readers_changed:
+            socks = list(self.reader_socks.values())
+            if not len(socks):
+                # nothing to wake us but a reader attaching
+                self.readers_changed.wait(timeout)
+                return
+        select.select(socks, [], [], timeout)
+        self.drain_notify()
 
-        
-        
-        
+    def close_notify(self):
+        self.accepting = False
+        accept_thread = getattr(self, "accept_thread", None)
+        if accept_thread is not None and accept_thread is not threading.current_thread():
+            accept_thread.join()
+        with self.readers_lock:
+            for reader in list(self.reader_socks):
+                self.detach_reader(reader)
+        if hasattr(self, "notify_listener"):
+            self.notify_listener.close()
+
+    def is_dropped(self, reader: int):
+        return self.cursors[_reader_field(reader, BROADCAST_KICK)] != self.cursors[_reader_field(reader, BROADCAST_ACK)]
+
+    def min_tail(self):
+        tails = [self.cursors[_reader_field(reader, BROADCAST_TAIL)]
+                 for reader in self.reader_socks if not self.is_dropped(reader)]
+        return min(tails) if len(tails) else self.head
+
+    def make_space(self, needed):
+        if not self.drop_slow_readers:
+            return False
+
+        # the reader resyncs to the head on its next read and throws away
+        # anything it was reading while this happened
+        for reader in self.reader_socks:
+            if not self.is_dropped(reader) and self.cursors[_reader_field(reader, BROADCAST_TAIL)] < self.head + needed - self.capacity:
+                self.cursors[_reader_field(reader, BROADCAST_KICK)] += 1
+        return True
+
+    def try_write(self, pickleable_data):
+        # a reader attaching mid write would start at a head that is about to move
+        with self.readers_lock:
+            self.drain_notify()
+            return super().try_write(pickleable_data)
+
+    def frames_skipped(self):
+        """Records lost by dropped readers, summed over all readers"""
+        if not self.check_buff_exists():
+            return 0
+        return sum(self.cursors[_reader_field(reader, BROADCAST_SKIPPED)] for reader in range(BROADCAST_MAX_READERS))
+
+class SharedMemBroadcastReceiver(SharedMemRingReceiver):
+
+    MAGIC = BROADCAST_MAGIC
+    CTRL_SIZE = BROADCAST_CTRL_SIZE
+
+    def attach_reader(self):
+        port = self.cursors[BROADCAST_PORT_OFFS // 8]
+        self.notify_sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+        # the producer's accept thread hands out the reader slots
+        reply = self.notify_sock.recv(1)
+        if not reply:
+            raise RuntimeError("Broadcast has no free reader slots")
+        self.notify_sock.setblocking(False)
+
+        self.reader = reply[0]
+        self.records_read = self.cursors[_reader_field(self.reader, BROADCAST_READ)]
+        self.total_skipped = 0
+
+        self.sticky_start = self.CTRL_SIZE + self.capacity
+        self.sticky_seen = 0 # generation of the last sticky record read
+        return BROADCAST_READERS_OFFS + self.reader * BROADCAST_READER_STRIDE + BROADCAST_TAIL
+
+    def connect_notify(self, port: int):
+        # already connected when attaching
+        pass
+
+    def was_dropped(self):
+        return self.cursors[_reader_field(self.reader, BROADCAST_KICK)] != self.cursors[_reader_field(self.reader, BROADCAST_ACK)]
+
+    def resync(self):
+        """Skips to the newest data after the producer dropped this reader"""
+        written = self.cursors[RING_WRITTEN_OFFS // 8]
+        self.tail = self.cursors[RING_HEAD_OFFS // 8]
+
+        self.total_skipped += written - self.records_read
+        self.records_read = written
+        self.cursors[_reader_field(self.reader, BROADCAST_SKIPPED)] = self.total_skipped
+        self.cursors[_reader_field(self.reader, BROADCAST_READ)] = self.records_read
+        self.cursors[self.tail_offs // 8] = self.tail
+        self.cursors[_reader_field(self.reader, BROADCAST_ACK)] = self.cursors[_reader_field(self.reader, BROADCAST_KICK)]
+        self.notify_peer()
+
+    def sticky_pending(self):
+        gen = self.cursors[BROADCAST_STICKY_GEN_OFFS // 8]
+        return gen != 0 and gen % 2 == 0 and gen != self.sticky_seen
+
+    def read_sticky(self):
+        gen = self.cursors[BROADCAST_STICKY_GEN_OFFS // 8]
+        size = self.cursors[BROADCAST_STICKY_LEN_OFFS // 8]
+        bdata = bytes(self.sharedmem.buf[self.sticky_start: self.sticky_start + size])
+        if self.cursors[BROADCAST_STICKY_GEN_OFFS // 8] != gen:
+            return None # rewritten while copying, picked up on the next read
+        self.sticky_seen = gen
+        return pickle.loads(bdata)
+
+    def check_data_ready(self):
+        if not self.check_buff_exists():
+            return False
+        if self.sticky_pending():
+            return True
+        if self.was_dropped():
+            self.resync()
+        return super().check_data_ready()
+
+    def read_objdata(self, copy_arrays=True):
+        """
+        Always copies, the producer may drop this reader and reuse the space
+        while it is being read. Returns None if that happened during the read.
+        A new sticky record is returned before anything else.
+        """
+        if not self.check_buff_exists():
+            return None
+
+        if not self.check_data_ready():
+            raise RuntimeError("Data not ready for reading, always check first")
+
+        if self.sticky_pending():
+            return self.read_sticky()
+
+        try:
+            objdata = self.read_record(copy_arrays=True)
+        except Exception:
+            if not self.was_dropped():
+                raise
+            objdata = None
+
+        if self.was_dropped():
+            self.resync()
+            return None
+
+        self.records_read += 1
+        self.cursors[_reader_field(self.reader, BROADCAST_READ)] = self.records_read
+        self.cursors[self.tail_offs // 8] = self.tail
+        self.notify_peer()
+        self.transport_stats.on_record(self.last_record_size, _frame_count(objdata), sent_at=self.last_sent_at)
+
+        return objdata
+
+# ---------------- latest value mailbox ----------------
+
+MAILBOX_MAGIC = b"X7MB"
+
+MAILBOX_POLICY_OFFS = 4
+MAILBOX_NUM_SLOTS_OFFS = 8
+MAILBOX_CTRL_SLOT_SIZE_OFFS = 16
+MAILBOX_LATEST_OFFS = 64 # sequence number of the newest complete record, only written by the producer
+MAILBOX_READ_OFFS = 128 # sequence number of the last record read, only written by the consumer
+MAILBOX_SKIPPED_OFFS = 136 # records the consumer never got, only written by the consumer
+MAILBOX_CTRL_SIZE = 192
+
+# slot header, [generation u64][sequence number u64][format u8][pad][data size u32][send time f64][pad to 64]
+MAILBOX_SLOT_SEQ_OFFS = 8
+MAILBOX_SLOT_FMT_OFFS = 16
+MAILBOX_SLOT_SIZE_OFFS = 20
+MAILBOX_SLOT_TIME_OFFS = 24
+MAILBOX_SHS = 64
+
+MAILBOX_LATEST_WINS = 0 # reader always jumps to the newest record
+MAILBOX_OVERWRITE_OLDEST = 1 # reader goes in order, but records overwritten before it got there are skipped
+
+class SharedMemMailboxSender(SharedMemOwner):
+    """
+    Fixed slots that the producer overwrites round robin without ever waiting
+    for the reader, for live data where only the newest frame matters.
+
+    Each slot has a generation counter that is odd while the slot is written
+    (a seqlock), the reader copies the record out and retries if the generation
+    changed under it. The reader counts the records it never got in the header.
+    """
+    def __init__(self, slot_size, num_slots=3, verbose=True, typed_arrays=False, policy=MAILBOX_LATEST_WINS, name=None):
+        # with fewer than 3 slots the producer would keep overwriting the slot being read
+        self.num_slots = max(int(num_slots), 3)
+        self.slot_size = _align(int(slot_size))
+        super().__init__(MAILBOX_CTRL_SIZE + self.slot_size * self.num_slots, verbose=verbose, name=name)
+
+        self.typed_arrays = typed_arrays
+
+        self.sharedmem.buf[:MAILBOX_CTRL_SIZE] = bytes(MAILBOX_CTRL_SIZE)
+        self.sharedmem.buf[MAILBOX_POLICY_OFFS] = policy
+        self.sharedmem.buf[MAILBOX_NUM_SLOTS_OFFS: MAILBOX_NUM_SLOTS_OFFS + 4] = self.num_slots.to_bytes(4, byteorder="little")
+        self.sharedmem.buf[MAILBOX_CTRL_SLOT_SIZE_OFFS: MAILBOX_CTRL_SLOT_SIZE_OFFS + 8] = self.slot_size.to_bytes(8, byteorder="little")
+        for i in range(self.num_slots):
+            start = MAILBOX_CTRL_SIZE + i * self.slot_size
+            self.sharedmem.buf[start: start + MAILBOX_SHS] = bytes(MAILBOX_SHS)
+        self.sharedmem.buf[:len(MAILBOX_MAGIC)] = MAILBOX_MAGIC
+
+        self.ctrl = self.sharedmem.buf[:MAILBOX_CTRL_SIZE].cast("Q")
+        self.slot_headers = [self.sharedmem.buf[MAILBOX_CTRL_SIZE + i * self.slot_size:
+                                                MAILBOX_CTRL_SIZE + i * self.slot_size + 16].cast("Q")
+                             for i in range(self.num_slots)]
+        self.seq = 0
+
+        self.total_data_dropped = 0
+
+    def frames_skipped(self):
+        """Records overwritten before the reader got to them"""
+        if not self.check_buff_exists():
+            return 0
+        return self.ctrl[MAILBOX_SKIPPED_OFFS // 8]
+
+    def try_write(self, pickleable_data):
+        seq = self.seq + 1
+        slot = seq % self.num_slots
+        start = MAILBOX_CTRL_SIZE + slot * self.slot_size
+        payload_start = start + MAILBOX_SHS
+
+        if self.typed_arrays:
+            payload = TypedArrayPayload(pickleable_data)
+            data_size = payload.size_at(payload_start)
+            fmt = FMT_TYPED_ARRAYS
+        else:
+            bdata = pickle.dumps(pickleable_data)
+            data_size = len(bdata)
+            fmt = FMT_PICKLE
+
+        if data_size + MAILBOX_SHS > self.slot_size:
+            raise RecordTooLarge("Data won't fit in mailbox slot, increase slot size")
+
+        header = self.slot_headers[slot]
+        header[0] += 1 # odd, being written
+        header[MAILBOX_SLOT_SEQ_OFFS // 8] = seq
+        self.sharedmem.buf[start + MAILBOX_SLOT_FMT_OFFS] = fmt
+        self.sharedmem.buf[start + MAILBOX_SLOT_SIZE_OFFS: start + MAILBOX_SLOT_SIZE_OFFS + 4] = data_size.to_bytes(4, byteorder="little")
+        _write_time(self.sharedmem.buf, start + MAILBOX_SLOT_TIME_OFFS, time.time())
+        if self.typed_arrays:
+            payload.write(self.sharedmem.buf, payload_start)
+        else:
+            self.sharedmem.buf[payload_start: payload_start + data_size] = bdata
+        header[0] += 1 # even, complete
+
+        self.seq = seq
+        self.ctrl[MAILBOX_LATEST_OFFS // 8] = seq
+        self.last_record_size = data_size
+        return True
+
+    def occupancy(self):
+        return min(self.seq - self.ctrl[MAILBOX_READ_OFFS // 8], self.num_slots) / self.num_slots
+
+    def are_all_read(self):
+        if not self.check_buff_exists():
+            return False
+        return self.ctrl[MAILBOX_READ_OFFS // 8] >= self.seq
+
+    def release_views(self):
+        for header in getattr(self, "slot_headers", []):
+            header.release()
+        if hasattr(self, "ctrl"):
+            self.ctrl.release()
+
+class SharedMemMailboxReceiver(SharedMemUser):
+
+    MAX_READ_TRIES = 10
+
+    def __init__(self, shm_name: str, verbose=False):
+        super().__init__(shm_name, verbose=verbose)
+
+        if bytes(self.sharedmem.buf[:len(MAILBOX_MAGIC)]) != MAILBOX_MAGIC:
+            raise RuntimeError(f"Shared memory {shm_name} is not a mailbox")
+
+        self.policy = self.sharedmem.buf[MAILBOX_POLICY_OFFS]
+        self.num_slots = int.from_bytes(self.sharedmem.buf[MAILBOX_NUM_SLOTS_OFFS: MAILBOX_NUM_SLOTS_OFFS + 4], byteorder="little")
+        self.slot_size = int.from_bytes(self.sharedmem.buf[MAILBOX_CTRL_SLOT_SIZE_OFFS: MAILBOX_CTRL_SLOT_SIZE_OFFS + 8], byteorder="little")
+
+        self.ctrl = self.sharedmem.buf[:MAILBOX_CTRL_SIZE].cast("Q")
+        self.slot_headers = [self.sharedmem.buf[MAILBOX_CTRL_SIZE + i * self.slot_size:
+                                                MAILBOX_CTRL_SIZE + i * self.slot_size + 16].cast("Q")
+                             for i in range(self.num_slots)]
+        self.last_seq = self.ctrl[MAILBOX_READ_OFFS // 8]
+        self.total_skipped = self.ctrl[MAILBOX_SKIPPED_OFFS // 8]
+
+    def check_data_ready(self):
+        if not self.check_buff_exists():
+            return False
+        return self.ctrl[MAILBOX_LATEST_OFFS // 8] != self.last_seq
+
+    def release_held_block(self):
+        # records are always copied out, nothing is held
+        pass
+
+    def _next_seq(self):
+        latest = self.ctrl[MAILBOX_LATEST_OFFS // 8]
+        if self.policy == MAILBOX_LATEST_WINS:
+            return latest
+        # the producer may already be writing the slot after latest, which is the oldest one
+        return max(self.last_seq + 1, latest - self.num_slots + 2)
+
+    def _copy_record(self, seq):
+        """Returns (format, private copy, offset of the payload in it, send time) or None if the slot was overwritten"""
+        slot = seq % self.num_slots
+        header = self.slot_headers[slot]
+        start = MAILBOX_CTRL_SIZE + slot * self.slot_size
+        payload_start = start + MAILBOX_SHS
+
+        gen = header[0]
+        if gen % 2 or header[MAILBOX_SLOT_SEQ_OFFS // 8] != seq:
+            return None
+
+        fmt = self.sharedmem.buf[start + MAILBOX_SLOT_FMT_OFFS]
+        data_size = int.from_bytes(self.sharedmem.buf[start + MAILBOX_SLOT_SIZE_OFFS: start + MAILBOX_SLOT_SIZE_OFFS + 4], byteorder="little")
+        if data_size + MAILBOX_SHS > self.slot_size:
+            return None
+
+        # keep the same alignment in the copy so the typed array layout still matches
+        pad = payload_start % ARRAY_ALIGN
+        record = bytearray(pad + data_size)
+        record[pad:] = self.sharedmem.buf[payload_start: payload_start + data_size]
+        sent_at = _read_time(self.sharedmem.buf, start + MAILBOX_SLOT_TIME_OFFS)
+
+        if header[0] != gen:
+            return None
+        return fmt, record, pad, sent_at
+
+    def read_objdata(self, copy_arrays=True):
+        """
+        Records are always copied out of the shared memory since the producer
+        can overwrite a slot at any time, so copy_arrays doesnt matter here.
+        """
+        if not self.check_buff_exists():
+            return None
+
+        if not self.check_data_ready():
+            raise RuntimeError("Data not ready for reading, always check first")
+
+        for _ in range(self.MAX_READ_TRIES):
+            seq = self._next_seq()
+            copied = self._copy_record(seq)
+            if copied is not None:
+                break
+        else:
+            raise RuntimeError("Mailbox slots overwritten faster than they can be read")
+
+        fmt, record, offs, sent_at = copied
+        if fmt == FMT_TYPED_ARRAYS:
+            objdata = TypedArrayPayload.read(memoryview(record), offs, copy_arrays=False, writeable=True)
+        else:
+            objdata = pickle.loads(record[offs:])
+        self.transport_stats.on_record(len(record) - offs, _frame_count(objdata), sent_at=sent_at)
+
+        self.total_skipped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.ctrl[MAILBOX_SKIPPED_OFFS // 8] = self.total_skipped
+        self.ctrl[MAILBOX_READ_OFFS // 8] = seq
+        self.notify_peer()
+
+        return objdata
+
+    def release_views(self):
+        for header in getattr(self, "slot_headers", []):
+            header.release()
+        if hasattr(self, "ctrl"):
+            self.ctrl.release()
+
+def open_shm_receiver(shm_name: str, block_size: int, num_blocks: int, verbose=False):
+    """
+    Attaches the right receiver for a segment made by SharedMemSender,
+    SharedMemRingSender, SharedMemBroadcastSender or SharedMemMailboxSender.
+    The others describe themselves, so block_size and num_blocks are only used
+    for the fixed block layout.
+    """
+    probe = shared_memory.SharedMemory(name=shm_name)
+    magic = bytes(probe.buf[:len(RING_MAGIC)])
+    # no unregister here, the tracker keeps one entry per name and the
+    # receiver below unregisters it on cleanup
+    probe.close()
 
+    if magic == RING_MAGIC:
+        return SharedMemRingReceiver(shm_name, verbose=verbose)
+    if magic == BROADCAST_MAGIC:
+        return SharedMemBroadcastReceiver(shm_name, verbose=verbose)
+    if magic == MAILBOX_MAGIC:
+        return SharedMemMailboxReceiver(shm_name, verbose=verbose)
+    return SharedMemReceiver(shm_name, block_size, num_blocks, verbose=verbose)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import time
+import secrets
+
+from Utils.sharedmem_handler import SharedMemMailboxSender, SharedMemMailboxReceiver
+
+# Back channel from a plotter to its node: the plotter publishes what it
+# currently shows (e.g. which slices of a cube), the node only prepares and
+# sends that. A small latest-wins mailbox owned by the plotting process, under
+# a name the node picks and hands over in the setup dict.
+
+VIEW_SLOT_SIZE = 4096 # a small dict of indices
+ATTACH_RETRY_INTERVAL = 1.0 # seconds between looks for the plotter's mailbox
+
+def new_view_channel_name() -> str:
+    # short, macOS allows 31 characters
+    return f"x7view_{secrets.token_hex(6)}"
+
+class ViewPublisher:
+    """Plotting process side, publishes the view state when it changes"""
+    def __init__(self, name: str):
+        self.sender = SharedMemMailboxSender(VIEW_SLOT_SIZE, verbose=False, name=name)
+        self.last_state = None
+
+    def publish(self, state: dict):
+        if state == self.last_state:
+            return
+        self.sender.try_write(state)
+        self.last_state = state
+
+    def cleanup(self):
+        self.sender.cleanup()
+
+class ViewSubscriber:
+    """
+    Node side, latest() gives the newest view state published, None until
+    the plotter published one. The mailbox is looked for now and then until the
+    plotter created it, so a plotter that never publishes costs nothing.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.receiver: SharedMemMailboxReceiver = None
+        self.next_attach_try = 0.0
+        self.state = None
+
+    def latest(self) -> dict | None:
+        if self.receiver is None:
+            now = time.monotonic()
+            if now < self.next_attach_try:
+                return self.state
+            self.next_attach_try = now + ATTACH_RETRY_INTERVAL
+            try:
+                self.receiver = SharedMemMailboxReceiver(self.name)
+            except (FileNotFoundError, RuntimeError):
+                return self.state # not created, or not initialized yet
+
+        if self.receiver.check_data_ready():
+            self.state = self.receiver.read_objdata()
+        return self.state
+
+    def cleanup(self):
+        if self.receiver is not None:
+            self.receiver.cleanup()
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the nodes and plotters import each other as top level packages (Utils, RangeDopplerPlotter, ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture(autouse=True)
+def shm_registry(tmp_path, monkeypatch):
+    """The shared memory registry of the senders a test makes, kept out of the package"""
+    from Utils import sharedmem_handler
+    reg_file = tmp_path / "logs" / "sharedmem_reg.txt"
+    monkeypatch.setattr(sharedmem_handler, "REG_FILE", str(reg_file))
+    return reg_file
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import os
+import sys
+import json
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Utils.sharedmem_handler import open_shm_receiver
+
+# Stand-in plotting process for test_plot_sender_order: records what arrives,
+# "SETUP" for the setup dict and the frame number for frames, in order, and
+# writes the list as JSON to $X7_ORDER_OUT once the node closed the transport.
+
+if __name__ == "__main__":
+    shm_name, shm_blocksize, shm_blockcount, close_path, notify_port = sys.argv[1:6]
+
+    sharedmem = open_shm_receiver(shm_name=shm_name, block_size=shm_blocksize, num_blocks=shm_blockcount)
+    sharedmem.connect_notify(notify_port)
+    print("PLOTTING_PROCESS_READY", flush=True)
+
+    received = []
+    while os.path.exists(close_path) or sharedmem.check_data_ready():
+        if not sharedmem.check_data_ready():
+            sharedmem.wait_notify(0.05)
+            continue
+        for item in sharedmem.read_batch():
+            received.append("SETUP" if "frame_schema" in item else item["frame"])
+
+    with open(os.environ["X7_ORDER_OUT"], "w") as f:
+        json.dump(received, f)
+    sharedmem.cleanup()
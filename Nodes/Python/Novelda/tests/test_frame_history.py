@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from Utils import frame_history
+from Utils.frame_history import FrameHistory, seek_frame
+
+@dataclass
+class Frame:
+    power: np.ndarray
+    label: str
+    timestamp: float
+    seq_num: int
+
+def make_frame(seq_num: int, size: int = 256) -> Frame:
+    return Frame(power=np.full(size, seq_num, dtype=np.float32), label=f"frame {seq_num}",
+                 timestamp=1000.0 * seq_num, seq_num=seq_num)
+
+def history_numbers(history: FrameHistory) -> list:
+    return [history[i].seq_num for i in range(len(history))]
+
+def test_ring_starts_small_and_grows(monkeypatch):
+    monkeypatch.setattr(frame_history, "INITIAL_RING_BYTES", 4 * 1024)
+    history = FrameHistory(max_bytes=64 * 1024)
+
+    history.append(make_frame(0))
+    assert history.capacity == 4 # 1 kB rows in the initial 4 kB
+    for seq_num in range(1, 40):
+        history.append(make_frame(seq_num))
+
+    assert history.capacity == 64 # doubled up to the byte cap
+    assert history.evicted == 0
+    assert history_numbers(history) == list(range(40))
+    np.testing.assert_array_equal(history[-1].power, np.full(256, 39, dtype=np.float32))
+
+def test_frame_count_sizes_the_ring_and_evicts_oldest():
+    history = FrameHistory(max_frames=5)
+
+    for seq_num in range(12):
+        history.append(make_frame(seq_num))
+
+    assert history.capacity == 5
+    assert history.evicted == 7
+    assert history_numbers(history) == list(range(7, 12))
+    assert history.index_of(history.frame_id(0)) == 0
+    assert history.index_of(6) is None # evicted
+    assert history.seek.index_of_seq(9) == 2
+    assert history[0].label == "frame 7"
+
+def test_larger_frame_regrows_the_rows():
+    history = FrameHistory(max_frames=4)
+    history.append(make_frame(0, size=16))
+    history.append(make_frame(1, size=1024))
+
+    assert history.row_bytes >= 1024 * 4
+    assert [history[i].power.size for i in range(2)] == [16, 1024]
+
+@pytest.mark.parametrize("float16", [False, True])
+def test_spill_keeps_evicted_frames(tmp_path, float16):
+    history = FrameHistory(max_frames=3)
+    history.enable_spill(str(tmp_path), float16=float16)
+
+    for seq_num in range(10):
+        history.append(make_frame(seq_num))
+
+    assert len(history) == 10
+    assert history.num_spilled == 7
+    assert history.evicted == 0
+    for seq_num in range(10):
+        frame = history[seq_num]
+        assert frame.label == f"frame {seq_num}"
+        assert frame.power.dtype == np.float32
+        np.testing.assert_array_equal(frame.power, np.full(256, seq_num, dtype=np.float32))
+
+    history.clear()
+    assert len(history) == 0 and history.evicted == 10
+    history.close()
+
+def test_seek_by_number_sequence_and_time():
+    history = FrameHistory(max_frames=10)
+    for seq_num in range(10, 20):
+        history.append(make_frame(seq_num))
+
+    assert seek_frame("3", history.seek) == 2
+    assert seek_frame("#15", history.seek) == 5
+    assert seek_frame("2.5s", history.seek) == 2 # the last frame at or before 10 s + 2.5 s
+    assert seek_frame("nonsense", history.seek) is None
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtCore = pytest.importorskip("pyqtgraph.Qt.QtCore")
+
+from Utils.sharedmem_handler import ShmBatch
+from Utils.plot_proc_runner import ShmPlotPump, ShmReaderThread
+
+class Frame:
+    def __init__(self, number: int, tx: int = 0):
+        self.number = number
+        self.tx = tx
+
+class IdleSharedMem:
+    """Nothing to read, the reader thread ends right away and the test fills its queue"""
+    peer_closed = False
+
+    def check_buff_exists(self):
+        return False
+
+    def notify_fileno(self):
+        return None
+
+    def cleanup(self):
+        pass
+
+class TornSharedMem(IdleSharedMem):
+    """A mailbox whose first reads are torn by the producer, then has one record"""
+    def __init__(self, num_torn: int):
+        self.num_torn = num_torn
+        self.reads = 0
+
+    def check_buff_exists(self):
+        return self.reads <= self.num_torn
+
+    def check_data_ready(self):
+        return True
+
+    def read_objdata(self):
+        self.reads += 1
+        if self.reads <= self.num_torn:
+            raise RuntimeError("Mailbox slots overwritten faster than they can be read")
+        return Frame(self.reads)
+
+class RecordingPlotter:
+    paused = False
+
+    def __init__(self):
+        self.first_setup_dict = None
+        self.received = []
+
+    def receive_data(self, data):
+        if isinstance(data, list):
+            for item in data:
+                self.receive_data(item)
+            return
+        self.received.append(data)
+
+    def update(self):
+        pass
+
+@pytest.fixture(scope="module")
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+def make_pump(tmp_path, setup: dict) -> tuple[ShmPlotPump, RecordingPlotter]:
+    close_path = tmp_path / "running"
+    close_path.touch()
+    plotter = RecordingPlotter()
+    pump = ShmPlotPump(IdleSharedMem(), plotter, str(close_path), None)
+    pump.reader.thread.join(timeout=1)
+    pump.reader.records.put(setup)
+    return pump, plotter
+
+def fill_backlog(pump: ShmPlotPump, num_frames: int, batch_size: int = 4, num_tx: int = 1):
+    frames = [Frame(i, i % num_tx) for i in range(num_frames)]
+    for start in range(0, num_frames, batch_size):
+        pump.reader.records.put(ShmBatch(frames[start:start + batch_size]))
+
+def drain(pump: ShmPlotPump):
+    for _ in range(1000):
+        if pump.reader.records.empty():
+            return
+        pump.pump()
+    raise AssertionError("pump did not drain the queue")
+
+def test_playback_backlog_is_delivered_whole(app, tmp_path):
+    pump, plotter = make_pump(tmp_path, {"is_live": False})
+    fill_backlog(pump, 40)
+    drain(pump)
+    pump.stop()
+
+    assert plotter.received[0] == {"is_live": False}
+    assert [frame.number for frame in plotter.received[1:]] == list(range(40))
+    assert pump.frames_collapsed == 0
+
+def test_live_backlog_collapses_to_newest(app, tmp_path):
+    pump, plotter = make_pump(tmp_path, {"is_live": True})
+    pump.pump() # the setup alone, live from here on
+    fill_backlog(pump, 40)
+    drain(pump)
+    pump.stop()
+
+    assert plotter.received[0] == {"is_live": True}
+    assert [frame.number for frame in plotter.received[1:]] == [39]
+    assert pump.frames_collapsed == 39
+
+def test_live_backlog_collapses_per_key(app, tmp_path):
+    pump, plotter = make_pump(tmp_path, {"is_live": True})
+    plotter.collapse_key = lambda frame: frame.tx
+    pump.pump()
+    fill_backlog(pump, 40, num_tx=3)
+    drain(pump)
+    pump.stop()
+
+    # the newest frame of every TX, in arrival order
+    assert [(frame.number, frame.tx) for frame in plotter.received[1:]] == [(37, 1), (38, 2), (39, 0)]
+    assert pump.frames_collapsed == 37
+
+def test_reader_survives_torn_reads():
+    reader = ShmReaderThread(TornSharedMem(3), lambda: None)
+    reader.thread.join(timeout=1)
+
+    assert not reader.thread.is_alive()
+    assert reader.skipped_reads == 3
+    assert reader.records.get_nowait().number == 4
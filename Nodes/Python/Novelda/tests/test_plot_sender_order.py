@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import json
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from Utils.plot_node_base import PlotNodeBase
+
+RECEIVER = Path(__file__).resolve().parent / "shm_order_receiver.py"
+NUM_FRAMES = 6
+
+class OrderNode(PlotNodeBase):
+    shm_numblocks = 4
+    plot_sender_thread = True
+
+    def __init__(self, is_live: bool, live_needs_every_frame: bool = False):
+        self.is_live = is_live
+        self.live_needs_every_frame = live_needs_every_frame
+        self.prepare_plotting_process(str(RECEIVER), "shm_order_receiver:None")
+
+    def make_setup(self) -> dict:
+        return {"is_live": self.is_live}
+
+def wait_delivered(node: OrderNode, timeout: float = 10):
+    """Until the sender thread sent everything queued and the plotter read it"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # every buffer set but the one being filled is back once the sender is idle
+        idle = node.free_buffer_sets.qsize() == node.SENDER_QUEUE_DEPTH + 1
+        if idle and node.sharedmem_sender is not None and node.sharedmem_sender.are_all_read():
+            return
+        time.sleep(0.005)
+    raise TimeoutError("plotter did not read the frame")
+
+@pytest.mark.parametrize("is_live, every_frame", [(False, False), (True, False), (True, True)],
+                         ids=["playback", "live", "live_every_frame"])
+def test_setup_arrives_before_the_first_frame(is_live, every_frame, tmp_path, monkeypatch):
+    out_path = tmp_path / "received.json"
+    monkeypatch.setenv("X7_ORDER_OUT", str(out_path))
+
+    node = OrderNode(is_live, every_frame)
+
+    def run_flow():
+        for i in range(NUM_FRAMES):
+            node.send_data({"frame": i, "data": np.full(256, i, dtype=np.float32)})
+            if node.skips_frames():
+                wait_delivered(node) # the mailbox keeps only the latest, let the plotter read each
+        node.teardown()
+
+    # a deadlocked sender thread hangs the flow, fail instead of hanging the suite
+    flow = threading.Thread(target=run_flow, daemon=True)
+    flow.start()
+    flow.join(timeout=30)
+    assert not flow.is_alive(), "flow thread hung sending to the plotter"
+
+    assert not node.sender_thread.is_alive()
+    node.plotting_process.wait(timeout=10)
+    assert json.loads(out_path.read_text()) == ["SETUP", *range(NUM_FRAMES)]
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from Utils.sharedmem_handler import SharedMemBroadcastSender, open_shm_receiver
+
+@pytest.fixture
+def broadcast():
+    sender = SharedMemBroadcastSender(1 << 16, verbose=False)
+    receivers = []
+    def attach():
+        receiver = open_shm_receiver(sender.sharedmem.name, 0, 0)
+        receivers.append(receiver)
+        return receiver
+    yield sender, attach
+    for receiver in receivers:
+        receiver.cleanup()
+    sender.cleanup()
+
+def read_next(receiver, timeout=2.0):
+    deadline = time.time() + timeout
+    while not receiver.check_data_ready():
+        assert time.time() < deadline, "nothing to read"
+        receiver.wait_notify(0.05)
+    return receiver.read_objdata()
+
+def test_reader_attaches_to_idle_producer(broadcast):
+    sender, attach = broadcast
+
+    started = time.time()
+    receiver = attach() # the producer has not sent anything and is not sending
+    assert time.time() - started < 2
+
+    sender.accept_notify(timeout=2)
+    assert len(sender.reader_socks) == 1
+    assert sender.send_data_wait({"frame": 1}, timeout=2)
+    assert read_next(receiver) == {"frame": 1}
+
+def test_late_reader_gets_sticky_then_newest(broadcast):
+    sender, attach = broadcast
+    early = attach()
+    sender.accept_notify(timeout=2)
+    sender.set_sticky({"setup": 1})
+    for frame in range(3):
+        assert sender.send_data_wait({"frame": frame}, timeout=2)
+
+    late = attach()
+    deadline = time.time() + 2
+    while len(sender.reader_socks) < 2:
+        assert time.time() < deadline, "late reader never got a slot"
+        time.sleep(0.01)
+    assert sender.send_data_wait({"frame": 3}, timeout=2)
+
+    assert [read_next(early) for _ in range(5)] == [{"setup": 1}] + [{"frame": frame} for frame in range(4)]
+    # the sticky record first, then only what was sent after attaching
+    assert [read_next(late) for _ in range(2)] == [{"setup": 1}, {"frame": 3}]
+    assert not late.check_data_ready()
+
+def test_slow_reader_is_dropped_and_counts_skipped():
+    sender = SharedMemBroadcastSender(4096, verbose=False, drop_slow_readers=True)
+    receiver = open_shm_receiver(sender.sharedmem.name, 0, 0)
+    try:
+        sender.accept_notify(timeout=2)
+        payload = bytes(1000)
+        for frame in range(10):
+            assert sender.send_data({"frame": frame, "payload": payload})
+
+        # dropped while behind, picks up at the newest data and counts the rest
+        assert not receiver.check_data_ready()
+        assert sender.frames_skipped() == 10
+        assert sender.send_data({"frame": 10, "payload": payload})
+        assert read_next(receiver)["frame"] == 10
+    finally:
+        receiver.cleanup()
+        sender.cleanup()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from Utils.sharedmem_handler import (
+    SharedMemRingSender, SharedMemMailboxSender, ShmBatch, RecordTooLarge, open_shm_receiver,
+    MAILBOX_LATEST_WINS, MAILBOX_OVERWRITE_OLDEST,
+)
+
+@dataclass
+class Frame:
+    power: np.ndarray
+    bins: np.ndarray
+    seq_num: int
+
+def make_frame(seq_num: int, size: int = 200) -> Frame:
+    return Frame(power=np.arange(size, dtype=np.float32) + seq_num,
+                 bins=np.arange(size // 4, dtype=np.int16) - seq_num,
+                 seq_num=seq_num)
+
+def assert_same_frame(got: Frame, sent: Frame):
+    assert got.seq_num == sent.seq_num
+    for name in ("power", "bins"):
+        assert getattr(got, name).dtype == getattr(sent, name).dtype
+        np.testing.assert_array_equal(getattr(got, name), getattr(sent, name))
+
+@pytest.fixture
+def transport():
+    """(sender, receiver) for a sender made by the test, cleaned up after it"""
+    made = []
+    def attach(sender):
+        receiver = open_shm_receiver(sender.sharedmem.name, 0, 0)
+        made.append((sender, receiver))
+        return sender, receiver
+    yield attach
+    for sender, receiver in made:
+        receiver.cleanup()
+        sender.cleanup()
+
+@pytest.mark.parametrize("copy_arrays", [True, False])
+def test_ring_wraps_around_with_typed_arrays(transport, copy_arrays):
+    sender, receiver = transport(SharedMemRingSender(4096, verbose=False, typed_arrays=True))
+
+    # each record is about a quarter of the ring, so the head wraps several times
+    for seq_num in range(20):
+        frame = make_frame(seq_num)
+        assert sender.send_data(frame)
+        assert receiver.check_data_ready()
+        assert_same_frame(receiver.read_objdata(copy_arrays=copy_arrays), frame)
+        receiver.release_held_block()
+
+    assert sender.head > 4 * sender.capacity
+    assert sender.are_all_read()
+
+def test_ring_refuses_when_full_and_keeps_order(transport):
+    sender, receiver = transport(SharedMemRingSender(4096, verbose=False, typed_arrays=True))
+
+    sent = []
+    while sender.send_data(make_frame(len(sent))):
+        sent.append(make_frame(len(sent)))
+    assert len(sent) >= 2
+    assert sender.transport_stats.drops == {"full": 1}
+
+    for frame in sent:
+        assert_same_frame(receiver.read_objdata(), frame)
+    assert not receiver.check_data_ready()
+
+def test_mailbox_latest_wins_counts_skipped(transport):
+    sender, receiver = transport(SharedMemMailboxSender(4096, verbose=False, typed_arrays=True,
+                                                        policy=MAILBOX_LATEST_WINS))
+
+    for seq_num in range(5):
+        sender.send_data(make_frame(seq_num))
+    assert_same_frame(receiver.read_objdata(), make_frame(4))
+    assert not receiver.check_data_ready()
+
+    sender.send_data(make_frame(5))
+    assert_same_frame(receiver.read_objdata(), make_frame(5))
+    assert sender.frames_skipped() == 4
+    assert sender.are_all_read()
+
+def test_mailbox_overwrite_oldest_reads_in_order(transport):
+    sender, receiver = transport(SharedMemMailboxSender(4096, num_slots=3, verbose=False,
+                                                        policy=MAILBOX_OVERWRITE_OLDEST))
+
+    for seq_num in range(10):
+        sender.send_data({"seq_num": seq_num})
+
+    got = []
+    while receiver.check_data_ready():
+        got.append(receiver.read_objdata()["seq_num"])
+    # the slot after the newest may be written already, so only the newest two are safe
+    assert got == [8, 9]
+    assert sender.frames_skipped() == 8
+
+def test_batch_is_halved_until_it_fits(transport):
+    sender, receiver = transport(SharedMemRingSender(16384, verbose=False, typed_arrays=True))
+
+    # about 1.2 kB a frame, 8 of them are more than the 8 kB a ring record may take
+    frames = [make_frame(seq_num, size=256) for seq_num in range(8)]
+    assert sender.send_batch(frames)
+
+    records = []
+    while receiver.check_data_ready():
+        records.append(receiver.read_objdata())
+    assert all(type(record) is ShmBatch for record in records)
+    assert [len(record) for record in records] == [4, 4]
+    for got, sent in zip([item for record in records for item in record], frames):
+        assert_same_frame(got, sent)
+    assert "too_large" not in sender.transport_stats.drops
+
+def test_single_frame_too_large_is_counted(transport):
+    sender, _ = transport(SharedMemRingSender(4096, verbose=False, typed_arrays=True))
+
+    with pytest.raises(RecordTooLarge):
+        sender.send_batch([make_frame(0, size=4096)])
+    assert sender.transport_stats.drops == {"too_large": 1}